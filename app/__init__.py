@@ -22,17 +22,26 @@ def create_app():
     ):
         os.makedirs(app.config[key], exist_ok=True)
 
-    # ensure instance files exist
-    for key in ("PLOT_STATUS_FILE", "FILE_METADATA_FILE"):
-        open(app.config[key], "a").close()
+    # create metadata store (and migrate old metadata.json)
+    from .utils.metadata import init_metadata_store
+
+    init_metadata_store(app.config["METADATA_DB_FILE"], app.config["FILE_METADATA_FILE"])
 
     # import and register each route-module
     from .routes.upload import register_upload_routes
     from .routes.display import register_display_routes
     from .routes.plots import register_plots_routes
+    from .routes.tail import register_tail_routes
+    from .routes.metrics import register_metrics_routes
+
+    # first, so that its `after_request` hook runs last and times the whole request
+    register_metrics_routes(app)
 
     register_upload_routes(app)
     register_display_routes(app)
     register_plots_routes(app)
+    # the live tail log (if configured) is followed from the first `/tail/` request (see `get_log_tailer`), not here:
+    # every process creating the app (reloader parent, scripts, benchmarks) would start its own follower thread
+    register_tail_routes(app)
 
     return app
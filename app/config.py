@@ -11,7 +11,47 @@ class Config:
         self.PARSE_SCRIPT_PATH = os.path.join(base, "bash", "validate_parse.sh")
         self.FILTER_SCRIPT_PATH = os.path.join(base, "bash", "filter_by_date.sh")
 
+        # event templates (shared by the awk script and the python ingest engine)
+        self.TEMPLATE_RE_PATH = os.path.join(base, "bash", "template-data", "apache_re")
+        self.TEMPLATE_STR_PATH = os.path.join(base, "bash", "template-data", "apache_str")
+
+        # engine used to validate and parse uploads: "python" (in-process) or "awk" (`PARSE_SCRIPT_PATH`)
+        self.INGEST_ENGINE = "python"
+
+        # python engine splits logs of at least `INGEST_PARALLEL_MIN_SIZE` bytes over `INGEST_WORKERS` processes
+        self.INGEST_WORKERS = os.cpu_count() or 1
+        self.INGEST_PARALLEL_MIN_SIZE = 64 * 1024 * 1024
+
+        # python engine parses uploads while reading them instead of saving them first
+        self.INGEST_STREAMING = True
+
+        # engine used to filter by date range: "index" (binary search on timestamp index) or "awk" (`FILTER_SCRIPT_PATH`)
+        self.FILTER_ENGINE = "index"
+
+        # max. rows returned by one paged `/get_csv` request
+        self.CSV_PAGE_LIMIT = 10_000
+
+        # max. logs in one merged timeline (`/get_csv` and `/generate_plots/` with several log ids)
+        self.MERGE_MAX_LOGS = 32
+
+        # memory budget (bytes) for cached indexes, sort keys and sort/filter permutations of logs
+        self.VIEW_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
         self.ALLOWED_EXTENSIONS = {"log"}
+
+        # compressed uploads (see `LOG_COMPRESSIONS`) are decompressed while they are parsed, e.g. `access.log.gz`
+        self.ALLOWED_COMPRESSIONS = {"gz", "bz2", "xz"}
+
+        # `/get_csv` and `/download_csv` responses are gzip/deflate compressed (at zlib level `COMPRESS_LEVEL`)
+        # if the client accepts it, non-streamed ones only if at least `COMPRESS_MIN_SIZE` bytes
+        self.COMPRESS_LEVEL = 6
+        self.COMPRESS_MIN_SIZE = 1024
+
+        # seconds browsers and proxies may reuse csv and metadata responses before revalidating them (with their ETag)
+        self.DATA_CACHE_MAX_AGE = 0
+
+        # seconds plot files may be cached (plot file names are content-addressed, so they never change)
+        self.PLOT_CACHE_MAX_AGE = 365 * 24 * 60 * 60
         self.PLOT_TYPES = {
             "events_over_time",
             "level_distribution",
@@ -27,5 +67,43 @@ class Config:
             "E6",
         }
 
-        self.PLOT_STATUS_FILE = os.path.join(self.INSTANCE_FOLDER, "status.json")
+        # plot jobs: worker threads, max. jobs queued or running (more get HTTP 429),
+        # seconds a queued job may go unpolled before it is cancelled, seconds finished job records are kept
+        self.PLOT_WORKERS = 2
+        self.PLOT_QUEUE_MAX = 16
+        self.PLOT_JOB_STALE_SECONDS = 30
+        self.PLOT_JOB_TTL = 60 * 60
+
+        # `events_over_time` picks the smallest time bin giving at most `PLOT_TARGET_BINS` points,
+        # user chosen bins giving more than `PLOT_MAX_BINS` points are refused
+        self.PLOT_TARGET_BINS = 1_000
+        self.PLOT_MAX_BINS = 100_000
+
+        # custom plot code runs in `CUSTOM_PLOT_WORKERS` separate processes, killed after `CUSTOM_PLOT_TIMEOUT` seconds,
+        # with at most `CUSTOM_PLOT_MEMORY_LIMIT` bytes of address space each (0 for no limit)
+        self.CUSTOM_PLOT_WORKERS = 2
+        self.CUSTOM_PLOT_TIMEOUT = 30
+        self.CUSTOM_PLOT_MEMORY_LIMIT = 4 * 1024 * 1024 * 1024
+
+        # disk budget (bytes) for cached plot files in `PLOT_FOLDER`, least recently used are evicted
+        self.PLOT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+        # live tail: log file followed like `tail -F` (from env var `TAIL_LOG_PATH`, no tail if unset), checked every
+        # `TAIL_POLL_INTERVAL` seconds and read `TAIL_BATCH_BYTES` at a time, starting with its last `TAIL_START_BYTES`
+        self.TAIL_LOG_PATH = os.environ.get("TAIL_LOG_PATH")
+        self.TAIL_POLL_INTERVAL = 1.0
+        self.TAIL_BATCH_BYTES = 64 * 1024
+        self.TAIL_START_BYTES = 1024 * 1024
+
+        # live tail keeps its latest `TAIL_MAX_ROWS` rows, and rows per minute of its latest `TAIL_WINDOW_MINUTES` minutes
+        self.TAIL_MAX_ROWS = 10_000
+        self.TAIL_WINDOW_MINUTES = 60
+
+        # add the timing breakdown of each request (`Server-Timing` header) to every response,
+        # not only to those asking for it (with an `X-Debug-Timing` header or `debug_timing` arg)
+        self.SERVER_TIMING = False
+
+        self.METADATA_DB_FILE = os.path.join(self.INSTANCE_FOLDER, "metadata.db")
+
+        # old json metadata store, migrated into `METADATA_DB_FILE` on startup if present
         self.FILE_METADATA_FILE = os.path.join(self.INSTANCE_FOLDER, "metadata.json")
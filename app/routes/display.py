@@ -1,6 +1,30 @@
-from flask import render_template, request, jsonify, Flask, send_from_directory
-from app.utils import get_processed_files, get_csv_data, parse_csv_request, get_csv_metadata
-
+from flask import render_template, request, jsonify, Flask, Response, stream_with_context
+from app.utils import (
+    get_processed_files,
+    get_view_rows,
+    iter_view_csv,
+    get_csv_page,
+    parse_csv_request,
+    parse_page_opts,
+    get_csv_metadata,
+    get_raw_log_fpath,
+    parse_log_ids,
+    parse_merged_sort_opts,
+    parse_search_query,
+    parse_facet_opts,
+    get_merged_page,
+    compress_response,
+    make_etag,
+    csv_validators,
+    is_not_modified,
+    set_cache_headers,
+    not_modified_response,
+    span,
+    count_rows,
+)
+from datetime import datetime, timezone
+
+from urllib.parse import quote
 import os
 
 def register_display_routes(app: Flask):
@@ -8,37 +32,81 @@ def register_display_routes(app: Flask):
     def display_page():
         """Serves the page to display processed logs."""
         available_files = get_processed_files()
-        return render_template("display.html", available_files=available_files)
+        return render_template(
+            "display.html", available_files=available_files, tail_enabled=bool(app.config["TAIL_LOG_PATH"])
+        )
 
 
     @app.route("/get_csv/<log_id>")
     def get_csv(log_id):
-        """Endpoint for serving CSV data for table on display page."""
+        """Endpoint for serving CSV data for table on display page.
+
+        Optional `offset` and `limit` args select a page of rows, the response has the `total` number of rows.
+        Optional `search` arg keeps only rows whose `Content` matches the search query (see `parse_search_query`),
+        optional `level` and `event` args (','-separated) only rows with those levels and EventIds (see `parse_facet_opts`).
+
+        `log_id` may be several ','-separated log ids, for the merged timeline of those logs in time order,
+        with a `Source` column (see `get_merged_page`), served `CSV_PAGE_LIMIT` rows at most per page."""
         try:
-            csv_fpath, sort_opts, filter_opts = parse_csv_request(log_id, request)
+            log_ids = parse_log_ids(log_id)
+        except ValueError as e:
+            # error is bad request
+            return jsonify({"error": f"{e}"}), 400
+
+        try:
+            csv_fpaths = [parse_csv_request(i, request)[0] for i in log_ids]
+            _, sort_opts, filter_opts = parse_csv_request(log_ids[0], request)
         except Exception as e:
             # error is FileNotFound
             return jsonify({"error": f"{e}"}), 404
 
-        # get csv data as response
+        merged = len(log_ids) > 1
+
+        search = request.args.get("search", "").strip() or None
+
         try:
-            response = jsonify(
-                get_csv_data(csv_fpath, sort_opts, filter_opts, for_download=False)
-            )
+            offset, limit = parse_page_opts(request)
+            parse_search_query(search)
+            facets = parse_facet_opts(request.args.get("level"), request.args.get("event"))
+            if merged and search:
+                raise ValueError("Search is not supported for merged logs.")
+            if merged:
+                parse_merged_sort_opts(sort_opts)
+                # keep memory of merged requests bounded by the page size
+                if limit is None:
+                    limit = app.config["CSV_PAGE_LIMIT"]
+        except ValueError as e:
+            # error is bad request
+            return jsonify({"error": f"{e}"}), 400
+
+        # answer repeated requests without reading the csv
+        etag, last_modified = csv_validators(csv_fpaths if merged else csv_fpaths[0], "get_csv")
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified, vary_encoding=True)
+
+        # get (page of) csv data as response
+        try:
+            if merged:
+                page = get_merged_page(csv_fpaths, log_ids, filter_opts, offset, limit, facets)
+            else:
+                page = get_csv_page(csv_fpaths[0], sort_opts, filter_opts, offset, limit, search, facets)
+            with span("json_serialize"):
+                response = jsonify(page)
+            count_rows("json_serialize", len(page["data"]))
         except Exception as e:
             # error is server error
             return jsonify({"error": f"{e}"}), 500
 
-        return response
+        # gzip/deflate if accepted by the client
+        return set_cache_headers(compress_response(response), etag, last_modified)
 
 
     @app.route("/get_metadata/<log_id>")
     def serve_metadata(log_id):
         """Endpoint for serving metadata for given log id."""
-        log_fpath = os.path.join(app.config["UPLOAD_FOLDER"], f"{log_id}.log")
         csv_fpath = os.path.join(app.config["PROCESSED_FOLDER"], f"{log_id}.csv")
 
-        if not os.path.exists(log_fpath):
+        if get_raw_log_fpath(log_id) is None:
             return jsonify({"error": f"log file with id {log_id} does not exist."}), 404
 
         if not os.path.exists(csv_fpath):
@@ -46,12 +114,17 @@ def register_display_routes(app: Flask):
 
         # get metadata as response
         try:
-            response = jsonify(get_csv_metadata(log_id))
+            md = get_csv_metadata(log_id)
         except Exception as e:
             # error is server error
             return jsonify({"error": f"{e}"}), 500
 
-        return response
+        etag = make_etag("get_metadata", md)
+        last_modified = datetime.fromtimestamp(int(os.path.getmtime(csv_fpath)), tz=timezone.utc)
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+        return set_cache_headers(jsonify(md), etag, last_modified)
 
 
     @app.route("/download_csv/<log_id>")
@@ -78,24 +151,35 @@ def register_display_routes(app: Flask):
             # error is FileNotFound
             return jsonify({"error": f"{e}"}), 404
 
-        # get csv fpath
+        # only rows matching `search`, with levels and events in `level`, `event` (see `get_csv`)
+        search = request.args.get("search", "").strip() or None
+        try:
+            parse_search_query(search)
+            facets = parse_facet_opts(request.args.get("level"), request.args.get("event"))
+        except ValueError as e:
+            # error is bad request
+            return jsonify({"error": f"{e}"}), 400
+
+        # answer repeated requests without reading the csv
+        etag, last_modified = csv_validators(csv_fpath, "download_csv")
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified, vary_encoding=True)
+
+        # get view (before streaming starts, so errors can still be reported)
         try:
-            fpath = get_csv_data(csv_fpath, sort_opts, filter_opts, for_download=True)
+            log, perm = get_view_rows(csv_fpath, sort_opts, filter_opts, search, facets)
         except Exception as e:
             # error is server error
             return jsonify({"error": f"{e}"}), 500
 
-        fname = os.path.split(fpath)[1]
-
-        try:
-            # https://flask.palletsprojects.com/en/stable/api/#flask.send_from_directory
-            # using `send_from_directory` for safety
-            return send_from_directory(
-                app.config["PROCESSED_FOLDER"],
-                fname,
-                as_attachment=True,
-                download_name=download_filename,
+        # stream csv of the view a chunk of rows at a time (compressed while streaming if accepted by the client)
+        response = compress_response(
+            Response(
+                stream_with_context(iter_view_csv(log, perm)),
+                mimetype="text/csv",
+                headers={
+                    "Content-Disposition": f"attachment; filename*=UTF-8''{quote(download_filename)}"
+                },
             )
-        except Exception as e:
-            return jsonify({"error": f"Processed CSV file not found."}), 500
-
+        )
+        return set_cache_headers(response, etag, last_modified)
@@ -0,0 +1,53 @@
+from flask import request, g, Flask
+from app.utils import get_metrics, request_timings
+
+import time
+
+
+def register_metrics_routes(app: Flask):
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        """Record the latency of the request per route (streamed responses once they are sent in full),
+        and add its timing breakdown as `Server-Timing` header if asked for (`X-Debug-Timing` header or `debug_timing` arg)
+        or `SERVER_TIMING` is set."""
+
+        start = g.get("request_start")
+        if start is None:
+            return response
+
+        # route pattern (not the path), so the number of label values stays bounded
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        labels = {"route": route, "method": request.method, "status": f"{response.status_code}"}
+
+        def observe():
+            get_metrics().observe("log_analyzer_request_duration_seconds", time.perf_counter() - start, **labels)
+
+        # streamed responses are timed once they are sent in full
+        if response.is_streamed:
+            response.call_on_close(observe)
+        else:
+            observe()
+
+        if app.config["SERVER_TIMING"] or request.headers.get("X-Debug-Timing") or request.args.get("debug_timing"):
+            # e.g. `csv_parse;dur=12.5;desc="1 span", sort;dur=3.1;desc="1 span", total;dur=20.2`
+            timings = [
+                f'{stage};dur={total * 1000:.3f};desc="{n} span{"s" if n > 1 else ""}"'
+                for stage, (total, n) in request_timings().items()
+            ]
+            timings.append(f"total;dur={(time.perf_counter() - start) * 1000:.3f}")
+            response.headers["Server-Timing"] = ", ".join(timings)
+
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        """Endpoint for all metrics (request latencies per route, stage durations, rows and bytes processed)
+        in the Prometheus text format."""
+        response = app.response_class(get_metrics().render(), mimetype="text/plain")
+        response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+        response.cache_control.no_store = True
+        return response
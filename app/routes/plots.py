@@ -1,37 +1,67 @@
 from flask import render_template, request, jsonify, Flask, send_from_directory
 from app.utils import (
     get_processed_files,
-    get_csv_data,
+    get_view_columns,
     parse_csv_request,
     get_csv_metadata,
     parse_opts,
     generate_plots,
+    get_plot_queue,
+    QueueFull,
+    get_plot_cache,
+    plot_cache_key,
+    plot_style_settings,
+    TIME_BINS,
+    needs_rows,
+    load_log_summary,
+    validate_datetime_str,
+    seconds_from_datetime_str,
+    filter_csv_positions,
+    get_custom_plot_pool,
+    parse_log_ids,
+    get_merged_columns,
+    get_merged_positions,
+    parse_facet_opts,
+    select_positions,
+    load_bitmaps,
+    load_index,
 )
 
-import os, json
-from threading import Thread
-
 
 def register_plots_routes(app: Flask):
-    PLOT_STATUS_FILE = app.config["PLOT_STATUS_FILE"]
     PLOT_TYPES = app.config["PLOT_TYPES"]
 
+    def queue_full_response(message):
+        """Response for plot requests rejected because the job queue is full (error is too many requests)."""
+        response = jsonify({"error": message})
+        response.headers["Retry-After"] = "5"
+        return response, 429
+
     @app.route("/plots")
     def plots_page():
         """Serves the page for generating plots."""
+        # start custom plot workers early, so they are warm by the time code is submitted
+        get_custom_plot_pool()
+
         available_files = get_processed_files()
-        return render_template("plots.html", available_files=available_files)
+        return render_template(
+            "plots.html", available_files=available_files, tail_enabled=bool(app.config["TAIL_LOG_PATH"])
+        )
 
     @app.route("/generate_plots/", methods=["POST"])
     def handle_generate():
-        """Endpoint for generating plots. Returns response containing name of file to query for status."""
+        """Endpoint for generating plots. Queues a plot job and returns response containing its `job_id` to query for status.
+
+        `log_id` may be several log ids (list or ','-separated), to plot the merged timeline of those logs (see `get_merged_columns`).
+        Optional `level` and `event` (list or ','-separated) plot only rows with those levels and EventIds (see `parse_facet_opts`)."""
 
         ### process request
         data = request.get_json()
-        log_id = data.get("log_id")  # str
+        log_id = data.get("log_id")  # str | list
         plot_opts = data.get("plot_options")  # list -> set (later)
         filter_opts = data.get("filter_options")  # str
         custom_code = data.get("custom_code")  # str
+        bin_size = data.get("bin_size") or "auto"  # str
 
         print(
             f"received request with\n\tlog_id: {log_id}\n\tplot_opts: {plot_opts}\n\tfilter_opts: {filter_opts}"
@@ -46,71 +76,191 @@ def register_plots_routes(app: Flask):
             # error is bad request
             return jsonify({"error": f"{e}"}), 400
 
-        ### get csv data for plotting
+        ### check `bin_size` validity
+        if bin_size != "auto" and bin_size not in TIME_BINS:
+            return jsonify({"error": f"invalid bin size {bin_size}"}), 400
+
+        # basic check on custom code
+        if "custom" in plot_opts and not custom_code:
+            return jsonify({"error": "Custom code not provided."}), 400
+
+        if custom_code and len(custom_code) > 10_000:
+            return (
+                jsonify(
+                    {"error": "Custom code too long (must be less than 10,000 chars)."}
+                ),
+                400,
+            )
+
+        ### parse request for log ids, csv and filter
+        try:
+            log_ids = parse_log_ids(log_id)
+            facets = parse_facet_opts(data.get("level"), data.get("event"))
+        except ValueError as e:
+            # error is bad request
+            return jsonify({"error": f"{e}"}), 400
+
+        merged = len(log_ids) > 1
+
         try:
             # only `csv_fpath` can be extracted here
-            csv_fpath, _, _ = parse_csv_request(log_id, request)
+            csv_fpaths = [parse_csv_request(i, request)[0] for i in log_ids]
+            csv_fpath = csv_fpaths if merged else csv_fpaths[0]
             # `filter_opts` to be parsed here
             filter_opts = parse_opts(filter_opts)
         except Exception as e:
             # error is FileNotFound
             return jsonify({"error": f"{e}"}), 404
 
+        # precomputed aggregates of the log (merged timelines are always plotted from rows)
+        summary = None
+        if not merged:
+            try:
+                summary = load_log_summary(csv_fpath)
+            except Exception as e:
+                # error is server error
+                return jsonify({"error": f"{e}"}), 500
+
+        # a filter covering the whole log (the default on the plots page) filters nothing
+        if (
+            summary is not None
+            and filter_opts
+            and summary["rows"]
+            and validate_datetime_str(filter_opts[0])
+            and validate_datetime_str(filter_opts[1])
+            and seconds_from_datetime_str(filter_opts[0]) <= summary["start_seconds"]
+            and seconds_from_datetime_str(filter_opts[1]) >= summary["end_seconds"]
+        ):
+            filter_opts = None
+
+        ### generate plot file names here itself as `{plot_type}: {log_id}_{plot_type}_{key}.png` (`merged` as `log_id` for merged logs)
+        # where `key` is content-addressed (see `plot_cache_key`), so unchanged plots are served from the plot cache
         try:
-            data = get_csv_data(csv_fpath, None, filter_opts, for_download=False)
-            # data_df = pd.DataFrame(data=data["data"], columns=data["header"])
+            plot_files = {}
+            for p in plot_opts:
+                style = plot_style_settings()
+                if p == "events_over_time":
+                    style["bin_size"] = bin_size
+                if merged:
+                    # values of the `Source` column
+                    style["sources"] = log_ids
 
+                key = plot_cache_key(csv_fpath, p, filter_opts, style, custom_code, facets)
+                plot_files[p] = f"{'merged' if merged else log_ids[0]}_{p}_{key}.png"
         except Exception as e:
             # error is server error
             return jsonify({"error": f"{e}"}), 500
 
-        # basic check on custom code
-        if "custom" in plot_opts and not custom_code:
-            return jsonify({"error": "Custom code not provided."}), 400
+        plot_cache = get_plot_cache()
+        missing = {p for p in plot_opts if not plot_cache.get(plot_files[p])}
 
-        if custom_code and len(custom_code) > 10_000:
-            return (
-                jsonify(
-                    {"error": "Custom code too long (must be less than 10,000 chars)."}
-                ),
-                400,
-            )
+        # everything cached, nothing to generate
+        if not missing:
+            return jsonify({"status": "done", "plot_files": plot_files, "error": ""})
 
-        ### generate plot file names here itself as `{plot_type}: {log_id}_{plot_type}.png`
-        plot_files = {p: f"{log_id}_{p}.png" for p in plot_opts}
+        # reject early if queue is full, before loading any data
+        if get_plot_queue().full():
+            return queue_full_response("Too many plot jobs in queue, try again later.")
 
-        ### spawn thread for generating plot
-        # ref: https://docs.python.org/3/library/threading.html#threading.Thread
-        Thread(
-            target=generate_plots,
-            args=(app, data["data"], plot_opts, plot_files, custom_code),
-        ).start()
+        ### get csv data for plotting (only if the summary is not enough)
+        columns = None
+        if merged and missing - {"custom"}:
+            try:
+                columns = get_merged_columns(csv_fpaths, log_ids, filter_opts, facets)["columns"]
+            except Exception as e:
+                # error is server error
+                return jsonify({"error": f"{e}"}), 500
+        elif not merged and (
+            filter_opts
+            or facets
+            or needs_rows(summary, missing, bin_size, app.config["PLOT_TARGET_BINS"])
+        ):
+            try:
+                columns = get_view_columns(csv_fpath, None, filter_opts, facets)["columns"]
 
-        ### return response containing file containing the status
-        return jsonify({"status_file": PLOT_STATUS_FILE})
+            except Exception as e:
+                # error is server error
+                return jsonify({"error": f"{e}"}), 500
 
-    @app.route("/status")
-    def get_status():
+        # an empty selection (e.g. levels without any of the chosen events) is valid, but has nothing to plot
+        if columns is not None and len(columns[0]) == 0:
+            return jsonify({"error": "No log entries match the selected filters, nothing to plot."}), 400
+
+        # custom plots only need positions of the rows, the workers read the csvs themselves
+        custom_data = None
+        if "custom" in missing:
+            try:
+                if merged:
+                    custom_data = get_merged_positions(csv_fpaths, log_ids, filter_opts, facets)
+                elif facets:
+                    rows = select_positions(csv_fpath, filter_opts, facets, load_bitmaps(csv_fpath), load_index(csv_fpath))
+                    custom_data = [(None, csv_fpath, rows)]
+                else:
+                    rows = filter_csv_positions(csv_fpath, filter_opts, load_index(csv_fpath))[0] if filter_opts else None
+                    custom_data = [(None, csv_fpath, rows)]
+            except Exception as e:
+                # error is server error
+                return jsonify({"error": f"Error filtering CSV {csv_fpath}: {e}"}), 500
+
+        ### queue plot job for plots not in cache
         try:
-            if os.path.getsize(PLOT_STATUS_FILE) > 0:
-                with open(PLOT_STATUS_FILE, "r") as f:
-                    return jsonify(json.load(f))
-            else:
-                return jsonify({"status": "idle"})
-        except Exception as e:
+            job_id = get_plot_queue().submit(
+                generate_plots,
+                app,
+                columns,
+                missing,
+                plot_files,
+                custom_code,
+                bin_size,
+                summary,
+                custom_data,
+                plot_files=dict(plot_files),
+            )
+        except QueueFull as e:
+            return queue_full_response(f"{e}")
+
+        ### return response containing id of the job to query status of
+        return jsonify({"job_id": job_id})
+
+    @app.route("/plot_cache_stats")
+    def plot_cache_stats():
+        """Endpoint for plot cache size and hit/miss counters."""
+        return jsonify(get_plot_cache().stats())
+
+    @app.route("/status/<job_id>")
+    def get_status(job_id):
+        """Endpoint for status of plot job `job_id` (see `PlotJobQueue.get`)."""
+        status = get_plot_queue().get(job_id)
+        if status is None:
             return (
-                jsonify({"status": "error", "message": "Status file unreadable."}),
-                500,
+                jsonify({"status": "error", "error": f"Plot job {job_id} not found."}),
+                404,
             )
 
+        return jsonify(status)
+
+    @app.route("/cancel/<job_id>", methods=["POST"])
+    def cancel_job(job_id):
+        """Endpoint for cancelling plot job `job_id`."""
+        if not get_plot_queue().cancel(job_id):
+            return jsonify({"error": f"Plot job {job_id} not found."}), 404
+
+        return jsonify(get_plot_queue().get(job_id))
+
     @app.route("/get_plot/<plot>")
     def get_plot(plot):
         """Endpoint for serving plot files"""
         try:
-            return send_from_directory(
+            # plot file names are content-addressed (see `plot_cache_key`), so the name is a strong ETag
+            # and the file can be cached for good
+            response = send_from_directory(
                 app.config["PLOT_FOLDER"],
                 plot,
+                etag=plot.rsplit(".", 1)[0],
+                max_age=app.config["PLOT_CACHE_MAX_AGE"],
             )
+            response.cache_control.immutable = True
+            return response
         except Exception as e:
             return jsonify({"error": f"Plot file {plot} not found."}), 500
 
@@ -118,7 +268,8 @@ def register_plots_routes(app: Flask):
     def download_plot(plot):
         """Endpoint for serving plot files for download"""
 
-        log_id, plot_type_w_ext = plot.split("_", maxsplit=1)[:]
+        # plot files are named `{log_id}_{plot_type}_{key}.png`
+        log_id, plot_type = plot.rsplit("_", maxsplit=1)[0].split("_", maxsplit=1)
 
         # retrieve original filename for download suggestion
         original_name = "download"  # default
@@ -132,7 +283,7 @@ def register_plots_routes(app: Flask):
 
         original_name = original_name.rsplit(".", 1)[0]  # remove ext
 
-        download_filename = f"{original_name}_{plot_type_w_ext}"
+        download_filename = f"{original_name}_{plot_type}.png"
 
         try:
             return send_from_directory(
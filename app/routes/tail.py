@@ -0,0 +1,65 @@
+from flask import request, jsonify, Flask
+from app.utils import get_log_tailer, timestamps_from_seconds, CSV_HEADER
+
+
+def register_tail_routes(app: Flask):
+    def tail_response(payload):
+        """JSON response of the live tail, never cached (it changes with every batch)."""
+        response = jsonify(payload)
+        response.cache_control.no_store = True
+        return response
+
+    def no_tail_response():
+        return jsonify({"error": "Live tail is not enabled (set TAIL_LOG_PATH)."}), 404
+
+    @app.route("/tail/status")
+    def tail_status():
+        """Endpoint for the state of the live tail of `TAIL_LOG_PATH` (see `LogTailer.status`)."""
+        tailer = get_log_tailer()
+        if tailer is None:
+            return no_tail_response()
+
+        return tail_response(tailer.status())
+
+    @app.route("/tail/rows")
+    def tail_rows():
+        """Endpoint for the latest rows of the live tail (see `LogTailer.rows`), oldest first.
+
+        Optional `since` (a LineId) returns only rows after it, `limit` returns at most that many (latest) rows
+        (capped at `TAIL_MAX_ROWS`). The response has `last_id`, to pass as `since` on the next request."""
+
+        tailer = get_log_tailer()
+        if tailer is None:
+            return no_tail_response()
+
+        try:
+            since = int(request.args.get("since", "") or 0)
+            limit = request.args.get("limit", "")
+            limit = min(int(limit), app.config["TAIL_MAX_ROWS"]) if limit else None
+            if since < 0 or (limit is not None and limit < 0):
+                raise ValueError("since and limit must be non-negative.")
+        except ValueError as e:
+            return jsonify({"error": f"Invalid tail options: {e}"}), 400
+
+        rows, last_id = tailer.rows(since, limit)
+
+        return tail_response({"header": CSV_HEADER, "data": rows, "last_id": last_id})
+
+    @app.route("/tail/events")
+    def tail_events():
+        """Endpoint for the rows per minute of the rolling window of the live tail (see `LogTailer.events`),
+        as `times` (YYYY-mm-DD HH:MM:SS, start of each minute) and `counts`."""
+
+        tailer = get_log_tailer()
+        if tailer is None:
+            return no_tail_response()
+
+        minutes, counts = tailer.events()
+
+        return tail_response(
+            {
+                "times": timestamps_from_seconds(minutes).tolist(),
+                "counts": counts,
+                "window_minutes": app.config["TAIL_WINDOW_MINUTES"],
+            }
+        )
@@ -1,13 +1,14 @@
 from flask import render_template, request, jsonify, Flask
-from app.utils import validate_filename, get_csv_timestamps, get_processed_files
+from app.utils import validate_filename, split_compression, DecompressedStream, build_log_summary, get_processed_files, get_raw_log_fpath, append_log, ingest_log, ingest_stream, build_log_indexes, set_csv_metadata, span, count_rows, count_bytes
 
 from time import time
-import os, subprocess, random, json
+import os, subprocess, random, shutil
 
 
 def register_upload_routes(app: Flask):
     PARSE_SCRIPT_PATH = app.config["PARSE_SCRIPT_PATH"]
-    FILE_METADATA_FILE = app.config["FILE_METADATA_FILE"]
+    INGEST_ENGINE = app.config["INGEST_ENGINE"]
+    INGEST_STREAMING = app.config["INGEST_STREAMING"]
 
     @app.route("/")
     @app.route("/upload")
@@ -40,62 +41,115 @@ def register_upload_routes(app: Flask):
             # log_id = str(uuid.uuid4())
             log_id = str(time() * 10**6)[:15] + f"{(random.random()):0.5f}"[2:]
 
+            # compressed logs (e.g. `.log.gz`) are decompressed while they are parsed
+            _, compression = split_compression(original_filename)
+
+            # raw copy is kept as uploaded (compressed) by the python engine, awk needs it decompressed
             log_filename = f"{log_id}.log"
+            if compression is not None and INGEST_ENGINE != "awk":
+                log_filename += f".{compression}"
             csv_filename = f"{log_id}.csv"
 
             log_filepath = os.path.join(app.config["UPLOAD_FOLDER"], log_filename)
             csv_filepath = os.path.join(app.config["PROCESSED_FOLDER"], csv_filename)
 
-            try:
-                file.save(log_filepath)
-
-                # run bash script with proper args
-                print(f"Running script: {PARSE_SCRIPT_PATH} {log_filepath} {csv_filepath}")
-                result = subprocess.run(
-                    [PARSE_SCRIPT_PATH, log_filepath, csv_filepath],
-                    capture_output=True,
-                    text=True,
-                    check=False,
-                )
-
-                if result.returncode == 0:
-                    print(f"SUCCESS stdout:\n{result.stdout}")
-                    print(f"SUCCESS stderr:\n{result.stderr}")
+            # stats of the python engine (`None` for the awk script)
+            stats = None
 
-                    # if validation and processing completed, add metadata entry
+            # streaming is single-core, so uploads large enough for parallel ingest are saved first
+            # (compressed uploads can not be split for parallel ingest, so they are always streamed)
+            stream_upload = compression is not None or INGEST_STREAMING and not (
+                app.config["INGEST_WORKERS"] > 1
+                and (request.content_length or 0) >= app.config["INGEST_PARALLEL_MIN_SIZE"]
+            )
 
-                    # check if file non-empty
-                    if os.path.getsize(FILE_METADATA_FILE) > 0:
+            try:
+                if INGEST_ENGINE == "awk":
+                    if compression is None:
+                        with span("save"):
+                            file.save(log_filepath)
+                    else:
+                        # awk script reads (and edits) the log file, so it is saved decompressed
                         try:
-                            with open(FILE_METADATA_FILE, "r") as f:
-                                old_md = json.load(f)
-                        except Exception as e:
-                            raise Exception(
-                                f"Could not read (metadata file) {FILE_METADATA_FILE}: {e}"
+                            with open(log_filepath, "wb") as log_f, span("save"):
+                                shutil.copyfileobj(DecompressedStream(file.stream, compression), log_f)
+                        except ValueError as e:
+                            # error is invalid compressed data
+                            return (
+                                jsonify(
+                                    {
+                                        "success": False,
+                                        "message": f"{e}",
+                                        "log_id": log_id,
+                                        "filename": original_filename,
+                                    }
+                                ),
+                                400,
                             )
-                    else:
-                        old_md = {}
-
-                    # add entry for newly processed file
-                    start, end = get_csv_timestamps(csv_filepath)
 
-                    new_md_entry = {
-                        log_id: {
-                            "original_name": original_filename,
-                            "start_timestamp": start,
-                            "end_timestamp": end,
-                        }
-                    }
+                    # run bash script with proper args
+                    print(f"Running script: {PARSE_SCRIPT_PATH} {log_filepath} {csv_filepath}")
+                    with span("validate_parse"):
+                        result = subprocess.run(
+                            [PARSE_SCRIPT_PATH, log_filepath, csv_filepath],
+                            capture_output=True,
+                            text=True,
+                            check=False,
+                        )
 
-                    old_md.update(new_md_entry)
+                    success = result.returncode == 0
+                    if success:
+                        print(f"SUCCESS stdout:\n{result.stdout}")
+                        print(f"SUCCESS stderr:\n{result.stderr}")
+                    else:
+                        print(f"FAILURE stdout: {result.stdout}")
+                        print(f"FAILURE stderr (code {result.returncode}): {result.stderr}")
 
+                    # create error message from stderr if possible
+                    error_message = (
+                        result.stderr.strip().split("\n")[-1]
+                        if result.stderr
+                        else "Validation failed."
+                    )
+                else:
+                    # validate and parse in-process
+                    print(f"Ingesting: {log_filepath} -> {csv_filepath}")
                     try:
-                        with open(FILE_METADATA_FILE, "w") as f:
-                            json.dump(old_md, f)
-                    except Exception as e:
-                        raise Exception(
-                            f"Could not write file metadata to {FILE_METADATA_FILE}: {e}"
-                        )
+                        if stream_upload:
+                            # parse while reading the upload, raw copy is written in the same pass (no separate save)
+                            with span("validate_parse"):
+                                stats = ingest_stream(file.stream, log_filepath, csv_filepath, compression)
+                        else:
+                            with span("save"):
+                                file.save(log_filepath)
+                            with span("validate_parse"):
+                                stats = ingest_log(log_filepath, csv_filepath)
+                        print(f"SUCCESS: {stats}")
+                        success, error_message = True, None
+                    except ValueError as e:
+                        print(f"FAILURE: {e}")
+                        success, error_message = False, f"{e}"
+
+                if success:
+                    # if validation and processing completed, add metadata entry
+                    if stats is None:
+                        # awk script writes no summary, build it from the csv
+                        summary = build_log_summary(csv_filepath)
+                        start, end = summary["start_timestamp"], summary["end_timestamp"]
+                        count_rows("ingest", summary["rows"])
+                    elif stats["start_timestamp"] is None:
+                        raise Exception(f"No log entries found in {original_filename}")
+                    else:
+                        start, end = stats["start_timestamp"], stats["end_timestamp"]
+                        count_rows("ingest", stats["valid"])
+                    count_bytes("ingest", os.path.getsize(log_filepath))
+
+                    # build timestamp index for date range filtering, inverted index for search
+                    # and bitmap index for level/event filtering, in one pass over the csv
+                    with span("index"):
+                        build_log_indexes(csv_filepath)
+
+                    set_csv_metadata(log_id, original_filename, start, end)
 
                     # return data in case of success
                     return jsonify(
@@ -107,9 +161,6 @@ def register_upload_routes(app: Flask):
                         }
                     )
                 else:
-                    print(f"FAILURE stdout: {result.stdout}")
-                    print(f"FAILURE stderr (code {result.returncode}): {result.stderr}")
-
                     # cleanup if validation failed
                     if os.path.exists(csv_filepath):
                         os.remove(csv_filepath)
@@ -119,13 +170,6 @@ def register_upload_routes(app: Flask):
                     # if os.path.exists(log_filepath):
                     #     os.remove(log_filepath)
 
-                    # create error message from stderr if possible
-                    error_message = (
-                        result.stderr.strip().split("\n")[-1]
-                        if result.stderr
-                        else "Validation failed."
-                    )
-
                     # return response in case of failure
                     return (
                         jsonify(
@@ -156,9 +200,61 @@ def register_upload_routes(app: Flask):
                 jsonify(
                     {
                         "success": False,
-                        "message": "Invalid file type. Only .log files allowed",
+                        "message": "Invalid file type. Only .log files (optionally .gz, .bz2 or .xz compressed) allowed",
+                    }
+                ),
+                400,
+            )
+
+
+    @app.route("/append/<log_id>", methods=["POST"])
+    def handle_append(log_id):
+        """Handles appending the new lines of a growing log (`log_file`, only the lines added since it was uploaded
+        or last appended to, optionally compressed) to the existing log `log_id` (see `append_log`)."""
+        # error handling
+        if "log_file" not in request.files:
+            return jsonify({"success": False, "message": "No file part in request"}), 400
+
+        file = request.files["log_file"]
+
+        if file.filename == "" or not validate_filename(file.filename):
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "Invalid file type. Only .log files (optionally .gz, .bz2 or .xz compressed) allowed",
                     }
                 ),
                 400,
             )
 
+        csv_filepath = os.path.join(app.config["PROCESSED_FOLDER"], f"{log_id}.csv")
+        log_filepath = get_raw_log_fpath(log_id)
+
+        if log_filepath is None or not os.path.exists(csv_filepath):
+            return jsonify({"success": False, "message": f"log file with id {log_id} does not exist."}), 404
+
+        _, compression = split_compression(file.filename)
+
+        try:
+            print(f"Appending: {file.filename} -> {csv_filepath}")
+            with span("append"):
+                result = append_log(log_id, csv_filepath, log_filepath, file.stream, compression)
+            count_rows("ingest", result["appended"])
+            print(f"SUCCESS: {result}")
+        except ValueError as e:
+            # error is invalid log lines (or compressed data), nothing was appended
+            print(f"FAILURE: {e}")
+            return jsonify({"success": False, "message": f"{e}", "log_id": log_id}), 400
+        except Exception as e:
+            print(f"Error during append: {e}")
+            return jsonify({"success": False, "message": f"Server error: {e}"}), 500
+
+        return jsonify(
+            {
+                "success": True,
+                "message": f"Appended {result['appended']} rows.",
+                "log_id": log_id,
+                **result,
+            }
+        )
@@ -1,11 +1,47 @@
 # import from all files
 
-from .csv import filter_csv, parse_csv, write_csv, validate_csv_data, get_csv_data, get_csv_metadata, get_csv_timestamps
+from .metrics import LATENCY_BUCKETS, METRICS, Metrics, get_metrics, observe_stage, span, count_rows, count_bytes, request_timings
 
-from .files import validate_filename, get_processed_files
+from .csv import filter_csv, filter_csv_positions, filter_csv_rows, parse_csv, read_csv_rows, write_csv, escape_csv_field, validate_csv_data, get_csv_data, get_csv_timestamps, iter_csv_row_blocks
 
-from .timestamps import seconds_from_timestamp, timestamp_from_seconds, format_timestamp, validate_datetime_str
+from .metadata import connect_metadata_db, init_metadata_store, set_csv_metadata, get_csv_metadata, get_all_metadata
 
-from .parse import parse_opts, sort_data, parse_csv_request
+from .compression import LOG_COMPRESSIONS, LOG_APPENDERS, RESPONSE_ENCODINGS, split_compression, open_log_append, DecompressedStream, compress_bytes, iter_compressed, compress_response
 
-from .plotting import set_plot_generation_status, generate_plots
+from .files import validate_filename, get_raw_log_fpath, get_processed_files, atomic_write, load_csv_npz
+
+from .timestamps import seconds_from_timestamp, seconds_from_datetime_str, timestamp_from_seconds, seconds_from_timestamps, seconds_from_datetime_strs, timestamps_from_seconds, format_timestamp, validate_datetime_str
+
+from .parse import parse_opts, parse_sort_opt, typed_column, sort_permutation, sort_data, parse_csv_request, parse_log_ids, parse_merged_sort_opts, parse_page_opts
+
+from .index import index_fpath, build_timestamp_index, extend_timestamp_index, load_timestamp_index, query_time_range, row_spans, TimestampIndexBuilder
+
+from .cache import LRUCache
+
+from .search import search_index_fpath, tokenize, build_search_index, extend_search_index, load_search_index, parse_search_query, search_positions, SearchIndexBuilder
+
+from .bitmaps import BITMAP_FIELDS, bitmap_index_fpath, build_bitmap_index, extend_bitmap_index, load_bitmap_index, parse_facet_opts, facet_opts_key, facet_bitmap, facets_bitmap, time_range_bitmap, select_positions, BitmapIndexBuilder
+
+from .indexing import build_log_indexes
+
+from .merge import SOURCE_COLUMN, merge_ranges, range_entries, seek_merged, iter_merged, read_merged_rows, get_merged_page, get_merged_columns, get_merged_positions
+
+from .views import get_view_cache, load_log, load_index, load_search, load_bitmaps, load_facet_positions, typed_key, get_view, get_view_rows, read_view_rows, get_csv_page, get_view_columns, iter_view_csv
+
+from .summary import summary_fpath, summarize_log, merge_log_summaries, write_log_summary, build_log_summary, load_log_summary
+
+from .ingest import CSV_HEADER, InvalidLogLine, LogParser, load_templates, timestamp_key, feed_stream, ingest_log, ingest_stream, ingest_tail, ingest_log_parallel, split_line_ranges
+
+from .jobs import QueueFull, PlotJobQueue, get_plot_queue
+
+from .plotcache import content_digest, plot_cache_key, PlotCache, get_plot_cache
+
+from .httpcache import make_etag, csv_validators, is_not_modified, set_cache_headers, not_modified_response
+
+from .sandbox import CustomPlotPool, get_custom_plot_pool
+
+from .plotting import TIME_BINS, get_pyplot, plot_style_settings, choose_time_bin, count_events_over_time, needs_rows, set_plot_generation_status, generate_plots
+
+from .append import tail_fpath, append_log
+
+from .tail import LogTailer, get_log_tailer
@@ -0,0 +1,114 @@
+from app.utils.ingest import ingest_tail
+from app.utils.csv import read_csv_rows
+from app.utils.index import load_timestamp_index, extend_timestamp_index
+from app.utils.search import load_search_index, extend_search_index
+from app.utils.bitmaps import load_bitmap_index, extend_bitmap_index
+from app.utils.summary import load_log_summary, merge_log_summaries, write_log_summary
+from app.utils.compression import split_compression, open_log_append
+from app.utils.metadata import get_csv_metadata, set_csv_metadata
+from app.utils.views import get_view_cache
+from app.utils.plotcache import get_plot_cache
+
+import fcntl, os, shutil
+
+
+def tail_fpath(csv_fpath):
+    """Path of the parsed tail of a log being appended to processed csv at `csv_fpath`: `{basename_wo_extension}.append.tmp`"""
+    return csv_fpath.rsplit(".", 1)[0] + ".append.tmp"
+
+
+def _append_raw_newline(raw_fpath, raw_f):
+    # make sure the appended lines start on a new line of the raw log
+    # (compressed logs can not be checked cheaply, an empty line is skipped when they are parsed again)
+    if split_compression(raw_fpath)[1] is not None:
+        raw_f.write(b"\n")
+        return
+
+    with open(raw_fpath, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            raw_f.write(b"\n")
+
+
+def append_log(log_id, csv_fpath, raw_fpath, stream, compression=None):
+    """Append the tail of log `log_id` (the lines added since it was uploaded or last appended to), read from binary
+    `stream` (compressed with `compression` if given), to its processed csv at `csv_fpath` and raw log at `raw_fpath`.
+
+    Only the tail is validated and parsed, its LineIds continue those of the csv. The csv is extended in place (so the
+    byte offsets of its rows stay valid) and its indexes, summary and metadata are extended with the new rows only
+    (see `extend_timestamp_index`, `extend_search_index`, `extend_bitmap_index`, `merge_log_summaries`).
+    Cached views and plots of the old version of this log are dropped, other logs keep theirs.
+
+    Appends to the same log are serialized (by a lock on the csv). If the tail is invalid, nothing is changed.
+
+    Returns dict with `appended` (rows), `rows` (total), and `start_timestamp`, `end_timestamp` of the log.
+    Raises `InvalidLogLine` (a `ValueError`) if the tail is invalid, `ValueError` if the compressed data is invalid."""
+
+    with open(csv_fpath, "ab") as csv_f:
+        fcntl.flock(csv_f, fcntl.LOCK_EX)
+
+        # indexes of the current version (rebuilt first if missing or stale)
+        index = load_timestamp_index(csv_fpath)
+        search_index = load_search_index(csv_fpath)
+        bitmap_index = load_bitmap_index(csv_fpath)
+        summary = load_log_summary(csv_fpath)
+
+        n_rows = len(index["offsets"]) - 1
+        csv_end = int(index["offsets"][-1])
+        raw_size = os.path.getsize(raw_fpath)
+
+        # parse the tail aside (and copy it to the raw log), so an invalid tail changes nothing
+        try:
+            with open_log_append(raw_fpath) as raw_f:
+                _append_raw_newline(raw_fpath, raw_f)
+                stats, tail_summary = ingest_tail(
+                    stream, tail_fpath(csv_fpath), n_rows + 1, compression, copy_f=raw_f
+                )
+        except Exception:
+            os.truncate(raw_fpath, raw_size)
+            if os.path.exists(tail_fpath(csv_fpath)):
+                os.remove(tail_fpath(csv_fpath))
+            raise
+
+        if not stats["valid"]:
+            # empty tail, nothing changes
+            os.remove(tail_fpath(csv_fpath))
+            os.truncate(raw_fpath, raw_size)
+            return {
+                "appended": 0,
+                "rows": n_rows,
+                "start_timestamp": summary["start_timestamp"],
+                "end_timestamp": summary["end_timestamp"],
+            }
+
+        with open(tail_fpath(csv_fpath), "rb") as f:
+            shutil.copyfileobj(f, csv_f)
+        csv_f.flush()
+        os.remove(tail_fpath(csv_fpath))
+
+        # extend indexes with the appended rows only
+        extend_timestamp_index(csv_fpath, index)
+        _, rows = read_csv_rows(csv_fpath, [(csv_end, os.path.getsize(csv_fpath))])
+        columns = [list(column) for column in zip(*rows)]
+        extend_search_index(csv_fpath, search_index, columns, n_rows)
+        extend_bitmap_index(csv_fpath, bitmap_index, columns)
+
+        summary = write_log_summary(csv_fpath, merge_log_summaries(summary, tail_summary))
+
+    md = get_csv_metadata(log_id)
+    set_csv_metadata(log_id, md["original_name"], summary["start_timestamp"], summary["end_timestamp"])
+
+    # drop cached views and plots of the old version of this log only
+    # (merged plots with this log are not named by log, they are left to the plot cache LRU)
+    get_view_cache().discard(lambda k: k[1] == csv_fpath)
+    get_plot_cache().discard(lambda fname: fname.startswith(f"{log_id}_"))
+
+    return {
+        "appended": stats["valid"],
+        "rows": n_rows + stats["valid"],
+        "start_timestamp": summary["start_timestamp"],
+        "end_timestamp": summary["end_timestamp"],
+    }
@@ -0,0 +1,264 @@
+from app.utils.csv import parse_csv
+from app.utils.index import load_timestamp_index
+from app.utils.timestamps import validate_datetime_str, seconds_from_datetime_str
+from app.utils.metrics import span
+from app.utils.files import atomic_write, load_csv_npz
+
+import os, re
+import numpy as np
+
+# columns with a bitmap index, by the name of their filter option
+BITMAP_FIELDS = {"level": 2, "event": 4}
+
+# values of the `event` filter: EventIds (e.g. `E2`), or `none` for rows matching no template (empty EventId)
+EVENT_OPT_RE = re.compile(r"E\d+|none")
+
+
+def bitmap_index_fpath(csv_fpath):
+    """Path of the bitmap index for processed csv at `csv_fpath`: `{basename_wo_extension}.bitmap.npz`"""
+    return csv_fpath.rsplit(".", 1)[0] + ".bitmap.npz"
+
+
+def build_bitmap_index(csv_fpath, columns=None):
+    """Build (and save next to the csv) the bitmap index of the `Level` and `EventId` columns of processed csv at `csv_fpath`
+    (`columns` of the csv, see `parse_csv(..., as_columns=True)`, if already parsed).
+
+    The index holds, for each field of `BITMAP_FIELDS`:
+    - `{field}_values`: distinct values of the column, sorted
+    - `{field}_bitmaps`: one bitmap (`np.packbits` of a boolean mask over all rows) per value, in order of `{field}_values`
+
+    and `rows` (number of rows), `csv_size`, `csv_mtime` (to detect if the csv changed after the index was built).
+    Returns the index as dict.
+    """
+
+    stat = os.stat(csv_fpath)
+
+    if columns is None:
+        _, columns = parse_csv(csv_fpath, as_columns=True)
+
+    fields = {name: _value_codes(columns[field]) for name, field in BITMAP_FIELDS.items()}
+
+    return _save_bitmap_index(csv_fpath, _bitmap_index(fields, len(columns[0]), stat))
+
+
+class BitmapIndexBuilder:
+    """Builds the bitmap index (see `build_bitmap_index`) of a processed csv from blocks of its rows
+    (see `iter_csv_row_blocks`), so it can be built in the same pass over the csv as other indexes.
+    Only the value code (`int32`) of each row is kept per field until the index is saved."""
+
+    def __init__(self):
+        self.ids = {name: {} for name in BITMAP_FIELDS}
+        self.codes = {name: [] for name in BITMAP_FIELDS}
+        self.rows = 0
+
+    def add(self, offsets, rows):
+        for name, field in BITMAP_FIELDS.items():
+            self.codes[name].append(_value_codes([row[field] for row in rows], self.ids[name])[1])
+        self.rows += len(rows)
+
+    def save(self, csv_fpath, stat):
+        """Save the index of all rows added next to the csv at `csv_fpath` (`stat` of the csv when it was read), returns it."""
+
+        fields = {
+            name: (self.ids[name], np.concatenate(self.codes[name]) if self.codes[name] else np.zeros(0, dtype=np.int32))
+            for name in BITMAP_FIELDS
+        }
+
+        return _save_bitmap_index(csv_fpath, _bitmap_index(fields, self.rows, stat))
+
+
+def extend_bitmap_index(csv_fpath, index, columns):
+    """Extend bitmap `index` of processed csv at `csv_fpath` (see `build_bitmap_index`) with the rows appended to the csv
+    since `index` was built (and save it), where `columns` are the columns of the appended rows only.
+
+    Only the appended rows are read, the bitmap of each value is its old bitmap followed by the bits of the appended rows.
+    Returns the index as dict."""
+
+    stat = os.stat(csv_fpath)
+    n_old = int(index["rows"])
+    n_rows = n_old + len(columns[0])
+
+    extended = {
+        "rows": np.int64(n_rows),
+        "csv_size": np.int64(stat.st_size),
+        "csv_mtime": np.int64(stat.st_mtime_ns),
+    }
+
+    for name, field in BITMAP_FIELDS.items():
+        old_values = index[f"{name}_values"].tolist()
+        ids, codes = _value_codes(columns[field])
+        values = sorted(set(old_values).union(ids))
+
+        bitmaps = np.zeros((len(values), (n_rows + 7) // 8), dtype=np.uint8)
+        for i, value in enumerate(values):
+            mask = np.zeros(n_rows, dtype=bool)
+            if value in old_values:
+                mask[:n_old] = np.unpackbits(index[f"{name}_bitmaps"][old_values.index(value)], count=n_old)
+            if value in ids:
+                mask[n_old:] = codes == ids[value]
+            bitmaps[i] = np.packbits(mask)
+
+        extended[f"{name}_values"] = np.array(values, dtype=str)
+        extended[f"{name}_bitmaps"] = bitmaps
+
+    return _save_bitmap_index(csv_fpath, extended)
+
+
+def _value_codes(column, ids=None):
+    # number values in order of first appearance (few distinct values, so hashing beats sorting all rows),
+    # returns ({value: code}, codes of all rows), numbering on from `ids` if given
+    ids = {} if ids is None else ids
+    codes = np.fromiter((ids.setdefault(v, len(ids)) for v in column), dtype=np.int32, count=len(column))
+    return ids, codes
+
+
+def _bitmap_index(fields, n_rows, stat):
+    # index dict (see `build_bitmap_index`) of {name: ({value: code}, codes of all rows)} (see `_value_codes`) per field
+    index = {
+        "rows": np.int64(n_rows),
+        "csv_size": np.int64(stat.st_size),
+        "csv_mtime": np.int64(stat.st_mtime_ns),
+    }
+
+    for name, (ids, codes) in fields.items():
+        values = sorted(ids)
+
+        # one value at a time, so only one boolean mask is held
+        bitmaps = np.zeros((len(values), (len(codes) + 7) // 8), dtype=np.uint8)
+        for i, value in enumerate(values):
+            bitmaps[i] = np.packbits(codes == ids[value])
+
+        index[f"{name}_values"] = np.array(values, dtype=str)
+        index[f"{name}_bitmaps"] = bitmaps
+
+    return index
+
+
+def _save_bitmap_index(csv_fpath, index):
+    # write to temp file first so a concurrent reader never sees a partial index
+    atomic_write(bitmap_index_fpath(csv_fpath), lambda f: np.savez(f, **index))
+
+    return index
+
+
+def load_bitmap_index(csv_fpath):
+    """Return the bitmap index for processed csv at `csv_fpath`, rebuilding it if it is missing or stale."""
+
+    index = load_csv_npz(bitmap_index_fpath(csv_fpath), csv_fpath)
+    if index is not None:
+        return index
+
+    return build_bitmap_index(csv_fpath)
+
+
+def parse_facet_opts(level=None, event=None):
+    """Return the level and event filter options as dict (field of `BITMAP_FIELDS` -> sorted list of values),
+    or `None` if neither is given. Each of `level`, `event` is a list or a str of ','-separated values.
+
+    Raises `ValueError` if a value is invalid."""
+
+    facets = {}
+
+    for name, opts in (("level", level), ("event", event)):
+        if isinstance(opts, str):
+            opts = opts.split(",")
+        if opts is not None and not (isinstance(opts, list) and all(isinstance(v, str) for v in opts)):
+            raise ValueError(f"{name} filter options must be a list or a ','-separated string.")
+
+        values = sorted({v.strip() for v in opts or () if v.strip()})
+
+        if name == "level":
+            values = sorted({v.lower() for v in values})
+        elif not all(EVENT_OPT_RE.fullmatch(v) for v in values):
+            raise ValueError("event filter options must be EventIds (e.g. E2) or 'none'.")
+
+        if values:
+            facets[name] = values
+
+    return facets or None
+
+
+def facet_opts_key(facets):
+    """Hashable (and json-serializable) form of `facets` (see `parse_facet_opts`), for cache keys."""
+    return tuple((name, tuple(values)) for name, values in sorted(facets.items())) if facets else ()
+
+
+def facet_bitmap(index, name, values):
+    """Return the bitmap (see `build_bitmap_index`) of rows whose `name` column is any of `values`."""
+
+    # `none` is the empty EventId
+    values = ["" if name == "event" and v == "none" else v for v in values]
+
+    known = index[f"{name}_values"]
+    bitmaps = index[f"{name}_bitmaps"]
+
+    pos = np.flatnonzero(np.isin(known, values))
+
+    if len(pos) == 0:
+        return np.zeros(bitmaps.shape[1], dtype=np.uint8)
+
+    return np.bitwise_or.reduce(bitmaps[pos], axis=0)
+
+
+def facets_bitmap(index, facets):
+    """Return the bitmap (see `build_bitmap_index`) of rows whose level and event are in `facets` (see `parse_facet_opts`),
+    the bitwise AND of the (OR-ed) bitmaps of each field, or `None` if `facets` is empty."""
+
+    bits = None
+    for name, values in (facets or {}).items():
+        field_bits = facet_bitmap(index, name, values)
+        bits = field_bits if bits is None else bits & field_bits
+
+    return bits
+
+
+def time_range_bitmap(csv_fpath, filter_opts, n_rows, time_index=None):
+    """Return the bitmap (see `build_bitmap_index`) of rows of processed csv at `csv_fpath` in date range `filter_opts`,
+    set straight from the time order of its timestamp index (`time_index`, loaded if `None`; no sorting of row positions,
+    unlike `query_time_range`).
+
+    Raises exception if the date range is invalid."""
+
+    start_dt, end_dt = filter_opts
+    if not (validate_datetime_str(start_dt) and validate_datetime_str(end_dt)):
+        raise Exception(
+            "Error: Filtering options - start date, end date - not in correct format."
+        )
+
+    if time_index is None:
+        time_index = load_timestamp_index(csv_fpath)
+    lo = np.searchsorted(time_index["seconds"], seconds_from_datetime_str(start_dt), side="left")
+    hi = np.searchsorted(time_index["seconds"], seconds_from_datetime_str(end_dt), side="right")
+
+    mask = np.zeros(n_rows, dtype=bool)
+    mask[time_index["rows"][lo:hi]] = True
+
+    return np.packbits(mask)
+
+
+@span("filter")
+def select_positions(csv_fpath, filter_opts, facets, index=None, time_index=None):
+    """Return positions (ascending) of rows of processed csv at `csv_fpath` in date range `filter_opts` (all rows if `None`)
+    whose level and event are in `facets` (see `parse_facet_opts`).
+
+    The date range is turned into a bitmap (see `time_range_bitmap`) and intersected with the bitmaps of the chosen levels
+    and events (see `build_bitmap_index`, loaded if `index` is `None`) by bitwise AND, so no row is scanned.
+    `time_index` is the timestamp index of the csv, loaded if `None` and needed.
+
+    Raises exception if the date range is invalid (no row selected is a valid, empty selection)."""
+
+    if index is None:
+        index = load_bitmap_index(csv_fpath)
+
+    n_rows = int(index["rows"])
+
+    bits = facets_bitmap(index, facets)
+
+    if filter_opts:
+        time_bits = time_range_bitmap(csv_fpath, filter_opts, n_rows, time_index)
+        bits = time_bits if bits is None else bits & time_bits
+
+    if bits is None:
+        return np.arange(n_rows, dtype=np.int64)
+
+    return np.flatnonzero(np.unpackbits(bits, count=n_rows)).astype(np.int64)
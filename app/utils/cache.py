@@ -0,0 +1,60 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by the total size of its values in bytes (as estimated by the caller).
+
+    Values larger than the whole budget are not cached."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+
+            if nbytes > self.max_bytes:
+                return
+
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+
+            # evict least recently used entries
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+
+    def discard(self, predicate):
+        """Remove all entries whose key satisfies `predicate(key)`."""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self.nbytes -= self._entries.pop(key)[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,136 @@
+from flask import current_app, request
+
+import bz2, gzip, lzma, zlib
+
+# compressed log formats accepted for upload (by file extension), as readers decompressing a binary file object
+LOG_COMPRESSIONS = {
+    "gz": lambda f: gzip.GzipFile(fileobj=f, mode="rb"),
+    "bz2": lambda f: bz2.BZ2File(f, mode="rb"),
+    "xz": lambda f: lzma.LZMAFile(f, mode="rb"),
+}
+
+# writers appending to a compressed log (by file extension), as a new compressed member/stream at its end
+# (readers of `LOG_COMPRESSIONS` read all members as one log)
+LOG_APPENDERS = {
+    "gz": lambda fpath: gzip.open(fpath, "ab"),
+    "bz2": lambda fpath: bz2.open(fpath, "ab"),
+    "xz": lambda fpath: lzma.open(fpath, "ab"),
+}
+
+# content encodings of responses, in order of preference, with their `zlib` window bits
+# (NOTE: http "deflate" is the zlib format, not raw deflate)
+RESPONSE_ENCODINGS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS,
+}
+
+
+def split_compression(filename):
+    """Split `filename` into (`name`, `compression`), where `compression` is one of `LOG_COMPRESSIONS` if the file is compressed
+    (e.g. `access.log.gz` -> (`access.log`, `gz`)), else `None`."""
+
+    if "." in filename:
+        name, ext = filename.rsplit(".", 1)
+        if ext.lower() in LOG_COMPRESSIONS:
+            return name, ext.lower()
+
+    return filename, None
+
+
+def open_log_append(fpath):
+    """Open log at `fpath` (compressed if its extension is one of `LOG_APPENDERS`) for appending (decompressed) bytes."""
+
+    _, compression = split_compression(fpath)
+    if compression is None:
+        return open(fpath, "ab")
+
+    return LOG_APPENDERS[compression](fpath)
+
+
+class _TeeReader:
+    """Binary file object reading from `stream`, writing everything read to `copy_f` too."""
+
+    def __init__(self, stream, copy_f):
+        self.stream = stream
+        self.copy_f = copy_f
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.copy_f.write(data)
+        return data
+
+
+class DecompressedStream:
+    """Binary file object reading the decompressed bytes of binary `stream` compressed with `compression` (one of `LOG_COMPRESSIONS`),
+    decompressing as it is read (no decompressed copy is made).
+
+    If `copy_f` is given, the compressed bytes read from `stream` are also written to it.
+    Raises `ValueError` on reading if the compressed data is invalid or truncated."""
+
+    def __init__(self, stream, compression, copy_f=None):
+        self.compression = compression
+
+        if copy_f is not None:
+            stream = _TeeReader(stream, copy_f)
+        self._f = LOG_COMPRESSIONS[compression](stream)
+
+    def read(self, size=-1):
+        try:
+            return self._f.read(size)
+        except (OSError, EOFError, lzma.LZMAError) as e:
+            raise ValueError(f"Invalid .{self.compression} file: {e}")
+
+
+def compress_bytes(data, encoding, level):
+    """Compress `data` with content encoding `encoding` (one of `RESPONSE_ENCODINGS`) at zlib `level`."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, RESPONSE_ENCODINGS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+
+def iter_compressed(chunks, encoding, level):
+    """Generator compressing byte (or str) `chunks` as a single stream with content encoding `encoding` (see `compress_bytes`)."""
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, RESPONSE_ENCODINGS[encoding])
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+
+        yield compressor.flush()
+    finally:
+        # close `chunks` along with this generator (e.g. a `stream_with_context` generator must be closed in its request)
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response):
+    """Compress the body of `response` with gzip or deflate, whichever the current request accepts (preferring gzip),
+    and set its `Content-Encoding`. Streamed responses are compressed as they are streamed.
+
+    Only successful responses are compressed, non-streamed ones only if at least `COMPRESS_MIN_SIZE` bytes
+    (compressed at `COMPRESS_LEVEL`). Returns `response`."""
+
+    # the body depends on `Accept-Encoding` (for caches)
+    response.vary.add("Accept-Encoding")
+
+    encoding = request.accept_encodings.best_match(list(RESPONSE_ENCODINGS))
+    if encoding is None or response.status_code != 200 or "Content-Encoding" in response.headers:
+        return response
+
+    level = current_app.config["COMPRESS_LEVEL"]
+
+    if response.is_streamed:
+        response.response = iter_compressed(response.response, encoding, level)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config["COMPRESS_MIN_SIZE"]:
+            return response
+        response.set_data(compress_bytes(data, encoding, level))
+
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -1,14 +1,20 @@
 from flask import current_app
-from app.utils.timestamps import validate_datetime_str
+from app.utils.timestamps import validate_datetime_str, seconds_from_timestamps
 from app.utils.parse import sort_data
+from app.utils.index import query_time_range, row_spans
+from app.utils.metrics import span, count_rows, count_bytes
 
-import subprocess, json, os
+import subprocess, tempfile, os, io
+from itertools import accumulate
+import csv as _csv
 
+@span("filter")
 def filter_csv(csv_fpath: str, opts: str):
-    """Given an input csv fpath and filterings options, produces a filtered file.
-    Returns `(out_fpath, exception)`.
+    """Given an input csv fpath and filterings options, returns header and data of the filtered rows,
+    as produced by the filter script.
 
-    In case of an exception, `out_fpath` defaults to `csv_fpath`."""
+    The script writes to a private temporary file (removed before returning), so concurrent
+    requests never share an output file."""
 
     start_dt, end_dt = opts
 
@@ -23,9 +29,13 @@ def filter_csv(csv_fpath: str, opts: str):
             "Error: Filtering options - start date, end date - not in correct format."
         )
 
-    # filename for filtered csv
-    # {basename_wo_extension}.processed.csv
-    out_fpath = csv_fpath.rsplit(".", 1)[0] + ".processed.csv"
+    # unique filename for this request's output (no .csv extension, so it is never listed as a processed file)
+    fd, out_fpath = tempfile.mkstemp(
+        prefix=os.path.basename(csv_fpath).rsplit(".", 1)[0] + ".",
+        suffix=".filtered",
+        dir=os.path.dirname(csv_fpath),
+    )
+    os.close(fd)
 
     try:
         # pass to script with proper args
@@ -40,23 +50,16 @@ def filter_csv(csv_fpath: str, opts: str):
         )
         # print debug output
         if result.returncode == 0:
-
-            # basic check (num_lines > 1)
-            if not os.path.exists(out_fpath):
-                raise Exception(
-                    "Error: Filtering script did not produce file at desired location."
-                )
-            else:
-                if sum(1 for _ in open(out_fpath, "r")) <= 1:
-                    raise Exception(
-                        "Error: Filtering script produced empty filtered csv."
-                    )
-
             print(f"SUCCESS stdout: {result.stdout}")
             print(f"SUCCESS stderr: {result.stderr}")
 
-            # return fpath of output file if valid
-            return out_fpath
+            header, data = parse_csv(out_fpath)
+
+            # basic check (num_rows > 0)
+            if not data:
+                raise Exception("Error: Filtering script produced empty filtered csv.")
+
+            return header, data
 
         else:
             print(f"FAILURE stdout: {result.stdout}")
@@ -71,88 +74,109 @@ def filter_csv(csv_fpath: str, opts: str):
 
             raise Exception(err)
 
-    # error handling
-    except Exception as e:
-        # cleanup
+    # cleanup
+    finally:
         if os.path.exists(out_fpath):
             os.remove(out_fpath)
 
-        raise e
+
+# size of each block read from disk by `parse_csv`
+CSV_BLOCK_SIZE = 1 << 20
+
+
+def _iter_csv_blocks(f, block_size=CSV_BLOCK_SIZE):
+    """Yield chunks of text from `f`, each ending on a record boundary (excluding the final newline).
+
+    A newline only ends a record if it is not inside a quoted field, i.e. if the
+    number of `"` before it is even (escaped quotes `""` count twice, so parity holds).
+    """
+    carry = ""
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+
+        buf = carry + block
+
+        # find the last record boundary in this buffer
+        # (quotes are counted once, then only those between two candidates as we step back)
+        cut = buf.rfind("\n")
+        quotes = buf.count('"', 0, cut) if cut != -1 else 0
+        while cut != -1 and quotes % 2:
+            prev = buf.rfind("\n", 0, cut)
+            quotes -= buf.count('"', prev + 1, cut)
+            cut = prev
+
+        # record is longer than the buffer, keep reading
+        if cut == -1:
+            carry = buf
+            continue
+
+        yield buf[:cut]
+        carry = buf[cut + 1 :]
+
+    # final record without trailing newline
+    if carry:
+        yield carry
+
+
+def _parse_csv_block(block):
+    """Parse a chunk from `_iter_csv_blocks` into a list of rows."""
+    # fast path: no quoting at all, plain split
+    if '"' not in block:
+        return [line.split(",") for line in block.split("\n")]
+
+    # slow path: fall back on C parser of stdlib for quoted fields
+    return list(_csv.reader(io.StringIO(block), strict=False))
+
+
+@span("filter")
+def filter_csv_positions(csv_fpath, opts, index=None):
+    """Given an input csv fpath and filtering options, returns positions (ascending) of the rows in the date range
+    and the timestamp index used to find them (see `app.utils.index`, `index` if already loaded).
+    No row in the date range is a valid (empty) selection."""
+
+    start_dt, end_dt = opts
+
+    # validate date strings
+    if not (validate_datetime_str(start_dt) and validate_datetime_str(end_dt)):
+        print(f"start: {start_dt} end: {end_dt}")
+        raise Exception(
+            "Error: Filtering options - start date, end date - not in correct format."
+        )
+
+    return query_time_range(csv_fpath, start_dt, end_dt, index)
+
+
+def filter_csv_rows(csv_fpath, opts):
+    """Given an input csv fpath and filtering options, returns header and data of the rows in the date range,
+    read directly via the timestamp index instead of writing a filtered file."""
+
+    rows, index = filter_csv_positions(csv_fpath, opts)
+
+    return read_csv_rows(csv_fpath, row_spans(rows, index["offsets"]))
 
 
-def parse_csv(filepath):
+@span("csv_parse")
+def parse_csv(filepath, as_columns=False, as_numpy=False):
     """Parse CSV file (handles quoted fields and escaped double quotes)
 
-    Assumes file exists. Assumes LF endings(?)
+    Assumes file exists. CRLF endings are read as LF.
 
     Returns header (`List[str]`) and data (`List[List[str]]`).
+
+    If `as_columns=True`, data is returned column-wise instead (`List[List[str]]`, one list per header field),
+    and if `as_numpy=True` as well, each column is a `numpy` array of strings.
     """
 
     data = []
 
-    with open(filepath, "r") as f:
-        row = []
-        field = ""
-        in_quotes = False
-        # read char
-        while True:
-            char = f.read(1)
-            # EOF
-            if not char:
-                # append current field and row if non-empty
-                if field or row:
-                    row.append(field)
-                    data.append(row)
-                break
+    with open(filepath, "r", buffering=CSV_BLOCK_SIZE) as f:
+        for block in _iter_csv_blocks(f):
+            data.extend(_parse_csv_block(block))
 
-            # quoting begins
-            if char == '"':
-                # this can be:
-                # - start of escaped quote
-                # - start of new quoted field
-                # - end of a quoted field
-
-                if in_quotes:
-                    next_char = f.read(1)
-                    # escaped quote
-                    if next_char == '"':
-                        field += '"'
-                    else:
-                        # end of quoted field
-                        in_quotes = False
-                        if next_char:
-                            # end of non-final quoted field
-                            if next_char == ",":
-                                row.append(field)
-                                field = ""
-                            # end of final quoted field
-                            elif next_char == "\n":
-                                row.append(field)
-                                data.append(row)
-                                row = []
-                                field = ""
-                            # start of quoted field
-                            else:
-                                field += next_char
-                # start of quoted field
-                else:
-                    in_quotes = True
-
-            # read comma not in quotes
-            elif char == "," and not in_quotes:
-                row.append(field)
-                field = ""
-
-            # read EOL not in quotes
-            elif char == "\n" and not in_quotes:
-                row.append(field)
-                data.append(row)
-                row = []
-                field = ""
-
-            # any other case read literally
-            else:
-                field += char
+    count_bytes("csv_parse", os.path.getsize(filepath))
+    count_rows("csv_parse", max(len(data) - 1, 0))
 
     if not data:
         header, _data = [], []
@@ -160,25 +184,91 @@ def parse_csv(filepath):
         header = data[0]
         _data = data[1:] if len(data) > 1 else []
 
-    return header, _data
+    if not as_columns:
+        return header, _data
+
+    # transpose rows into columns (only valid if all rows have the same length)
+    validate_csv_data(header, _data)
+    columns = [list(col) for col in zip(*_data)] if _data else [[] for _ in header]
+
+    if as_numpy:
+        import numpy as np
+
+        columns = [np.array(col, dtype=str) for col in columns]
+
+    return header, columns
+
+
+@span("csv_read")
+def read_csv_rows(filepath, spans):
+    """Read only the rows in byte ranges `spans` (list of `(start, end)`, each covering whole rows) of CSV at `filepath`.
+
+    Returns header (`List[str]`) and data (`List[List[str]]`), rows in order of `spans`.
+    """
+
+    data = []
+
+    with open(filepath, "rb") as f:
+        header = f.readline().decode().rstrip("\r\n")
+        header = _parse_csv_block(header)[0] if header else []
+
+        for start, end in spans:
+            f.seek(start)
+            block = f.read(end - start).decode().replace("\r\n", "\n")
+            if block.endswith("\n"):
+                block = block[:-1]
+            if block:
+                data.extend(_parse_csv_block(block))
+
+    count_bytes("csv_read", sum(end - start for start, end in spans))
+    count_rows("csv_read", len(data))
+
+    return header, data
+
+
+def iter_csv_row_blocks(filepath, block_size=CSV_BLOCK_SIZE):
+    """Yield the rows of CSV at `filepath` (without header) in blocks of about `block_size` bytes, as (`offsets`, `rows`):
+    byte offsets of the rows of the block (and the end of the block as last element) and the rows (`List[List[str]]`).
+
+    Assumes one row per line, which holds for csvs written by the ingest step. Only one block is held in memory at a time.
+    """
+
+    with open(filepath, "rb") as f:
+        pos = len(f.readline())
+
+        while True:
+            lines = f.readlines(block_size)
+            if not lines:
+                break
+
+            offsets = list(accumulate((len(line) for line in lines), initial=pos))
+            pos = offsets[-1]
+
+            block = b"".join(lines).decode().replace("\r\n", "\n")
+            if block.endswith("\n"):
+                block = block[:-1]
+
+            yield offsets, _parse_csv_block(block)
+
+
+def escape_csv_field(field):
+    """Quote `field` for CSV output if it contains a comma, quote or newline (quotes are doubled)."""
+    field = str(field)
+    if '"' in field:
+        field = field.replace('"', '""')
+    if "," in field or '"' in field or "\n" in field:
+        field = f'"{field}"'
+    return field
 
 
 def write_csv(fpath, header, data):
     """(Over)Writes to CSV at `fpath` with `header` and `data`. Does not do any validation!"""
 
-    def _escape(field):
-        field = str(field)
-        if '"' in field:
-            field = field.replace('"', '""')
-        if "," in field or '"' in field or "\n" in field:
-            field = f'"{field}"'
-        return field
-
     with open(fpath, "w") as f:
-        f.write(",".join(_escape(col) for col in header) + "\n")
+        f.write(",".join(escape_csv_field(col) for col in header) + "\n")
 
         for row in data:
-            f.write(",".join(_escape(cell) for cell in row) + "\n")
+            f.write(",".join(escape_csv_field(cell) for cell in row) + "\n")
 
 
 def validate_csv_data(header, data):
@@ -194,9 +284,10 @@ def validate_csv_data(header, data):
     return True
 
 
-def get_csv_data(csv_fpath, sort_opts, filter_opts, for_download=False):
-    """Return CSV data (as dict),
-    or, path (`str`) to filtered csv (if `for_download=True`) for given `log_id` with sort and filter opts.
+def get_csv_data(csv_fpath, sort_opts, filter_opts, as_columns=False):
+    """Return CSV data (as dict) for given `log_id` with sort and filter opts.
+
+    If `as_columns=True`, the dict contains `"columns"` (one list per header field) instead of `"data"`.
 
     - Assumes the caller is passing valid `csv_fpath`,
       and `filter/sort_opts` are in a format suitable to
@@ -206,31 +297,31 @@ def get_csv_data(csv_fpath, sort_opts, filter_opts, for_download=False):
     *Notes:*
     - Filtering must be done within every `get_csv_data` call to ensure
       complete freedom for users to filter data
-    - This also means filtering is "on-the-fly" only
+    - This also means filtering is "on-the-fly" only, and happens in memory
+      (no filtered or sorted files are written next to the csv)
     """
 
+    # filtered data
+    header = data = None
+
     if filter_opts:
         try:
-            # returns new path
-            out_fpath = filter_csv(csv_fpath, filter_opts)
-
-            # both equivalent to an exception, but still check both
-            if out_fpath == csv_fpath:
-                raise Exception(f"Could not produce filtered CSV.")
-
+            if current_app.config["FILTER_ENGINE"] == "index":
+                header, data = filter_csv_rows(csv_fpath, filter_opts)
+            else:
+                header, data = filter_csv(csv_fpath, filter_opts)
         except Exception as e:
             raise Exception(f"Error filtering CSV {csv_fpath}: {e}")
 
-        csv_fpath = out_fpath
-
-    # in case download is required without sorting, send fpath as is
-    if for_download and not sort_opts:
-        return csv_fpath
-
-    # otherwise, either data is required or fpath is (with sorted data)
     try:
-        # parse csv
-        header, data = parse_csv(csv_fpath)
+        if data is None:
+            # column-wise data can be read directly if no sorting is needed
+            if as_columns and not sort_opts:
+                header, columns = parse_csv(csv_fpath, as_columns=True)
+                return {"header": header, "columns": columns, "filtered": bool(filter_opts)}
+
+            # parse csv
+            header, data = parse_csv(csv_fpath)
 
         # validate
         validate_csv_data(header, data)
@@ -241,70 +332,28 @@ def get_csv_data(csv_fpath, sort_opts, filter_opts, for_download=False):
     except Exception as e:
         raise Exception(f"Error reading CSV {csv_fpath}: {e}")
 
-    # if data is required
-    if not for_download:
-        return {"header": header, "data": data, "filtered": bool(filter_opts)}
+    if as_columns:
+        columns = [list(col) for col in zip(*data)] if data else [[] for _ in header]
+        return {"header": header, "columns": columns, "filtered": bool(filter_opts)}
 
-    # otherwise, save sorted data into the file and pass that
-    try:
-        write_csv(csv_fpath, header, data)
-    except Exception as e:
-        raise Exception(f"Error writing sorted data to CSV {csv_fpath}: {e}")
-
-    return csv_fpath
+    return {"header": header, "data": data, "filtered": bool(filter_opts)}
 
 
 def get_csv_timestamps(csv_fpath):
     try:
-        # get sorted data using `get_csv_data`
-        # NOTE: +1 sorts by timestamps ascending!
-        data = get_csv_data(
-            csv_fpath=csv_fpath, sort_opts=("+1",), filter_opts=None, for_download=False
-        )["data"]
-
-        start = data[0][1]
-        end = data[-1][1]
+        # only the Time column is needed, so read column-wise and take min/max
+        # instead of sorting the whole dataset
+        times = get_csv_data(
+            csv_fpath=csv_fpath,
+            sort_opts=None,
+            filter_opts=None,
+            as_columns=True,
+        )["columns"][1]
+
+        seconds = seconds_from_timestamps(times)
+        start = times[seconds.argmin()]
+        end = times[seconds.argmax()]
 
         return start, end
     except Exception as e:
         raise Exception(f"Error in reading timestamps of {csv_fpath}: {e}")
-
-
-def get_csv_metadata(log_id):
-    """Return metadata for `log_id` as dict of the form:
-    ```
-    {
-        "original_name": "<original_log_name>",
-        "start_timestamp": "<earliest_timestamp>",
-        "end_timestamp": "<latest_timestamp>",
-    }
-    ```
-
-    May raise exception."""
-
-    # read metadata file
-
-    try:
-        # check if non-empty
-        if not os.path.getsize(current_app.config["FILE_METADATA_FILE"]) > 0:
-            raise Exception("file empty.")
-
-        # read
-        with open(current_app.config["FILE_METADATA_FILE"], "r") as f:
-            md = json.load(f)
-
-        # check if metadata exists
-        if log_id not in md:
-            raise Exception(f"metadata not found for log_id {log_id}")
-
-        # return metadata as a JSON response
-        return {
-            "original_name": md[log_id]["original_name"],
-            "start_timestamp": md[log_id]["start_timestamp"],
-            "end_timestamp": md[log_id]["end_timestamp"],
-        }
-
-    except Exception as e:
-        raise Exception(
-            f"Could not read file metadata from {current_app.config['FILE_METADATA_FILE']}: {e}"
-        )
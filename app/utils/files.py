@@ -1,15 +1,38 @@
 from flask import current_app
-from app.utils.csv import get_csv_metadata
-import os
+from app.utils.metadata import get_all_metadata
+from app.utils.compression import split_compression
+import os, tempfile
+import numpy as np
 
 def validate_filename(filename: str):
+    """Whether `filename` is an allowed log file, optionally compressed (e.g. `access.log` or `access.log.gz`)."""
+    filename, compression = split_compression(filename)
+    if compression is not None and compression not in current_app.config["ALLOWED_COMPRESSIONS"]:
+        return False
     return "." in filename and filename.rsplit(".", 1)[1].lower() in current_app.config["ALLOWED_EXTENSIONS"]
 
 
+def get_raw_log_fpath(log_id):
+    """Returns path of the uploaded (raw) log of `log_id`, `{log_id}.log` or compressed as uploaded (e.g. `{log_id}.log.gz`),
+    or `None` if it does not exist."""
+    for ext in ["log"] + [f"log.{c}" for c in sorted(current_app.config["ALLOWED_COMPRESSIONS"])]:
+        fpath = os.path.join(current_app.config["UPLOAD_FOLDER"], f"{log_id}.{ext}")
+        if os.path.exists(fpath):
+            return fpath
+    return None
+
+
 def get_processed_files():
     """Returns a dictionary of processed files {log_id: original_filename}. Note, files of form '*.processed.csv' are to be ignored."""
 
-    # go through all files from processed folder and validate from metadata file
+    # read metadata of all logs at once
+    try:
+        md = get_all_metadata()
+    except Exception as e:
+        print(e)
+        md = {}
+
+    # go through all files from processed folder and validate from metadata
     processed = {}
     try:
         for filename in os.listdir(current_app.config["PROCESSED_FOLDER"]):
@@ -18,13 +41,8 @@ def get_processed_files():
 
                 # read the metadata for original name
                 original_name = f"Log {log_id}"  # placeholder name
-                try:
-                    md = get_csv_metadata(log_id)
-                    original_name = (
-                        md["original_name"] if md["original_name"] else original_name
-                    )
-                except Exception as e:
-                    print(e)
+                if log_id in md and md[log_id]["original_name"]:
+                    original_name = md[log_id]["original_name"]
 
                 processed[log_id] = original_name
 
@@ -33,3 +51,37 @@ def get_processed_files():
         return {}
 
     return processed
+
+
+def atomic_write(fpath, write, mode="wb"):
+    """Write file at `fpath` by calling `write(f)` on a temporary file (opened with `mode`) in the same folder, then moving it
+    in place. Readers never see a partial file, and concurrent writers of the same file (e.g. rebuilds of an index)
+    each use their own temporary file and replace it whole. The temporary file is removed if writing fails."""
+
+    fd, tmp_fpath = tempfile.mkstemp(prefix=os.path.basename(fpath) + ".", suffix=".tmp", dir=os.path.dirname(fpath))
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp_fpath, fpath)
+    except BaseException:
+        os.remove(tmp_fpath)
+        raise
+
+
+def load_csv_npz(fpath, csv_fpath):
+    """Return the arrays (as dict) of npz file at `fpath` built from processed csv at `csv_fpath` (e.g. an index),
+    or `None` if it is missing, unreadable or stale (its `csv_size` and `csv_mtime` are not those of the csv)."""
+
+    stat = os.stat(csv_fpath)
+
+    try:
+        with np.load(fpath) as npz:
+            arrays = {key: npz[key] for key in npz.files}
+    except Exception:
+        # missing or unreadable
+        return None
+
+    if int(arrays["csv_size"]) != stat.st_size or int(arrays["csv_mtime"]) != stat.st_mtime_ns:
+        return None
+
+    return arrays
@@ -0,0 +1,77 @@
+from flask import current_app, request
+from app.utils.plotcache import content_digest
+from app.utils.compression import RESPONSE_ENCODINGS
+
+import hashlib, json, os
+from datetime import datetime, timezone
+
+
+def make_etag(*parts):
+    """Return a strong ETag (without quotes) for a response derived from json-serializable `parts`."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def csv_validators(csv_fpath, name):
+    """Return (`etag`, `last_modified`) of response `name` (e.g. endpoint name) for processed csv at `csv_fpath`
+    (or list of csvs, for merged logs) and the query args of the current request.
+
+    The ETag is derived from the csv contents (see `content_digest`) and the query args, and from the content encoding
+    the request negotiates (see `compress_response`), since each encoding is a different representation."""
+
+    encoding = request.accept_encodings.best_match(list(RESPONSE_ENCODINGS))
+
+    csv_fpaths = [csv_fpath] if isinstance(csv_fpath, str) else csv_fpath
+
+    etag = make_etag(
+        [content_digest(f) for f in csv_fpaths] if len(csv_fpaths) > 1 else content_digest(csv_fpaths[0]),
+        name,
+        sorted(request.args.items(multi=True)),
+        encoding,
+    )
+    last_modified = datetime.fromtimestamp(
+        int(max(os.path.getmtime(f) for f in csv_fpaths)), tz=timezone.utc
+    )
+
+    return etag, last_modified
+
+
+def is_not_modified(etag, last_modified=None):
+    """Whether the client already has the response with `etag` (and `last_modified`), based on the
+    `If-None-Match` or (if not given) `If-Modified-Since` headers of the current request."""
+
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+
+    return False
+
+
+def set_cache_headers(response, etag, last_modified=None, max_age=None):
+    """Set `ETag`, `Last-Modified` and `Cache-Control` headers of `response`: public, reusable for `max_age` seconds
+    (`DATA_CACHE_MAX_AGE` by default) and revalidated after that. Returns `response`."""
+
+    if max_age is None:
+        max_age = current_app.config["DATA_CACHE_MAX_AGE"]
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.must_revalidate = True
+
+    return response
+
+
+def not_modified_response(etag, last_modified=None, max_age=None, vary_encoding=False):
+    """Empty `304 Not Modified` response with the cache headers of the response with `etag` (see `set_cache_headers`),
+    and `Vary: Accept-Encoding` if `vary_encoding` (for responses compressed with `compress_response`)."""
+
+    response = current_app.response_class(status=304)
+    if vary_encoding:
+        response.vary.add("Accept-Encoding")
+
+    return set_cache_headers(response, etag, last_modified, max_age)
@@ -0,0 +1,160 @@
+from app.utils.timestamps import seconds_from_timestamps, seconds_from_datetime_str
+from app.utils.files import atomic_write, load_csv_npz
+
+import os
+import numpy as np
+
+
+def index_fpath(csv_fpath):
+    """Path of the timestamp index for processed csv at `csv_fpath`: `{basename_wo_extension}.idx.npz`"""
+    return csv_fpath.rsplit(".", 1)[0] + ".idx.npz"
+
+
+def build_timestamp_index(csv_fpath):
+    """Build (and save next to the csv) the timestamp index for processed csv at `csv_fpath`.
+
+    The index holds:
+    - `offsets`: byte offset of each row (and the end of file as last element)
+    - `seconds`: timestamps of all rows (see `seconds_from_timestamp`), sorted
+    - `rows`: row positions in the order of `seconds`
+    - `csv_size`, `csv_mtime`: to detect if the csv changed after the index was built
+
+    Assumes one row per line, which holds for csvs written by the ingest step. Returns the index as dict.
+    """
+
+    stat = os.stat(csv_fpath)
+
+    with open(csv_fpath, "rb") as f:
+        # skip header
+        offsets, timestamps = _scan_rows(f, len(f.readline()))
+
+    return _save_timestamp_index(csv_fpath, _timestamp_index(offsets, seconds_from_timestamps(timestamps), stat))
+
+
+class TimestampIndexBuilder:
+    """Builds the timestamp index (see `build_timestamp_index`) of a processed csv from blocks of its rows
+    (see `iter_csv_row_blocks`), so it can be built in the same pass over the csv as other indexes."""
+
+    def __init__(self):
+        self.offsets = []
+        self.seconds = []
+        self.end = None
+
+    def add(self, offsets, rows):
+        self.offsets.append(np.array(offsets[:-1], dtype=np.int64))
+        self.seconds.append(seconds_from_timestamps([row[1] for row in rows]))
+        self.end = offsets[-1]
+
+    def save(self, csv_fpath, stat):
+        """Save the index of all rows added next to the csv at `csv_fpath` (`stat` of the csv when it was read), returns it."""
+
+        # no rows: the header is all the csv
+        end = self.end if self.end is not None else stat.st_size
+        offsets = np.concatenate(self.offsets + [np.array([end], dtype=np.int64)])
+        seconds = np.concatenate(self.seconds) if self.seconds else np.zeros(0, dtype=np.int64)
+
+        return _save_timestamp_index(csv_fpath, _timestamp_index(offsets, seconds, stat))
+
+
+def extend_timestamp_index(csv_fpath, index):
+    """Extend timestamp `index` of processed csv at `csv_fpath` (see `build_timestamp_index`) with the rows appended
+    to the csv since `index` was built (and save it), reading only the appended rows.
+
+    The appended rows are sorted on their own and merged into the time order of the index (after rows with equal
+    timestamps, as a stable sort of all rows would), so the old rows are not sorted again. Returns the index as dict.
+    """
+
+    stat = os.stat(csv_fpath)
+    n_rows = len(index["offsets"]) - 1
+
+    with open(csv_fpath, "rb") as f:
+        f.seek(int(index["offsets"][-1]))
+        offsets, timestamps = _scan_rows(f, int(index["offsets"][-1]))
+
+    seconds = seconds_from_timestamps(timestamps)
+    rows = np.argsort(seconds, kind="stable")
+
+    pos = np.searchsorted(index["seconds"], seconds[rows], side="right")
+
+    index = {
+        "offsets": np.concatenate((index["offsets"][:-1], np.array(offsets, dtype=np.int64))),
+        "seconds": np.insert(index["seconds"], pos, seconds[rows]),
+        "rows": np.insert(index["rows"], pos, rows.astype(np.int64) + n_rows),
+        "csv_size": np.int64(stat.st_size),
+        "csv_mtime": np.int64(stat.st_mtime_ns),
+    }
+
+    return _save_timestamp_index(csv_fpath, index)
+
+
+def _scan_rows(f, pos):
+    # byte offsets (and the end as last element) and timestamps of the rows of csv file `f`, from its current position `pos`
+    offsets = []
+    timestamps = []
+
+    for line in f:
+        # LineId and Time never contain commas, so a plain split is enough
+        timestamps.append(line.split(b",", 2)[1])
+        offsets.append(pos)
+        pos += len(line)
+
+    offsets.append(pos)
+
+    return offsets, timestamps
+
+
+def _timestamp_index(offsets, seconds, stat):
+    # index dict (see `build_timestamp_index`) of rows at byte `offsets` (and the end) with timestamps `seconds`, in file order
+    rows = np.argsort(seconds, kind="stable")
+
+    return {
+        "offsets": np.asarray(offsets, dtype=np.int64),
+        "seconds": seconds[rows],
+        "rows": rows.astype(np.int64),
+        "csv_size": np.int64(stat.st_size),
+        "csv_mtime": np.int64(stat.st_mtime_ns),
+    }
+
+
+def _save_timestamp_index(csv_fpath, index):
+    # write to temp file first so a concurrent reader never sees a partial index
+    atomic_write(index_fpath(csv_fpath), lambda f: np.savez(f, **index))
+
+    return index
+
+
+def load_timestamp_index(csv_fpath):
+    """Return the timestamp index for processed csv at `csv_fpath`, rebuilding it if it is missing or stale."""
+
+    index = load_csv_npz(index_fpath(csv_fpath), csv_fpath)
+    if index is not None:
+        return index
+
+    return build_timestamp_index(csv_fpath)
+
+
+def query_time_range(csv_fpath, start_dt, end_dt, index=None):
+    """Return positions (ascending) of rows of processed csv at `csv_fpath` with `start_dt <= timestamp <= end_dt`
+    (both in YYYY-mm-DD HH:MM:SS format) and the index used, via binary search on the timestamp index (`index`, loaded if `None`)."""
+
+    if index is None:
+        index = load_timestamp_index(csv_fpath)
+
+    lo = np.searchsorted(index["seconds"], seconds_from_datetime_str(start_dt), side="left")
+    hi = np.searchsorted(index["seconds"], seconds_from_datetime_str(end_dt), side="right")
+
+    return np.sort(index["rows"][lo:hi]), index
+
+
+def row_spans(rows, offsets):
+    """Group ascending row positions `rows` into byte ranges `(start, end)` of consecutive rows, using `offsets` of the index."""
+
+    if len(rows) == 0:
+        return []
+
+    # split wherever the next row is not the following one
+    breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+    starts = np.concatenate(([rows[0]], rows[breaks]))
+    ends = np.concatenate((rows[breaks - 1], [rows[-1]])) + 1
+
+    return list(zip(offsets[starts].tolist(), offsets[ends].tolist()))
@@ -0,0 +1,29 @@
+from app.utils.csv import iter_csv_row_blocks
+from app.utils.index import TimestampIndexBuilder
+from app.utils.search import SearchIndexBuilder
+from app.utils.bitmaps import BitmapIndexBuilder
+from app.utils.metrics import count_rows, count_bytes
+
+import os
+
+
+def build_log_indexes(csv_fpath):
+    """Build (and save next to the csv) the timestamp, search and bitmap indexes of processed csv at `csv_fpath`
+    (see `build_timestamp_index`, `build_search_index`, `build_bitmap_index`) in one pass over the csv.
+
+    Rows are read a block at a time (see `iter_csv_row_blocks`) and each block is given to all three index builders,
+    so the columns of the csv are never all held in memory. Returns the three indexes as dicts, in that order."""
+
+    stat = os.stat(csv_fpath)
+    builders = (TimestampIndexBuilder(), SearchIndexBuilder(), BitmapIndexBuilder())
+
+    n_rows = 0
+    for offsets, rows in iter_csv_row_blocks(csv_fpath):
+        for builder in builders:
+            builder.add(offsets, rows)
+        n_rows += len(rows)
+
+    count_bytes("index", stat.st_size)
+    count_rows("index", n_rows)
+
+    return tuple(builder.save(csv_fpath, stat) for builder in builders)
@@ -0,0 +1,504 @@
+from flask import current_app
+from app.utils.csv import escape_csv_field
+from app.utils.summary import summarize_log, write_log_summary
+from app.utils.compression import DecompressedStream
+
+import re, os, codecs
+from concurrent.futures import ProcessPoolExecutor
+
+# header of the processed csv (same as written by `bash/validate_parse.awk`)
+CSV_HEADER = ["LineId", "Time", "Level", "Content", "EventId", "EventTemplate"]
+
+# size of each block read from the uploaded log
+INGEST_BLOCK_SIZE = 1 << 20
+
+# number of csv rows buffered before they are written out
+INGEST_FLUSH_ROWS = 10_000
+
+# stricter regex (better timestamp checking), same as `preproc_regex` in `bash/validate_parse.awk`
+# \1 = timestamp
+# \2 = dayname
+# \3 = monthname
+# \4 = day
+# \5 = hour
+# \6 = year
+# \7 = level
+# \8 = content
+LOG_LINE_RE = re.compile(
+    r"^\[((Sun|Mon|Tue|Wed|Thu|Fri|Sat) (Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) ([0-9]{2}) ([01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9] ([12][0-9]{3}))\]\s+\[([a-z]+)\]\s+(.*)$"
+)
+
+# month map, built once (Feb is adjusted for leap years in `LogParser`)
+DAYS_IN_MONTH = {
+    "Jan": 31,
+    "Feb": 28,
+    "Mar": 31,
+    "Apr": 30,
+    "May": 31,
+    "Jun": 30,
+    "Jul": 31,
+    "Aug": 31,
+    "Sep": 30,
+    "Oct": 31,
+    "Nov": 30,
+    "Dec": 31,
+}
+
+
+class InvalidLogLine(ValueError):
+    """Raised by `LogParser` on the first invalid line of a log. `lineno` is 1-based and counts empty lines too."""
+
+    def __init__(self, lineno, line, reason=""):
+        self.lineno = lineno
+        self.line = line
+        self.reason = reason
+        super().__init__(f"{reason}invalid log line at {lineno} : {line}")
+
+
+# month number as 2-digit string, for building sortable timestamp keys
+MONTH_NUM = {m: f"{i:02d}" for i, m in enumerate(DAYS_IN_MONTH, start=1)}
+
+
+def timestamp_key(timestamp):
+    """Sortable key (`YYYYmmDDHH:MM:SS`) for a log timestamp of the form `Sun Dec 04 04:47:44 2005`."""
+    return f"{timestamp[20:24]}{MONTH_NUM[timestamp[4:7]]}{timestamp[8:10]}{timestamp[11:19]}"
+
+
+def load_templates(re_fpath, str_fpath):
+    """Read event templates from `bash/template-data` files (one template per line, `E1`, `E2`, ... in order).
+
+    Returns `(template_re, template_str)` where `template_re` is a single compiled pattern
+    with one named group per event id (first matching template wins, in file order)
+    and `template_str` maps event id to the template string.
+
+    NOTE: the regexes are shared with awk, so they must stay in the subset common to POSIX ERE and python `re`.
+    """
+
+    with open(re_fpath, "r") as f:
+        regexes = [line.rstrip("\n") for line in f]
+
+    with open(str_fpath, "r") as f:
+        strings = [line.rstrip("\n") for line in f]
+
+    template_re = re.compile(
+        "|".join(f"(?P<E{i}>{r})" for i, r in enumerate(regexes, start=1))
+    )
+    template_str = {f"E{i}": s for i, s in enumerate(strings, start=1)}
+
+    return template_re, template_str
+
+
+class LogParser:
+    """Streaming validator/parser for apache error logs, python equivalent of `bash/validate_parse.awk`.
+
+    Text is passed in with `feed` (in chunks of any size) and rows of the processed csv
+    are written to the file object `out_f` in batches. `close` must be called at the end.
+
+    Raises `InvalidLogLine` on the first invalid line (empty lines are skipped).
+
+    With `header=False, line_ids=False` only the rows without their LineId are written,
+    which is used for the parts of a parallel ingest (see `ingest_log_parallel`).
+    LineIds start at `first_line_id` (e.g. to continue the rows of a log, see `ingest_tail`).
+    """
+
+    def __init__(self, out_f, template_re, template_str, header=True, line_ids=True, first_line_id=1):
+        self.out_f = out_f
+        self.template_re = template_re
+        # escape templates once instead of on every row
+        self.template_str = {k: escape_csv_field(v) for k, v in template_str.items()}
+
+        self.line_count = 0  # lines read so far (including empty ones), same as `NR`
+        self.valid_count = 0
+        self.match_count = 0
+
+        # earliest and latest timestamps seen so far
+        self.start_timestamp = None
+        self.end_timestamp = None
+        self._start_key = None
+        self._end_key = None
+
+        # rows per level, per EventId and per timestamp, for the log summary (see `summarize_log`)
+        self.level_counts = {}
+        self.event_counts = {}
+        self.timestamp_counts = {}
+
+        self.line_ids = line_ids
+        self.line_id_offset = first_line_id - 1
+
+        self._pending = ""  # incomplete last line of previous `feed`
+        self._rows = []
+
+        if header:
+            self.out_f.write(",".join(CSV_HEADER) + "\n")
+
+    def feed(self, text):
+        """Parse all complete lines in `text`, the rest is kept until the next call."""
+        lines = (self._pending + text).split("\n")
+        self._pending = lines.pop()
+        self._parse_lines(lines)
+
+    def close(self):
+        """Parse the remaining (unterminated) line and write out buffered rows."""
+        if self._pending:
+            lines, self._pending = [self._pending], ""
+            self._parse_lines(lines)
+        self.flush()
+
+    def flush(self):
+        if self._rows:
+            self.out_f.write("".join(self._rows))
+            self._rows = []
+
+    def stats(self):
+        return {
+            "lines": self.line_count,
+            "valid": self.valid_count,
+            "matched": self.match_count,
+            "start_timestamp": self.start_timestamp,
+            "end_timestamp": self.end_timestamp,
+        }
+
+    def counts(self):
+        return {
+            "levels": self.level_counts,
+            "events": self.event_counts,
+            "timestamps": self.timestamp_counts,
+        }
+
+    def summary(self):
+        """Return the log summary (see `summarize_log`) of everything parsed so far."""
+        return summarize_log(
+            self.level_counts,
+            self.event_counts,
+            self.timestamp_counts,
+            self.start_timestamp,
+            self.end_timestamp,
+        )
+
+    def _parse_lines(self, lines):
+        # local names for the hot loop
+        match_line = LOG_LINE_RE.match
+        match_template = self.template_re.search  # same as awk `~`, templates anchor themselves
+        template_str = self.template_str
+        line_ids = self.line_ids
+        id_offset = self.line_id_offset
+        rows = self._rows
+        level_counts = self.level_counts
+        event_counts = self.event_counts
+        timestamp_counts = self.timestamp_counts
+
+        nr = self.line_count
+        valid = self.valid_count
+        matched = self.match_count
+        last_timestamp = None
+        run = 0  # rows in the current run of equal timestamps
+
+        try:
+            for line in lines:
+                nr += 1
+
+                # if file is CRLF terminated, we dont care :)
+                if line.endswith("\r"):
+                    line = line[:-1]
+
+                # skip empty lines
+                if not line.strip():
+                    continue
+
+                m = match_line(line)
+                if m is None:
+                    raise InvalidLogLine(nr, line)
+
+                timestamp, _, monthname, day, _, year, level, content = m.groups()
+
+                # validate day of month (with leap year adjustment)
+                dim = DAYS_IN_MONTH[monthname]
+                if monthname == "Feb":
+                    yr = int(year)
+                    if (yr % 4 == 0 and yr % 100 != 0) or yr % 400 == 0:
+                        dim = 29
+                if not 1 <= int(day) <= dim:
+                    raise InvalidLogLine(nr, line, "(day not in range) ")
+
+                valid += 1
+
+                # track start/end timestamps and rows per timestamp (consecutive lines mostly share a timestamp)
+                if timestamp != last_timestamp:
+                    if run:
+                        timestamp_counts[last_timestamp] = timestamp_counts.get(last_timestamp, 0) + run
+                        run = 0
+                    last_timestamp = timestamp
+                    key = timestamp_key(timestamp)
+                    if self._start_key is None or key < self._start_key:
+                        self._start_key, self.start_timestamp = key, timestamp
+                    if self._end_key is None or key > self._end_key:
+                        self._end_key, self.end_timestamp = key, timestamp
+                run += 1
+
+                # compare content against all templates at once
+                t = match_template(content)
+                if t is None:
+                    event_id, template = "", ""
+                else:
+                    matched += 1
+                    event_id = t.lastgroup
+                    template = template_str[event_id]
+
+                level_counts[level] = level_counts.get(level, 0) + 1
+                event_counts[event_id] = event_counts.get(event_id, 0) + 1
+
+                row = f"{timestamp},{level},{escape_csv_field(content)},{event_id},{template}\n"
+                rows.append(f"{valid + id_offset},{row}" if line_ids else row)
+        finally:
+            if run:
+                timestamp_counts[last_timestamp] = timestamp_counts.get(last_timestamp, 0) + run
+            self.line_count = nr
+            self.valid_count = valid
+            self.match_count = matched
+
+        if len(rows) >= INGEST_FLUSH_ROWS:
+            self.flush()
+
+
+def ingest_log(log_fpath, csv_fpath):
+    """Validate log at `log_fpath` and write the processed csv to `csv_fpath` (and its summary, see `summarize_log`) in a single pass.
+
+    Logs of at least `INGEST_PARALLEL_MIN_SIZE` bytes are split over `INGEST_WORKERS` processes
+    (see `ingest_log_parallel`).
+
+    Returns parser stats (see `LogParser.stats`). Raises `InvalidLogLine` (a `ValueError`) if the log is invalid,
+    in which case `csv_fpath` is left partially written and should be removed by the caller.
+    """
+
+    re_fpath = current_app.config["TEMPLATE_RE_PATH"]
+    str_fpath = current_app.config["TEMPLATE_STR_PATH"]
+    workers = current_app.config["INGEST_WORKERS"]
+
+    if workers > 1 and os.path.getsize(log_fpath) >= current_app.config["INGEST_PARALLEL_MIN_SIZE"]:
+        return ingest_log_parallel(log_fpath, csv_fpath, re_fpath, str_fpath, workers)
+
+    template_re, template_str = load_templates(re_fpath, str_fpath)
+
+    with open(log_fpath, "rb") as in_f, open(csv_fpath, "w") as out_f:
+        parser = LogParser(out_f, template_re, template_str)
+        feed_stream(parser, in_f)
+
+    write_log_summary(csv_fpath, parser.summary())
+
+    return parser.stats()
+
+
+def ingest_stream(stream, log_fpath, csv_fpath, compression=None):
+    """Validate and parse a log while it is read from the binary `stream` (e.g. an uploaded file),
+    writing a raw copy to `log_fpath` and the processed csv to `csv_fpath` in the same pass.
+
+    If `compression` is given (one of `LOG_COMPRESSIONS`), `stream` is decompressed as it is parsed
+    and the raw copy stays compressed.
+
+    Stops reading at the first invalid line. Returns parser stats, raises `InvalidLogLine` like `ingest_log`
+    (or `ValueError` if the compressed data is invalid).
+    """
+
+    template_re, template_str = load_templates(
+        current_app.config["TEMPLATE_RE_PATH"], current_app.config["TEMPLATE_STR_PATH"]
+    )
+
+    with open(log_fpath, "wb") as log_f, open(csv_fpath, "w") as out_f:
+        parser = LogParser(out_f, template_re, template_str)
+        if compression is None:
+            feed_stream(parser, stream, copy_f=log_f)
+        else:
+            feed_stream(parser, DecompressedStream(stream, compression, copy_f=log_f))
+
+    write_log_summary(csv_fpath, parser.summary())
+
+    return parser.stats()
+
+
+def ingest_tail(stream, tail_fpath, first_line_id, compression=None, copy_f=None):
+    """Validate and parse the tail of a log (the lines added to it since it was ingested) read from binary `stream`,
+    writing its csv rows (no header, LineIds from `first_line_id`) to `tail_fpath`, to be appended to the processed csv.
+
+    If `compression` is given, `stream` is decompressed as it is parsed. The (decompressed) tail is also written to `copy_f` if given.
+
+    Returns (`stats`, `summary`) of the tail (see `LogParser.stats`, `LogParser.summary`).
+    Raises `InvalidLogLine` like `ingest_log` (or `ValueError` if the compressed data is invalid).
+    """
+
+    template_re, template_str = load_templates(
+        current_app.config["TEMPLATE_RE_PATH"], current_app.config["TEMPLATE_STR_PATH"]
+    )
+
+    if compression is not None:
+        stream = DecompressedStream(stream, compression)
+
+    with open(tail_fpath, "w") as out_f:
+        parser = LogParser(out_f, template_re, template_str, header=False, first_line_id=first_line_id)
+        feed_stream(parser, stream, copy_f=copy_f)
+
+    return parser.stats(), parser.summary()
+
+
+def feed_stream(parser, in_f, limit=None, copy_f=None):
+    """Feed bytes read from binary file object `in_f` into `parser` in blocks, then close the parser.
+
+    Reads at most `limit` bytes if given. Each block is also written to `copy_f` if given.
+    """
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    while limit is None or limit > 0:
+        size = INGEST_BLOCK_SIZE if limit is None else min(INGEST_BLOCK_SIZE, limit)
+        block = in_f.read(size)
+        if not block:
+            break
+        if limit is not None:
+            limit -= len(block)
+        if copy_f is not None:
+            copy_f.write(block)
+        parser.feed(decoder.decode(block))
+
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+
+
+def split_line_ranges(fpath, n_parts):
+    """Split file at `fpath` into at most `n_parts` byte ranges `(start, end)` of roughly equal size,
+    each starting at the beginning of a line."""
+
+    size = os.path.getsize(fpath)
+    bounds = [0]
+
+    with open(fpath, "rb") as f:
+        for i in range(1, n_parts):
+            # move forward to the start of the next line
+            pos = max(size * i // n_parts, bounds[-1])
+            f.seek(pos)
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+# templates loaded once per worker process
+_worker_templates = {}
+
+
+def _ingest_range(log_fpath, start, end, part_fpath, re_fpath, str_fpath):
+    """Worker for `ingest_log_parallel`: parse bytes `[start, end)` of the log into a part file (rows without LineIds).
+
+    Returns `(stats, counts, error)` where `counts` are the parser counts (see `LogParser.counts`)
+    and `error` is `(local_lineno, line, reason)` of the first invalid line, or `None`.
+    """
+
+    key = (re_fpath, str_fpath)
+    if key not in _worker_templates:
+        _worker_templates[key] = load_templates(re_fpath, str_fpath)
+    template_re, template_str = _worker_templates[key]
+
+    error = None
+
+    with open(log_fpath, "rb") as in_f, open(part_fpath, "w") as out_f:
+        parser = LogParser(out_f, template_re, template_str, header=False, line_ids=False)
+        in_f.seek(start)
+
+        try:
+            feed_stream(parser, in_f, limit=end - start)
+        except InvalidLogLine as e:
+            error = (e.lineno, e.line, e.reason)
+
+    return parser.stats(), parser.counts(), error
+
+
+def ingest_log_parallel(log_fpath, csv_fpath, re_fpath, str_fpath, workers):
+    """Parallel version of `ingest_log`.
+
+    The log is split into line-aligned byte ranges that are validated and template-matched in a process pool,
+    each into its own part file. The parts are then stitched (in order) into `csv_fpath`, with LineIds
+    numbered globally. The first invalid line is reported with its line number in the whole log.
+    """
+
+    # a few ranges per worker keeps the pool busy if ranges take uneven time
+    ranges = split_line_ranges(log_fpath, workers * 4)
+    part_fpaths = [f"{csv_fpath}.part{i}" for i in range(len(ranges))]
+
+    totals = {"lines": 0, "valid": 0, "matched": 0, "start_timestamp": None, "end_timestamp": None}
+    counts = {"levels": {}, "events": {}, "timestamps": {}}
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_ingest_range, log_fpath, start, end, part, re_fpath, str_fpath)
+                for (start, end), part in zip(ranges, part_fpaths)
+            ]
+
+            with open(csv_fpath, "w") as out_f:
+                out_f.write(",".join(CSV_HEADER) + "\n")
+
+                # stitch parts in order, as soon as each one is done
+                for future, part in zip(futures, part_fpaths):
+                    stats, part_counts, error = future.result()
+
+                    if error is not None:
+                        for f in futures:
+                            f.cancel()
+                        lineno, line, reason = error
+                        raise InvalidLogLine(totals["lines"] + lineno, line, reason)
+
+                    # renumber LineIds globally
+                    offset = totals["valid"]
+                    # rows end with "\n" only, a "\r" in a Content field must not split them
+                    with open(part, "r", newline="\n") as in_f:
+                        while True:
+                            lines = in_f.readlines(INGEST_BLOCK_SIZE)
+                            if not lines:
+                                break
+                            out_f.write(
+                                "".join(
+                                    f"{i},{line}"
+                                    for i, line in enumerate(lines, start=offset + 1)
+                                )
+                            )
+                            offset += len(lines)
+
+                    for k in ("lines", "valid", "matched"):
+                        totals[k] += stats[k]
+
+                    # merge counts for the summary
+                    for k, part_count in part_counts.items():
+                        for value, n in part_count.items():
+                            counts[k][value] = counts[k].get(value, 0) + n
+
+                    # merge start/end timestamps
+                    if stats["start_timestamp"] is not None:
+                        if totals["start_timestamp"] is None or timestamp_key(
+                            stats["start_timestamp"]
+                        ) < timestamp_key(totals["start_timestamp"]):
+                            totals["start_timestamp"] = stats["start_timestamp"]
+                        if totals["end_timestamp"] is None or timestamp_key(
+                            stats["end_timestamp"]
+                        ) > timestamp_key(totals["end_timestamp"]):
+                            totals["end_timestamp"] = stats["end_timestamp"]
+
+    finally:
+        for part in part_fpaths:
+            if os.path.exists(part):
+                os.remove(part)
+
+    write_log_summary(
+        csv_fpath,
+        summarize_log(
+            counts["levels"],
+            counts["events"],
+            counts["timestamps"],
+            totals["start_timestamp"],
+            totals["end_timestamp"],
+        ),
+    )
+
+    return totals
@@ -0,0 +1,201 @@
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import time, uuid
+
+# job states, `PENDING_STATES` count towards the queue depth
+PENDING_STATES = {"queued", "processing"}
+FINAL_STATES = {"done", "error", "cancelled"}
+
+
+class QueueFull(Exception):
+    """Raised by `PlotJobQueue.submit` when `max_pending` jobs are already queued or running."""
+
+
+class PlotJobQueue:
+    """Thread-safe queue of plot jobs run by a bounded pool of `workers` threads.
+
+    Every job gets an id and a status record (see `get`). At most `max_pending` jobs can be
+    queued or running at once, `submit` raises `QueueFull` beyond that.
+
+    Jobs are cancelled when asked to (`cancel`), or when still queued while nobody has polled their
+    status for `stale_after` seconds (the client is gone). Records of finished jobs are dropped
+    `ttl` seconds after they finished (their plots stay in the plot cache, see `PlotCache`)."""
+
+    def __init__(self, workers, max_pending, stale_after, ttl):
+        self.max_pending = max_pending
+        self.stale_after = stale_after
+        self.ttl = ttl
+
+        self._jobs = {}  # job_id -> record
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plot-job")
+
+    def submit(self, fn, *args, plot_files=None):
+        """Queue `fn(*args, job_id=<job_id>)` as a new job and return its id. May raise `QueueFull`."""
+
+        now = time.time()
+
+        with self._lock:
+            self._prune(now)
+
+            pending = sum(job["status"] in PENDING_STATES for job in self._jobs.values())
+            if pending >= self.max_pending:
+                raise QueueFull(f"Too many plot jobs in queue ({pending}), try again later.")
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "plot_files": plot_files or {},
+                "error": "",
+                "created": now,
+                "updated": now,
+                "polled": now,
+            }
+
+        self._executor.submit(self._run, job_id, fn, args)
+
+        return job_id
+
+    def full(self):
+        """Whether `submit` would raise `QueueFull` right now (checked before preparing a job's data)."""
+        with self._lock:
+            pending = sum(job["status"] in PENDING_STATES for job in self._jobs.values())
+            return pending >= self.max_pending
+
+    def _run(self, job_id, fn, args):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                return
+
+            # client stopped polling while the job was waiting
+            if time.time() - job["polled"] > self.stale_after:
+                self._finish(job, "cancelled", "job cancelled (stale)")
+                return
+
+            job["status"] = "processing"
+            job["updated"] = time.time()
+
+        try:
+            fn(*args, job_id=job_id)
+        except Exception as e:
+            print(e)
+            self.update(job_id, "error", error_str=f"{e}")
+
+    def update(self, job_id, status_str, plot_files=None, error_str=None):
+        """Set status of job `job_id` to `status_str` (and `plot_files`, `error_str` if not `None`).
+
+        Cancelled jobs stay cancelled."""
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] == "cancelled":
+                return
+
+            if plot_files is not None:
+                job["plot_files"] = plot_files
+            if error_str is not None:
+                job["error"] = error_str
+
+            if status_str in FINAL_STATES:
+                self._finish(job, status_str, job["error"])
+            else:
+                job["status"] = status_str
+                job["updated"] = time.time()
+
+    def get(self, job_id):
+        """Return status record of job `job_id` as dict (`None` if unknown) of the form:
+        ```
+        {
+            "job_id": "<job_id>",
+            "status": "queued" | "processing" | "done" | "error" | "cancelled",
+            "plot_files": {plot_type: plot_file},
+            "error": "<error message>",
+            "queue_position": <jobs queued before this one>,  # only while queued
+        }
+        ```
+        Counts as a poll, so the job is not cancelled as stale."""
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+
+            job["polled"] = time.time()
+
+            record = {
+                key: job[key] for key in ("job_id", "status", "plot_files", "error")
+            }
+            if job["status"] == "queued":
+                record["queue_position"] = sum(
+                    other["status"] == "queued" and other["created"] < job["created"]
+                    for other in self._jobs.values()
+                )
+
+            return record
+
+    def cancel(self, job_id):
+        """Cancel job `job_id`. Queued jobs never run, running jobs stop at the next plot. Returns `False` if unknown."""
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+
+            if job["status"] in PENDING_STATES:
+                self._finish(job, "cancelled", "job cancelled")
+
+            return True
+
+    def is_cancelled(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job is None or job["status"] == "cancelled"
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return counts
+
+    def _finish(self, job, status_str, error_str):
+        # expects lock to be held
+        job["status"] = status_str
+        job["error"] = error_str
+        job["updated"] = time.time()
+
+    def _prune(self, now):
+        # expects lock to be held
+        for job_id, job in list(self._jobs.items()):
+            # cancel queued jobs nobody is waiting for anymore
+            if job["status"] == "queued" and now - job["polled"] > self.stale_after:
+                self._finish(job, "cancelled", "job cancelled (stale)")
+
+            # drop old finished jobs
+            if job["status"] in FINAL_STATES and now - job["updated"] > self.ttl:
+                del self._jobs[job_id]
+
+
+# shared plot job queue, created on first use (see `get_plot_queue`)
+_plot_queue = None
+_plot_queue_lock = Lock()
+
+
+def get_plot_queue():
+    """Return the process-wide plot job queue (configured by `PLOT_WORKERS`, `PLOT_QUEUE_MAX`, ...)."""
+    global _plot_queue
+    if _plot_queue is None:
+        # jobs queued on a second queue would never be found by `/status`
+        with _plot_queue_lock:
+            if _plot_queue is None:
+                _plot_queue = PlotJobQueue(
+                    workers=current_app.config["PLOT_WORKERS"],
+                    max_pending=current_app.config["PLOT_QUEUE_MAX"],
+                    stale_after=current_app.config["PLOT_JOB_STALE_SECONDS"],
+                    ttl=current_app.config["PLOT_JOB_TTL"],
+                )
+    return _plot_queue
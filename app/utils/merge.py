@@ -0,0 +1,215 @@
+from app.utils.index import row_spans
+from app.utils.csv import read_csv_rows
+from app.utils.timestamps import validate_datetime_str, seconds_from_datetime_str
+from app.utils.views import load_index, load_facet_positions
+from app.utils.metrics import span
+
+import heapq
+from itertools import islice, repeat
+import numpy as np
+
+# column added to merged views, holding the log id each row comes from
+SOURCE_COLUMN = "Source"
+
+# index entries taken from each log at a time while merging (see `iter_merged`)
+MERGE_CHUNK_ROWS = 1_000
+
+# rows read at a time when a whole merged view is needed (see `get_merged_columns`)
+MERGE_READ_ROWS = 10_000
+
+
+@span("merge")
+def merge_ranges(csv_fpaths, filter_opts=None, facets=None):
+    """Return, for each processed csv in `csv_fpaths`, (`index`, `lo`, `hi`, `kept`) where `index` is its timestamp index
+    (shared, see `load_index`) and `[lo, hi)` the range of its time order (see `build_timestamp_index`) in date range
+    `filter_opts` (all rows if `None`).
+
+    If `facets` (see `parse_facet_opts`) is given, `kept` are the positions in the time order of the rows with the chosen
+    levels and events (shared, see `load_facet_positions`) and `[lo, hi)` is a range of `kept` instead, else `kept` is `None`.
+    Nothing is copied per request: entries are only taken from `index` a chunk at a time (see `range_entries`).
+
+    Raises exception if the date range is invalid (no row of any log in it is a valid, empty selection)."""
+
+    if filter_opts:
+        start_dt, end_dt = filter_opts
+        if not (validate_datetime_str(start_dt) and validate_datetime_str(end_dt)):
+            raise Exception(
+                "Error: Filtering options - start date, end date - not in correct format."
+            )
+
+    ranges = []
+    for csv_fpath in csv_fpaths:
+        index = load_index(csv_fpath)
+
+        if filter_opts:
+            lo = int(np.searchsorted(index["seconds"], seconds_from_datetime_str(start_dt), side="left"))
+            hi = int(np.searchsorted(index["seconds"], seconds_from_datetime_str(end_dt), side="right"))
+        else:
+            lo, hi = 0, len(index["seconds"])
+
+        # keep the time order of rows with chosen levels and events only
+        kept = None
+        if facets:
+            kept = load_facet_positions(csv_fpath, facets)
+            lo, hi = int(np.searchsorted(kept, lo)), int(np.searchsorted(kept, hi))
+
+        ranges.append((index, lo, hi, kept))
+
+    return ranges
+
+
+def range_entries(entry, a, b):
+    """Return (`seconds`, `rows`) of the entries `[a, b)` (relative to `lo`) of range `entry` of `merge_ranges`."""
+
+    index, lo, hi, kept = entry
+    positions = slice(lo + a, lo + b) if kept is None else kept[lo + a : lo + b]
+
+    return index["seconds"][positions], index["rows"][positions]
+
+
+def _count_before(entry, t, side="left"):
+    # number of entries of range `entry` of `merge_ranges` with time before `t` (or at most `t` if `side="right"`),
+    # by binary search on the whole index, then on the positions kept
+    index, lo, hi, kept = entry
+    pos = int(np.searchsorted(index["seconds"], t, side=side))
+    if kept is not None:
+        pos = int(np.searchsorted(kept, pos))
+
+    return min(max(pos, lo), hi) - lo
+
+
+def seek_merged(ranges, offset):
+    """Return start positions (one per log, relative to `lo`, see `merge_ranges`) of the merged time order after its first `offset` rows.
+
+    Found by binary search on time over the sorted timestamps of all logs, so skipping rows costs no merging.
+    Rows with the same timestamp are merged in order of the logs (as in `iter_merged`)."""
+
+    lengths = [hi - lo for _, lo, hi, _ in ranges]
+    if offset >= sum(lengths):
+        return lengths
+
+    def count_before(t):
+        return sum(_count_before(entry, t) for entry in ranges)
+
+    # largest time `t` with at most `offset` rows before it, which is the time of row `offset`
+    lo_t = min(int(range_entries(entry, 0, 1)[0][0]) for entry, n in zip(ranges, lengths) if n)
+    hi_t = max(int(range_entries(entry, n - 1, n)[0][0]) for entry, n in zip(ranges, lengths) if n)
+    while lo_t < hi_t:
+        mid = (lo_t + hi_t + 1) // 2
+        if count_before(mid) <= offset:
+            lo_t = mid
+        else:
+            hi_t = mid - 1
+
+    starts = [_count_before(entry, lo_t) for entry in ranges]
+
+    # skip the remaining rows at time `t`, log by log
+    remaining = offset - sum(starts)
+    for i, entry in enumerate(ranges):
+        skip = min(remaining, _count_before(entry, lo_t, side="right") - starts[i])
+        starts[i] += skip
+        remaining -= skip
+
+    return starts
+
+
+def iter_merged(ranges, starts=None):
+    """Yield (`seconds`, `log`, `row`) for rows of all logs (see `merge_ranges`) in time order, from `starts` (see `seek_merged`),
+    where `log` is the position of the log in `ranges` and `row` the row position in its csv.
+
+    A streaming k-way merge of the (already sorted) time order of each log: only `MERGE_CHUNK_ROWS` index entries
+    per log are taken (see `range_entries`) at a time."""
+
+    if starts is None:
+        starts = [0] * len(ranges)
+
+    def iter_log(i, entry, start):
+        n = entry[2] - entry[1]
+        for a in range(start, n, MERGE_CHUNK_ROWS):
+            seconds, rows = range_entries(entry, a, min(a + MERGE_CHUNK_ROWS, n))
+            yield from zip(seconds.tolist(), repeat(i), rows.tolist())
+
+    return heapq.merge(*(iter_log(i, entry, start) for i, (entry, start) in enumerate(zip(ranges, starts))))
+
+
+def read_merged_rows(csv_fpaths, sources, ranges, merged):
+    """Return header and rows (with `SOURCE_COLUMN` added) of merged rows `merged` (`List` of (`seconds`, `log`, `row`), see `iter_merged`),
+    read from each csv at once via the byte offsets of its timestamp index."""
+
+    header = None
+    by_log = {}
+
+    for i, csv_fpath in enumerate(csv_fpaths):
+        rows = np.array(sorted(row for _, log, row in merged if log == i), dtype=np.int64)
+        log_header, data = read_csv_rows(csv_fpath, row_spans(rows, ranges[i][0]["offsets"]))
+        header = header or log_header
+        by_log[i] = dict(zip(rows.tolist(), data))
+
+    data = [by_log[log][row] + [sources[log]] for _, log, row in merged]
+
+    return header + [SOURCE_COLUMN], data
+
+
+def get_merged_page(csv_fpaths, sources, filter_opts, offset=0, limit=None, facets=None):
+    """Return a page of the merged timeline of processed csvs `csv_fpaths` (as dict, like `get_csv_page`):
+    `limit` rows (all if `None`) starting at row `offset` of all rows in date range `filter_opts` (with levels and events
+    in `facets`, see `merge_ranges`), in time order, with `SOURCE_COLUMN` holding the log id (from `sources`) of each row.
+
+    Only the rows of the page are merged and read (see `seek_merged`), so memory is proportional to the page size.
+    """
+
+    ranges = merge_ranges(csv_fpaths, filter_opts, facets)
+
+    total = sum(hi - lo for _, lo, hi, _ in ranges)
+    end = total if limit is None else min(total, offset + limit)
+
+    merged = list(islice(iter_merged(ranges, seek_merged(ranges, offset)), max(end - offset, 0)))
+    header, data = read_merged_rows(csv_fpaths, sources, ranges, merged)
+
+    return {
+        "header": header,
+        "data": data,
+        "filtered": bool(filter_opts or facets),
+        "facets": facets,
+        "total": total,
+        "offset": offset,
+        "sources": sources,
+    }
+
+
+def get_merged_columns(csv_fpaths, sources, filter_opts, facets=None):
+    """Return the whole merged timeline (see `get_merged_page`) as dict with `"columns"` (one list per header field),
+    like `get_view_columns`. Rows are merged and read `MERGE_READ_ROWS` at a time."""
+
+    ranges = merge_ranges(csv_fpaths, filter_opts, facets)
+    merged = iter_merged(ranges)
+
+    header, columns = None, None
+    while chunk := list(islice(merged, MERGE_READ_ROWS)):
+        header, data = read_merged_rows(csv_fpaths, sources, ranges, chunk)
+        if columns is None:
+            columns = [[] for _ in header]
+        for field, column in enumerate(columns):
+            column.extend(row[field] for row in data)
+
+    if columns is None:
+        header = read_csv_rows(csv_fpaths[0], [])[0] + [SOURCE_COLUMN]
+        columns = [[] for _ in header]
+
+    return {"header": header, "columns": columns, "filtered": bool(filter_opts or facets)}
+
+
+def get_merged_positions(csv_fpaths, sources, filter_opts, facets=None):
+    """Return `(source, csv_fpath, rows)` for each log of the merged timeline, where `rows` are the positions (ascending)
+    of its rows in date range `filter_opts` with levels and events in `facets` (`None` for all rows),
+    e.g. for custom plots (see `CustomPlotPool.run`)."""
+
+    if not filter_opts and not facets:
+        return [(source, csv_fpath, None) for source, csv_fpath in zip(sources, csv_fpaths)]
+
+    ranges = merge_ranges(csv_fpaths, filter_opts, facets)
+
+    return [
+        (source, csv_fpath, np.sort(range_entries(entry, 0, entry[2] - entry[1])[1]))
+        for source, csv_fpath, entry in zip(sources, csv_fpaths, ranges)
+    ]
@@ -0,0 +1,145 @@
+from flask import current_app
+from app.utils.metrics import span
+
+import sqlite3, json, os
+
+# one row per processed log
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    log_id TEXT PRIMARY KEY,
+    original_name TEXT NOT NULL,
+    start_timestamp TEXT,
+    end_timestamp TEXT
+)
+"""
+
+
+def connect_metadata_db(db_fpath=None):
+    """Open a connection to the metadata database (`METADATA_DB_FILE` by default).
+
+    Connections are cheap, so one is opened per operation, which keeps this safe across threads and processes.
+    Writers wait up to 30s for a lock held by another writer.
+    """
+    conn = sqlite3.connect(db_fpath or current_app.config["METADATA_DB_FILE"], timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_metadata_store(db_fpath, json_fpath):
+    """Create the metadata database at `db_fpath` if needed, and migrate entries from the old
+    `metadata.json` at `json_fpath` once (the json file is renamed to `*.migrated` afterwards)."""
+
+    conn = connect_metadata_db(db_fpath)
+    try:
+        # WAL lets readers go on while an upload writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute(SCHEMA)
+
+        # one-time migration
+        if os.path.exists(json_fpath) and os.path.getsize(json_fpath) > 0:
+            try:
+                with open(json_fpath, "r") as f:
+                    old_md = json.load(f)
+            except Exception as e:
+                raise Exception(f"Could not read (metadata file) {json_fpath}: {e}")
+
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO metadata VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            log_id,
+                            md.get("original_name", ""),
+                            md.get("start_timestamp"),
+                            md.get("end_timestamp"),
+                        )
+                        for log_id, md in old_md.items()
+                    ],
+                )
+
+            os.replace(json_fpath, json_fpath + ".migrated")
+            print(f"Migrated {len(old_md)} metadata entries from {json_fpath}")
+    finally:
+        conn.close()
+
+
+@span("metadata_write")
+def set_csv_metadata(log_id, original_name, start_timestamp, end_timestamp):
+    """Add (or replace) the metadata entry for `log_id` atomically. May raise exception."""
+
+    try:
+        conn = connect_metadata_db()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)",
+                    (log_id, original_name, start_timestamp, end_timestamp),
+                )
+        finally:
+            conn.close()
+    except Exception as e:
+        raise Exception(
+            f"Could not write file metadata to {current_app.config['METADATA_DB_FILE']}: {e}"
+        )
+
+
+def get_csv_metadata(log_id):
+    """Return metadata for `log_id` as dict of the form:
+    ```
+    {
+        "original_name": "<original_log_name>",
+        "start_timestamp": "<earliest_timestamp>",
+        "end_timestamp": "<latest_timestamp>",
+    }
+    ```
+
+    May raise exception."""
+
+    try:
+        conn = connect_metadata_db()
+        try:
+            row = conn.execute(
+                "SELECT original_name, start_timestamp, end_timestamp FROM metadata WHERE log_id = ?",
+                (log_id,),
+            ).fetchone()
+        finally:
+            conn.close()
+
+        # check if metadata exists
+        if row is None:
+            raise Exception(f"metadata not found for log_id {log_id}")
+
+        return dict(row)
+
+    except Exception as e:
+        raise Exception(
+            f"Could not read file metadata from {current_app.config['METADATA_DB_FILE']}: {e}"
+        )
+
+
+def get_all_metadata():
+    """Return metadata of all logs as dict `{log_id: metadata}` (see `get_csv_metadata`), in one query.
+
+    May raise exception."""
+
+    try:
+        conn = connect_metadata_db()
+        try:
+            rows = conn.execute("SELECT * FROM metadata").fetchall()
+        finally:
+            conn.close()
+
+        return {
+            row["log_id"]: {
+                "original_name": row["original_name"],
+                "start_timestamp": row["start_timestamp"],
+                "end_timestamp": row["end_timestamp"],
+            }
+            for row in rows
+        }
+
+    except Exception as e:
+        raise Exception(
+            f"Could not read file metadata from {current_app.config['METADATA_DB_FILE']}: {e}"
+        )
@@ -0,0 +1,145 @@
+from flask import g, has_request_context
+
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+# upper bounds (seconds) of the buckets of latency histograms
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# exported metrics: name -> (type, help)
+METRICS = {
+    "log_analyzer_request_duration_seconds": ("histogram", "Latency of HTTP requests, by route, method and status."),
+    "log_analyzer_stage_duration_seconds": ("histogram", "Duration of processing stages (upload, parse, filter, sort, ...), by stage."),
+    "log_analyzer_rows_processed_total": ("counter", "Rows processed, by stage."),
+    "log_analyzer_bytes_read_total": ("counter", "Bytes read from logs and csvs, by stage."),
+}
+
+
+class Metrics:
+    """Thread-safe registry of counters and histograms (of `METRICS`), exported in the Prometheus text format (see `render`)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+
+        self._lock = Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [count per bucket..., sum, count]
+
+    def inc(self, name, value=1, **labels):
+        """Add `value` to counter `name` with `labels`."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Add observation `value` to histogram `name` with `labels`."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += value
+            hist[-1] += 1
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format (version 0.0.4)."""
+
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(hist) for key, hist in self._histograms.items()}
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+
+            for (metric, labels), hist in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                # buckets are cumulative
+                cumulative = 0
+                for bound, n in zip(self.buckets, hist):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound}'),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {hist[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {hist[-2]}")
+                lines.append(f"{name}_count{_labels(labels)} {hist[-1]}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    # `{k="v",...}` with label values escaped, or nothing if no labels
+    if not labels:
+        return ""
+    escaped = (
+        (k, f"{v}".replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+# process-wide metrics, created on first use (see `get_metrics`)
+_metrics = None
+_metrics_lock = Lock()
+
+
+def get_metrics():
+    """Return the process-wide metrics registry."""
+    global _metrics
+    if _metrics is None:
+        # spans may be recorded from several threads at once (requests, plot jobs)
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+    return _metrics
+
+
+def observe_stage(stage, elapsed):
+    """Record `elapsed` seconds spent in processing stage `stage`: observed in `log_analyzer_stage_duration_seconds` and,
+    inside a request, added to the timing breakdown of the request (see `request_timings`)."""
+
+    get_metrics().observe("log_analyzer_stage_duration_seconds", elapsed, stage=stage)
+    if has_request_context():
+        g.setdefault("timings", []).append((stage, elapsed))
+
+
+@contextmanager
+def span(stage):
+    """Time the `with` block (or each call of the decorated function) as processing stage `stage` (see `observe_stage`)."""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def count_rows(stage, n):
+    """Count `n` rows processed by stage `stage`."""
+    get_metrics().inc("log_analyzer_rows_processed_total", n, stage=stage)
+
+
+def count_bytes(stage, n):
+    """Count `n` bytes read by stage `stage`."""
+    get_metrics().inc("log_analyzer_bytes_read_total", n, stage=stage)
+
+
+def request_timings():
+    """Return the timing breakdown of the current request: {stage: (total seconds, number of spans)}, in order of first span."""
+
+    timings = {}
+    for stage, elapsed in g.get("timings", []):
+        total, n = timings.get(stage, (0.0, 0))
+        timings[stage] = (total + elapsed, n + 1)
+    return timings
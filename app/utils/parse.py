@@ -1,7 +1,9 @@
 from flask import current_app
-from app.utils.timestamps import format_timestamp
+from app.utils.timestamps import seconds_from_timestamps
+from app.utils.metrics import span
 
 import os
+import numpy as np
 
 def parse_opts(opts: str):
     """Return `None` if `opts` is empty or all ','-seperated fields are empty, else, return list of strings by splitting at ','."""
@@ -16,40 +18,79 @@ def parse_opts(opts: str):
     return None
 
 
-def sort_data(data, opts):
-    """Sorts parsed csv data based on options"""
-    if not opts:
-        return data
+# sort key of empty/undefined eventid, so that it goes last (in asc order)
+NO_EVENT_ID = 1 << 30
+
+
+def parse_sort_opt(o):
+    """Return (`field (int)`, `reverse (bool)`) for sort option `o`, a string where 1st char = +/-, 2nd char is int [0, 5]"""
+    # NOTE: '+' arrives as ' ' when the query string is not url-encoded
+    if len(o) != 2 or o[0] not in "+- " or o[1] not in "012345":
+        raise ValueError("opt[1] must be one of '012345'.")
+
+    return int(o[1]), o[0] == "-"
+
+
+def typed_column(values, field):
+    """Return integer sort keys (`np.ndarray`) for `values` (`List[str]`) of column `field`,
+    such that sorting the keys sorts the values the way each column should be sorted."""
+
+    # sort by lineid
+    if field == 0:
+        return np.array(values, dtype=np.int64)
+
+    # sort by timestamp
+    if field == 1:
+        return seconds_from_timestamps(values)
 
-    # start sorting from minor
+    # every other column is sorted via its distinct values (far fewer than rows, except for content)
+    uniques, inverse = np.unique(np.array(values, dtype=object), return_inverse=True)
+
+    # sort by eventid
+    # NOTE: assign empty/undefined eventid as last (in asc order)
+    if field == 4:
+        keys = [int(e[1:]) if e else NO_EVENT_ID for e in uniques]
+
+    # sort by level/content/template, rank of value is the key
+    else:
+        return inverse.astype(np.int64)
+
+    return np.array(keys, dtype=np.int64)[inverse]
+
+
+@span("sort")
+def sort_permutation(get_column, opts, selection=None):
+    """Return row positions (`np.ndarray`) in sorted order based on options, using a single stable composite-key sort.
+
+    `get_column(field)` must return the typed keys of column `field` for all rows (see `typed_column`).
+    If `selection` (row positions) is given, only those rows are sorted.
+    """
+
+    # `np.lexsort` sorts by last key first, so add keys from minor to major
+    keys = []
     for o in reversed(opts):
-        # o is string where 1st char = +/-, 2nd char is int [0, 5]
+        field, reverse = parse_sort_opt(o)
 
-        field = int(o[1])
-        reverse = True if o[0] == "-" else False
+        key = get_column(field)
+        if selection is not None:
+            key = key[selection]
 
-        # sort by lineid
-        if field == 0:
-            key = lambda x: int(x[0])
+        keys.append(-key if reverse else key)
 
-        # sort by timestamp/level/content/template
-        elif field in [2, 3, 5]:
-            key = lambda x: x[field]
+    perm = np.lexsort(keys)
 
-        elif field == 1:
-            key = lambda x: format_timestamp(x[1])
+    return perm if selection is None else selection[perm]
 
-        # sort by eventid
-        # NOTE: assign empty/undefined eventid as last (in asc order)
-        elif field == 4:
-            key = lambda x: 7 if not x[4] else int(x[4][1])
 
-        else:
-            raise ValueError("opt[1] must be one of '012345'.")
+def sort_data(data, opts):
+    """Sorts parsed csv data based on options"""
+    if not opts or not data:
+        return data
 
-        data = sorted(data, key=key, reverse=reverse)
+    columns = list(zip(*data))
+    perm = sort_permutation(lambda field: typed_column(columns[field], field), opts)
 
-    return data
+    return [data[i] for i in perm.tolist()]
 
 
 def parse_csv_request(log_id, request):
@@ -75,3 +116,58 @@ def parse_csv_request(log_id, request):
     filter_opts = parse_opts(request.args.get("filter", None))
 
     return csv_fpath, sort_opts, filter_opts
+
+
+def parse_log_ids(log_ids):
+    """Return list of distinct log ids (in order) from `log_ids`, a list or a str of ','-separated ids
+    (several ids select the merged timeline of those logs, see `get_merged_page`).
+
+    Raises `ValueError` if there are none or more than `MERGE_MAX_LOGS`."""
+
+    if isinstance(log_ids, str):
+        log_ids = log_ids.split(",")
+
+    if not isinstance(log_ids, list):
+        raise ValueError("log_id must be a string or a list of strings.")
+
+    log_ids = list(dict.fromkeys(str(i).strip() for i in log_ids if str(i).strip()))
+
+    if not log_ids:
+        raise ValueError("No log id given.")
+
+    if len(log_ids) > current_app.config["MERGE_MAX_LOGS"]:
+        raise ValueError(f"At most {current_app.config['MERGE_MAX_LOGS']} logs can be merged.")
+
+    return log_ids
+
+
+def parse_merged_sort_opts(sort_opts):
+    """Check `sort_opts` for a merged timeline, which is always in time order: only sorting by time (ascending) is allowed.
+
+    Raises `ValueError` otherwise."""
+
+    for o in sort_opts or []:
+        if parse_sort_opt(o) != (1, False):
+            raise ValueError("Merged logs are always in time order, only ascending sort by time is supported.")
+
+
+def parse_page_opts(request):
+    """Returns (`offset (int)`, `limit (int | None)`) from `offset` and `limit` args of `request`.
+
+    `offset` defaults to 0 and `limit` to `None` (all rows). `limit` is capped at `CSV_PAGE_LIMIT`.
+
+    Raises `ValueError` if either is not a non-negative integer."""
+
+    offset = request.args.get("offset", "")
+    limit = request.args.get("limit", "")
+
+    offset = int(offset) if offset else 0
+    limit = int(limit) if limit else None
+
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("offset and limit must be non-negative.")
+
+    if limit is not None:
+        limit = min(limit, current_app.config["CSV_PAGE_LIMIT"])
+
+    return offset, limit
@@ -0,0 +1,168 @@
+from flask import current_app
+from collections import OrderedDict
+from threading import Lock
+
+import hashlib, json, os
+
+# digests of csv contents, per csv version (path, size, mtime)
+_content_digests = {}
+_content_digests_lock = Lock()
+
+
+def content_digest(fpath, block_size=1 << 20):
+    """Return hex digest of the contents of file at `fpath` (computed once per version of the file)."""
+
+    stat = os.stat(fpath)
+    key = (fpath, stat.st_size, stat.st_mtime_ns)
+
+    with _content_digests_lock:
+        digest = _content_digests.get(key)
+    if digest is not None:
+        return digest
+
+    h = hashlib.blake2b(digest_size=20)
+    with open(fpath, "rb") as f:
+        while block := f.read(block_size):
+            h.update(block)
+    digest = h.hexdigest()
+
+    with _content_digests_lock:
+        # keep only the latest version of each file
+        for old_key in [k for k in _content_digests if k[0] == fpath]:
+            del _content_digests[old_key]
+        _content_digests[key] = digest
+
+    return digest
+
+
+def plot_cache_key(csv_fpath, plot_type, filter_opts, style, custom_code=None, facets=None):
+    """Return the cache key of plot `plot_type` of the processed csv at `csv_fpath` (or list of csvs, for merged logs), derived from
+    the csv contents, `plot_type`, `filter_opts` (and level/event filter `facets`, see `parse_facet_opts`),
+    `style` (any json-serializable settings that change the output) and, for custom plots, a hash of `custom_code`."""
+
+    parts = {
+        "content": (
+            content_digest(csv_fpath)
+            if isinstance(csv_fpath, str)
+            else [content_digest(f) for f in csv_fpath]
+        ),
+        "plot_type": plot_type,
+        "filter": list(filter_opts) if filter_opts else None,
+        "facets": facets or None,
+        "style": style,
+        "code": (
+            hashlib.sha256(custom_code.encode()).hexdigest()
+            if plot_type == "custom" and custom_code
+            else None
+        ),
+    }
+
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:24]
+
+
+class PlotCache:
+    """Thread-safe LRU cache of plot files in `folder`, bounded by their total size in bytes.
+
+    Entries are plain file names in `folder`, content-addressed by the caller (see `plot_cache_key`),
+    so a cached file is always valid. Files already in `folder` are picked up on start, oldest first."""
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()  # file name -> size
+        self._lock = Lock()
+
+        # pick up plots from earlier runs
+        files = []
+        for fname in os.listdir(folder):
+            if fname.endswith(".png"):
+                stat = os.stat(os.path.join(folder, fname))
+                files.append((stat.st_mtime, fname, stat.st_size))
+
+        with self._lock:
+            for _, fname, size in sorted(files):
+                self._entries[fname] = size
+                self.nbytes += size
+            self._evict()
+
+    def get(self, fname):
+        """Return whether plot file `fname` is cached (marking it as recently used)."""
+
+        with self._lock:
+            if fname not in self._entries or not os.path.exists(
+                os.path.join(self.folder, fname)
+            ):
+                self.nbytes -= self._entries.pop(fname, 0)
+                self.misses += 1
+                return False
+
+            self.hits += 1
+            self._entries.move_to_end(fname)
+            return True
+
+    def add(self, fname):
+        """Add plot file `fname` (already written to `folder`) to the cache, evicting least recently used plots if needed."""
+
+        size = os.path.getsize(os.path.join(self.folder, fname))
+
+        with self._lock:
+            self.nbytes -= self._entries.pop(fname, 0)
+            self._entries[fname] = size
+            self.nbytes += size
+            self._evict(keep=fname)
+
+    def discard(self, predicate):
+        """Remove plot files whose name satisfies `predicate(fname)` (e.g. plots of an older version of a log)."""
+
+        with self._lock:
+            for fname in [f for f in self._entries if predicate(f)]:
+                self.nbytes -= self._entries.pop(fname)
+                try:
+                    os.remove(os.path.join(self.folder, fname))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _evict(self, keep=None):
+        # expects lock to be held
+        while self.nbytes > self.max_bytes and self._entries:
+            fname = next(iter(self._entries))
+            if fname == keep:
+                break
+
+            self.nbytes -= self._entries.pop(fname)
+            try:
+                os.remove(os.path.join(self.folder, fname))
+            except OSError:
+                pass
+
+
+# shared plot cache, created on first use (see `get_plot_cache`)
+_plot_cache = None
+_plot_cache_lock = Lock()
+
+
+def get_plot_cache():
+    """Return the process-wide plot cache (in `PLOT_FOLDER`, bounded by `PLOT_CACHE_MAX_BYTES`)."""
+    global _plot_cache
+    if _plot_cache is None:
+        # plots published to a second cache would not be found (nor evicted) by the first
+        with _plot_cache_lock:
+            if _plot_cache is None:
+                _plot_cache = PlotCache(
+                    current_app.config["PLOT_FOLDER"], current_app.config["PLOT_CACHE_MAX_BYTES"]
+                )
+    return _plot_cache
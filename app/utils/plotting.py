@@ -1,60 +1,141 @@
 from flask import current_app
-from app.utils.timestamps import timestamp_from_seconds, seconds_from_timestamp
-
-import os, json
+from app.utils.timestamps import timestamp_from_seconds, seconds_from_timestamps
+from app.utils.jobs import get_plot_queue
+from app.utils.plotcache import get_plot_cache
+from app.utils.sandbox import get_custom_plot_pool
+from app.utils.metrics import observe_stage
+from app.utils.files import atomic_write
+
+import os, tempfile, time
 import numpy as np
-import pandas as pd
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MaxNLocator, FuncFormatter
 
-# set non-interactive backend, ideal for this use case
-mpl.use("Agg")
+# style settings, part of the plot cache key (see `plot_cache_key`), so changing them invalidates cached plots
+PLOT_STYLE = "petroff10"
+TITLE_FONT = {
+    "family": "serif",
+    "color": "black",
+    "weight": "normal",
+    "size": 18,
+}
+LABEL_FONT = {
+    "family": "serif",
+    "color": "black",
+    "weight": "normal",
+    "size": 14,
+}
+
+
+# time bins (unit -> seconds) for `events_over_time`, smallest first
+TIME_BINS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 60 * 60,
+    "day": 24 * 60 * 60,
+}
+
+
+# pyplot, imported on first use (see `get_pyplot`): matplotlib takes most of the server startup time otherwise
+_pyplot = None
+
+
+def get_pyplot():
+    """Return `matplotlib.pyplot` (set up with the non-interactive backend), importing it on first use."""
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib as mpl
 
+        # set non-interactive backend, ideal for this use case
+        mpl.use("Agg")
+        import matplotlib.pyplot as plt
 
-def set_plot_generation_status(status_str, plot_files=None, error_str=None):
-    """Set the plot generation status in `PLOT_STATUS_FILE` with `status_str` and `plot_files` if not `None`.
+        _pyplot = plt
+    return _pyplot
+
+
+def plot_style_settings():
+    """Return the style settings (as dict) plots are generated with."""
+    return {"style": PLOT_STYLE, "title_font": TITLE_FONT, "label_font": LABEL_FONT}
+
+
+def set_plot_generation_status(job_id, status_str, plot_files=None, error_str=None):
+    """Set the plot generation status of job `job_id` with `status_str` and `plot_files` if not `None`.
 
     Optionally, if error occurs, `error_str` may be passed.
 
-    `status_str` can be one of `['processing','done','error']`
+    `status_str` can be one of `['processing','done','error']`"""
+    get_plot_queue().update(job_id, status_str, plot_files, error_str if error_str else "")
 
-    Caution: This function may raise an exception but isn't handled!"""
-    PLOT_STATUS_FILE = current_app.config["PLOT_STATUS_FILE"]
 
-    old_status = {}
+def choose_time_bin(span, target_bins, bin_size="auto"):
+    """Return (`unit`, `seconds`) of the time bin for `events_over_time` for data spanning `span` seconds:
+    the smallest of `TIME_BINS` giving at most `target_bins` bins (largest one if none does), or `bin_size` if not `"auto"`."""
 
-    # check if file non-empty
-    if os.path.getsize(PLOT_STATUS_FILE) > 0:
-        try:
-            with open(PLOT_STATUS_FILE, "r") as f:
-                old_status = json.load(f)
-        except Exception as e:
-            raise Exception(
-                f"Could not read plot generation status from {PLOT_STATUS_FILE}: {e}"
-            )
+    if bin_size != "auto":
+        return bin_size, TIME_BINS[bin_size]
 
-    new_status = {
-        "status": status_str,
-        "plot_files": (
-            old_status.get("plot_files", {}) if plot_files is None else plot_files
-        ),
-        "error": error_str if error_str else "",
-    }
-
-    try:
-        with open(PLOT_STATUS_FILE, "w") as f:
-            json.dump(new_status, f)
-    except Exception as e:
+    for unit, seconds in TIME_BINS.items():
+        if span / seconds <= target_bins:
+            return unit, seconds
+
+    return unit, seconds
+
+
+def count_events_over_time(seconds, weights, bin_size, target_bins, max_bins, span=None):
+    """Count events at times `seconds` (`np.ndarray`, each with count `weights` if not `None`) per time bin.
+
+    The bin is chosen with `choose_time_bin` (for `span`, by default the span of `seconds`) and bins are aligned to multiples of it,
+    so counting per-minute counts (see `summarize_log`) per bin of a minute or more is exact.
+    Returns (`unit`, `bin_starts`, `counts`). Raises exception if there would be more than `max_bins` bins."""
+
+    if span is None:
+        span = seconds.max().item() - seconds.min().item() + 1
+    unit, bin_seconds = choose_time_bin(span, target_bins, bin_size)
+
+    ref_point = seconds.min().item() // bin_seconds * bin_seconds
+    if (seconds.max().item() - ref_point) // bin_seconds + 1 > max_bins:
         raise Exception(
-            f"Could not write plot generation status to {PLOT_STATUS_FILE}: {e}"
+            f"Bin size '{unit}' is too small for the time span of the data, choose a larger one."
         )
 
+    counts = np.bincount((seconds - ref_point) // bin_seconds, weights=weights)
+    bin_starts = ref_point + bin_seconds * np.arange(len(counts))
+
+    return unit, bin_starts, counts.astype(np.int64)
+
+
+def needs_rows(summary, plot_opts, bin_size, target_bins):
+    """Whether plots `plot_opts` of an unfiltered log need its raw rows, or can be made from its `summary` only
+    (`events_over_time` needs rows for bins shorter than a minute, custom plots read the rows themselves, see `CustomPlotPool`)."""
+
+    if "events_over_time" in plot_opts:
+        span = summary["end_seconds"] - summary["start_seconds"] + 1
+        _, bin_seconds = choose_time_bin(span, target_bins, bin_size)
+        return bin_seconds < 60
+
+    return False
+
+
+def generate_plots(
+    _app,
+    columns,
+    plot_opts,
+    plot_files,
+    custom_code=None,
+    bin_size="auto",
+    summary=None,
+    custom_data=None,
+    job_id=None,
+):
+    """Generate plots based on `columns: List[List[str]]` (column-wise CSV data, see `parse_csv`), `plot_opts: List[str]`, `plot_files: Dict[str, str]` and `custom_code: str`
+    as plot job `job_id` (see `PlotJobQueue`), which stops early if the job is cancelled.
+
+    `bin_size` is the time bin of `events_over_time`, one of `TIME_BINS` or `"auto"` (see `choose_time_bin`).
 
-def generate_plots(_app, data, plot_opts, plot_files, custom_code=None):
-    """Generate plots based on `data: List[List[str]]`, `plot_opts: List[str]`, `plot_files: Dict[str, str]` and `custom_code: str`
+    If `columns` is `None`, plots are made from the log `summary` (see `summarize_log` and `needs_rows`).
 
-    NOTE: since this code is only called inside a `Thread`, application context is not inherited properly, so pass the `Flask` object as `_app`
+    Custom plots run in the custom plot pool on `custom_data`, a list of `(source, csv_fpath, rows)` (see `CustomPlotPool.run`).
+
+    NOTE: since this code is only called inside a worker thread, application context is not inherited properly, so pass the `Flask` object as `_app`
     """
 
     # Ref: https://flask.palletsprojects.com/en/stable/appcontext/
@@ -62,42 +143,52 @@ def generate_plots(_app, data, plot_opts, plot_files, custom_code=None):
     with _app.app_context():
         PLOT_FOLDER = current_app.config["PLOT_FOLDER"]
 
+        plt = get_pyplot()
+        from matplotlib.ticker import MaxNLocator, FuncFormatter
+
         ### set status to processing
-        set_plot_generation_status(status_str="processing", plot_files=plot_files)
+        set_plot_generation_status(job_id, status_str="processing", plot_files=plot_files)
+
+        def is_cancelled():
+            return get_plot_queue().is_cancelled(job_id)
+
+        def save_plot(fig, plot_type):
+            """Save `fig` as plot file of `plot_type` and cache it, and record its render time (since the previous plot).
 
-        def get_counts(data, key, sort_key=lambda x: x[0]):
-            """Returns counts of items summed over all rows of `data`, where items are extracted using func `key`.
+            Written through a temp file of its own (see `atomic_write`): jobs for the same plot (e.g. a double-clicked
+            request) share the content-addressed file name, and each replaces the file whole."""
+            nonlocal render_start
+            atomic_write(
+                os.path.join(PLOT_FOLDER, plot_files[plot_type]),
+                lambda f: fig.savefig(f, format="png", bbox_inches="tight"),
+            )
+            plt.close(fig)
+            get_plot_cache().add(plot_files[plot_type])
+            observe_stage(f"plot_{plot_type}", time.perf_counter() - render_start)
+            render_start = time.perf_counter()
+
+        def get_counts(column, sort_key=lambda x: x[0]):
+            """Returns counts of items in `column`.
             Returns tuple of two lists: first list containing values, second containing counts, both sorted acc. to `sort_key` (applied to dict.items())
             """
             counts = {}
-            for row in data:
-                value = key(row)
+            for value in column:
                 if value not in counts:
                     counts[value] = 1
                 else:
                     counts[value] += 1
             values, counts = zip(*sorted(counts.items(), key=sort_key))
-            return values, counts
+            return list(values), list(counts)
 
         # `plot_opts` can contain one or more of:
         # [events_over_time, level_distribution, event_code_distribution]
 
         ### set plot style
-        plt.style.use("petroff10")
-
-        ### define fontdicts for title and labels
-        title_font = {
-            "family": "serif",
-            "color": "black",
-            "weight": "normal",
-            "size": 18,
-        }
-        label_font = {
-            "family": "serif",
-            "color": "black",
-            "weight": "normal",
-            "size": 14,
-        }
+        plt.style.use(PLOT_STYLE)
+
+        ### fontdicts for title and labels
+        title_font = TITLE_FONT
+        label_font = LABEL_FONT
 
         # NOTE: Using
         # LineId, Time, Level, Content, EventId
@@ -105,45 +196,44 @@ def generate_plots(_app, data, plot_opts, plot_files, custom_code=None):
 
         ### generate plots based on type
 
+        # start of the plot being rendered (see `save_plot`)
+        render_start = time.perf_counter()
+
         try:
             if "events_over_time" in plot_opts:
                 fig, ax = plt.subplots(figsize=(11, 4))
 
                 fig.tight_layout()
 
-                # convert timestamps to seconds
-                seconds_series = np.array(
-                    [seconds_from_timestamp(row[1]) for row in data]
-                )
-
-                # make all seconds values 0-referenced
-                # ! so that they can be used as index
-                ref_point = seconds_series.min().item()
-                seconds_series -= ref_point
-                size = seconds_series.max().item() + 1
-
-                # generate full range of secondses from start to end with step = 1s
-                secondses_range = np.arange(0, size, 1) + ref_point
-
-                # count occurrences of each seconds
-                unique_secondses, seconds_counts = np.unique(
-                    seconds_series, return_counts=True
+                # count events per time bin, from the summary (per minute counts) if no raw rows are needed
+                if columns is None:
+                    minutes = summary["minutes"]
+                    seconds_series = minutes["start"] + 60 * np.array(minutes["offsets"], dtype=np.int64)
+                    weights = np.array(minutes["counts"], dtype=np.int64)
+                    span = summary["end_seconds"] - summary["start_seconds"] + 1
+                else:
+                    seconds_series = seconds_from_timestamps(columns[1])
+                    weights = span = None
+
+                unit, bin_starts, counts = count_events_over_time(
+                    seconds_series,
+                    weights,
+                    bin_size,
+                    current_app.config["PLOT_TARGET_BINS"],
+                    current_app.config["PLOT_MAX_BINS"],
+                    span,
                 )
 
-                # create full counts array
-                counts = np.zeros_like(secondses_range)
-                counts[unique_secondses] = seconds_counts
-
                 # plot the line graph
                 ax.plot(
-                    secondses_range,
+                    bin_starts,
                     counts,
                     linewidth=1.5,
                 )
 
                 ### set labels and title
                 ax.set_xlabel("Time", fontdict=label_font)
-                ax.set_ylabel("Number of events per second", fontdict=label_font)
+                ax.set_ylabel(f"Number of events per {unit}", fontdict=label_font)
                 ax.set_title(
                     "Events logged with time (Line Graph)", fontdict=title_font
                 )
@@ -176,20 +266,21 @@ def generate_plots(_app, data, plot_opts, plot_files, custom_code=None):
 
                 ax.grid(True, linestyle="--", alpha=0.8)
 
-                # Save the plot
-                fig.savefig(
-                    os.path.join(PLOT_FOLDER, plot_files["events_over_time"]),
-                    format="png",
-                    bbox_inches="tight",
-                )
-                plt.close(fig)
+                # save the plot
+                save_plot(fig, "events_over_time")
+
+            if is_cancelled():
+                return
 
             if "level_distribution" in plot_opts:
                 # square figure
                 fig, ax = plt.subplots(figsize=(8, 8))
 
                 # get level counts
-                levels, level_counts = get_counts(data, lambda row: row[2])
+                if columns is None:
+                    levels, level_counts = map(list, zip(*sorted(summary["levels"].items())))
+                else:
+                    levels, level_counts = get_counts(columns[2])
 
                 # create the pie chart
                 wedges, texts, autotexts = ax.pie(
@@ -207,24 +298,28 @@ def generate_plots(_app, data, plot_opts, plot_files, custom_code=None):
 
                 # ax.axis("equal")
 
-                fig.savefig(
-                    os.path.join(PLOT_FOLDER, plot_files["level_distribution"]),
-                    format="png",
-                    bbox_inches="tight",
-                )
-                plt.close(fig)
+                save_plot(fig, "level_distribution")
+
+            if is_cancelled():
+                return
 
             if "event_code_distribution" in plot_opts:
                 fig, ax = plt.subplots(figsize=(10, 6))
 
                 # get event code wise counts
-                event_codes, event_code_counts = get_counts(data, lambda row: row[4])
+                if columns is None:
+                    event_codes, event_code_counts = map(list, zip(*sorted(summary["events"].items())))
+                else:
+                    event_codes, event_code_counts = get_counts(columns[4])
 
                 # only keep valid labels
-                for i, key in enumerate(event_codes):
-                    if key not in current_app.config["EVENT_CODES"]:
-                        del event_codes[i]
-                        del event_code_counts[i]
+                valid = [
+                    (key, count)
+                    for key, count in zip(event_codes, event_code_counts)
+                    if key in current_app.config["EVENT_CODES"]
+                ]
+                event_codes = [key for key, _ in valid]
+                event_code_counts = [count for _, count in valid]
 
                 # create the bar chart
                 bars = ax.bar(event_codes, event_code_counts)
@@ -250,66 +345,44 @@ def generate_plots(_app, data, plot_opts, plot_files, custom_code=None):
                 ax.yaxis.grid(True, linestyle="--", alpha=0.8)
                 ax.xaxis.grid(False)
 
-                fig.savefig(
-                    os.path.join(PLOT_FOLDER, plot_files["event_code_distribution"]),
-                    format="png",
-                    bbox_inches="tight",
-                )
-                plt.close(fig)
+                save_plot(fig, "event_code_distribution")
 
         except Exception as e:
             print(e)
             set_plot_generation_status(
-                status_str="error", plot_files={}, error_str=f"{e}"
+                job_id, status_str="error", plot_files={}, error_str=f"{e}"
             )
             # ensure all figure are closed
             plt.close("all")
             return
 
+        if is_cancelled():
+            return
+
         # ! doing basic error handling for this part separately
         try:
             if "custom" in plot_opts:
-                # create df from data
-                data_df = pd.DataFrame(
-                    data=data, columns=["LineId", "Time", "Level", "Content", "EventId", "EventTemplate"]
-                )
-
-                # change type to datetime for Time column
-                data_df["Time"] = pd.to_datetime(
-                    data_df["Time"], format="%a %b %d %H:%M:%S %Y"
-                )
-
-                # define a very limited set of variables to export for user-submitted code
-                user_locals = {
-                    "data_df": data_df,
-                    "plt": plt,
-                    "mpl": mpl,
-                    "np": np,
-                    "pd": pd,
-                }
-
-                # block all builtins
-                safe_globals = {
-                    "__builtins__": {},
-                }
-
-                # execute the code
-                # ! ensure more checks, time out check...
-                exec(custom_code, safe_globals, user_locals)
-
-                fig = plt.gcf()
-                fig.savefig(
-                    os.path.join(PLOT_FOLDER, plot_files["custom"]),
-                    format="png",
-                    bbox_inches="tight",
-                )
-                plt.close(fig)
+                # run user code in the custom plot pool, isolated from the server
+                # (the worker writes to a temp file of this job only, moved into place like in `save_plot`)
+                fpath = os.path.join(PLOT_FOLDER, plot_files["custom"])
+                fd, tmp_fpath = tempfile.mkstemp(prefix=plot_files["custom"] + ".", suffix=".tmp", dir=PLOT_FOLDER)
+                os.close(fd)
+                render_start = time.perf_counter()
+                try:
+                    get_custom_plot_pool().run(custom_data, custom_code, tmp_fpath)
+                    os.replace(tmp_fpath, fpath)
+                finally:
+                    if os.path.exists(tmp_fpath):
+                        os.remove(tmp_fpath)
+                get_plot_cache().add(plot_files["custom"])
+                observe_stage("plot_custom", time.perf_counter() - render_start)
 
         except Exception as e:
             print(e)
             # NOTE: if custom code fails, status is still "done" in case other plots were generated (but remove "custom" plot)
             del plot_files["custom"]
             set_plot_generation_status(
+                job_id,
                 status_str="done",
                 plot_files=plot_files,
                 error_str=f"[error in user submitted code]: {e}",
@@ -319,4 +392,4 @@ def generate_plots(_app, data, plot_opts, plot_files, custom_code=None):
             return
 
         ### set status to done
-        set_plot_generation_status(status_str="done", plot_files=plot_files)
+        set_plot_generation_status(job_id, status_str="done", plot_files=plot_files)
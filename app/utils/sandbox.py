@@ -0,0 +1,199 @@
+from flask import current_app
+from app.utils.merge import SOURCE_COLUMN
+from threading import Lock
+
+import os, queue
+import multiprocessing as mp
+
+# heavy modules (and this one, with the worker code) are imported once in the fork server, so workers
+# (and their replacements) start warm. Not the main module: `run.py` would create the app in the fork server
+_mp_context = mp.get_context("forkserver")
+_mp_context.set_forkserver_preload(["app.utils.sandbox", "numpy", "pandas", "matplotlib.pyplot"])
+
+# processed csvs each worker keeps loaded as DataFrames
+WORKER_CACHED_LOGS = 4
+
+
+def _load_csv_df(csv_fpath, cache):
+    """Read processed csv at `csv_fpath` into a DataFrame (cached per csv version in `cache`, for the `WORKER_CACHED_LOGS` latest csvs)."""
+    import pandas as pd
+
+    stat = os.stat(csv_fpath)
+    key = (csv_fpath, stat.st_size, stat.st_mtime_ns)
+
+    df = cache.pop(key, None)
+    if df is None:
+        # all columns as str, like the rows of the csv (empty EventId stays "")
+        df = pd.read_csv(csv_fpath, dtype=str, keep_default_na=False)
+        # change type to datetime for Time column
+        df["Time"] = pd.to_datetime(df["Time"], format="%a %b %d %H:%M:%S %Y")
+
+    # most recently used last
+    cache[key] = df
+    while len(cache) > WORKER_CACHED_LOGS:
+        del cache[next(iter(cache))]
+
+    return df
+
+
+def _load_data_df(parts, cache):
+    """Return `data_df` for custom code from `parts` (see `CustomPlotPool.run`): the selected rows of one log,
+    or of several logs with `SOURCE_COLUMN` in time order (like the merged timeline, see `iter_merged`)."""
+    import pandas as pd
+
+    frames = []
+    for source, csv_fpath, rows in parts:
+        df = _load_csv_df(csv_fpath, cache)
+        # user code must not modify the cached frame
+        df = df.iloc[rows] if rows is not None else df.copy()
+        if source is not None:
+            df = df.assign(**{SOURCE_COLUMN: source})
+        frames.append(df)
+
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+
+    # stable sort keeps rows with equal timestamps in order of logs, then rows
+    return pd.concat(frames, ignore_index=True).sort_values(
+        "Time", kind="stable", ignore_index=True
+    )
+
+
+def _custom_plot_worker(conn, memory_limit):
+    """Worker process of `CustomPlotPool`: runs custom plot jobs received on `conn` until it is closed."""
+
+    import resource
+    import numpy as np
+    import pandas as pd
+    import matplotlib as mpl
+
+    mpl.use("Agg")
+    import matplotlib.pyplot as plt
+
+    # limit address space (after imports, so only the user code counts against it)
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    cache = {}
+
+    while True:
+        try:
+            parts, custom_code, out_fpath = conn.recv()
+        except EOFError:
+            break
+
+        try:
+            data_df = _load_data_df(parts, cache)
+
+            # define a very limited set of variables to export for user-submitted code
+            user_locals = {
+                "data_df": data_df,
+                "plt": plt,
+                "mpl": mpl,
+                "np": np,
+                "pd": pd,
+            }
+
+            # block all builtins
+            safe_globals = {
+                "__builtins__": {},
+            }
+
+            # execute the code on a fresh current figure
+            plt.figure()
+            exec(custom_code, safe_globals, user_locals)
+
+            plt.gcf().savefig(out_fpath, format="png", bbox_inches="tight")
+            result = None
+
+        except MemoryError:
+            result = "memory limit exceeded"
+        except Exception as e:
+            result = f"{e}"
+        finally:
+            plt.close("all")
+            user_locals = data_df = None
+
+        conn.send(result)
+
+
+class CustomPlotPool:
+    """Pool of `workers` pre-started processes running user submitted plot code (see `run`),
+    isolated from the server process.
+
+    Each job runs for at most `timeout` seconds, after which its worker is killed (and replaced),
+    and workers may use at most `memory_limit` bytes of address space (`RLIMIT_AS`, no limit if `0`)."""
+
+    def __init__(self, workers, timeout, memory_limit):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+
+        # idle workers as (process, connection)
+        self._idle = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self):
+        parent_conn, child_conn = _mp_context.Pipe()
+        process = _mp_context.Process(
+            target=_custom_plot_worker,
+            args=(child_conn, self.memory_limit),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def run(self, parts, custom_code, out_fpath):
+        """Run `custom_code` on `data_df` and save the resulting figure to `out_fpath`.
+
+        `parts` is a list of `(source, csv_fpath, rows)`: rows `rows` (positions in file order, all if `None`) of processed csv at `csv_fpath`.
+        `data_df` holds the rows of all parts, with `SOURCE_COLUMN` set to `source` (unless `None`) and in time order if there are several.
+
+        Only the paths and the row positions are sent to the worker, which reads the csvs itself (cached per worker).
+        Waits for a free worker. Raises exception with the error if the code failed, timed out or the worker died."""
+
+        process, conn = self._idle.get()
+
+        try:
+            conn.send((parts, custom_code, out_fpath))
+
+            if not conn.poll(self.timeout):
+                process.kill()
+                process.join()
+                process, conn = self._start_worker()
+                raise Exception(f"custom code timed out (after {self.timeout}s)")
+
+            error = conn.recv()
+
+        except (EOFError, OSError):
+            # worker died, e.g. killed by the OS for using too much memory
+            process.join()
+            process, conn = self._start_worker()
+            raise Exception("custom code worker died (memory limit exceeded?)")
+
+        finally:
+            self._idle.put((process, conn))
+
+        if error is not None:
+            raise Exception(error)
+
+
+# shared custom plot pool, created on first use (see `get_custom_plot_pool`)
+_custom_plot_pool = None
+_custom_plot_pool_lock = Lock()
+
+
+def get_custom_plot_pool():
+    """Return the process-wide custom plot pool (configured by `CUSTOM_PLOT_WORKERS`, `CUSTOM_PLOT_TIMEOUT`
+    and `CUSTOM_PLOT_MEMORY_LIMIT`), starting its workers on first use."""
+    global _custom_plot_pool
+    # workers are processes, so make sure only one pool is ever started
+    with _custom_plot_pool_lock:
+        if _custom_plot_pool is None:
+            _custom_plot_pool = CustomPlotPool(
+                workers=current_app.config["CUSTOM_PLOT_WORKERS"],
+                timeout=current_app.config["CUSTOM_PLOT_TIMEOUT"],
+                memory_limit=current_app.config["CUSTOM_PLOT_MEMORY_LIMIT"],
+            )
+    return _custom_plot_pool
@@ -0,0 +1,310 @@
+from app.utils.csv import parse_csv
+from app.utils.metrics import span
+from app.utils.files import atomic_write, load_csv_npz
+
+import bisect, os, re
+import numpy as np
+
+# tokens of `Content` (lowercased): words (runs of letters and digits), and compound words joined by `._:-/`
+# (e.g. `1.2.3.4`, `jk2_init`, `var/www/html`) so that both `jk2_init` and `init` find a row
+WORD_RE = re.compile(r"[a-z0-9]+|\n")
+COMPOUND_RE = re.compile(r"[a-z0-9]+(?:[._:/-][a-z0-9]+)+|\n")
+
+# query terms: quoted phrases or single terms
+QUERY_TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+# max. terms in one search query
+MAX_QUERY_TERMS = 32
+
+
+def search_index_fpath(csv_fpath):
+    """Path of the search index for processed csv at `csv_fpath`: `{basename_wo_extension}.search.npz`"""
+    return csv_fpath.rsplit(".", 1)[0] + ".search.npz"
+
+
+def tokenize(text):
+    """Return the search tokens of `text` (see `WORD_RE` and `COMPOUND_RE`), words first."""
+    text = text.lower()
+    return WORD_RE.findall(text) + COMPOUND_RE.findall(text)
+
+
+def _tokens_with_rows(text, pattern):
+    # tokens of newline separated `text`, with the row (line) each one is in
+    tokens = np.array(pattern.findall(text), dtype=object)
+    newlines = tokens == "\n"
+    rows = np.cumsum(newlines)
+    return tokens[~newlines], rows[~newlines]
+
+
+def build_search_index(csv_fpath, columns=None):
+    """Build (and save next to the csv) the inverted index of the `Content` column of processed csv at `csv_fpath`
+    (`columns` of the csv, see `parse_csv(..., as_columns=True)`, if already parsed).
+
+    The index holds:
+    - `vocab`: all distinct tokens (see `tokenize`), sorted, utf-8 encoded and concatenated, with `vocab_offsets` (`len(vocab) + 1`)
+    - `postings`: row positions (ascending) of each token concatenated, in order of `vocab`, with `starts` (`len(vocab) + 1`)
+    - `csv_size`, `csv_mtime`: to detect if the csv changed after the index was built
+
+    Tokens are found in one regex pass over all contents (per token kind) instead of row by row. Returns the index as dict.
+    """
+
+    stat = os.stat(csv_fpath)
+
+    if columns is None:
+        _, columns = parse_csv(csv_fpath, as_columns=True)
+
+    vocab, postings, starts = _postings(columns[3])
+
+    return _save_search_index(csv_fpath, vocab, postings, starts, len(columns[3]), stat)
+
+
+class SearchIndexBuilder:
+    """Builds the search index (see `build_search_index`) of a processed csv from blocks of its rows
+    (see `iter_csv_row_blocks`), so it can be built in the same pass over the csv as other indexes.
+
+    The contents of each block are tokenized on their own (see `_postings`), only the postings are kept: as the blocks
+    come in row order, the postings of each token over all blocks are its postings in each block, one after another."""
+
+    def __init__(self):
+        self.ids = {}  # token -> id, in order of first appearance
+        self.token_ids = []
+        self.postings = []
+        self.rows = 0
+
+    def add(self, offsets, rows):
+        vocab, postings, starts = _postings([row[3] for row in rows], self.rows)
+        ids = np.fromiter((self.ids.setdefault(token, len(self.ids)) for token in vocab), dtype=np.int64, count=len(vocab))
+
+        self.token_ids.append(np.repeat(ids, np.diff(starts)))
+        self.postings.append(postings)
+        self.rows += len(rows)
+
+    def save(self, csv_fpath, stat):
+        """Save the index of all rows added next to the csv at `csv_fpath` (`stat` of the csv when it was read), returns it."""
+
+        vocab = sorted(self.ids)
+        rank = np.empty(len(vocab), dtype=np.int64)
+        rank[[self.ids[token] for token in vocab]] = np.arange(len(vocab))
+
+        token_ids = rank[np.concatenate(self.token_ids)] if self.token_ids else np.zeros(0, dtype=np.int64)
+        postings = np.concatenate(self.postings) if self.postings else np.zeros(0, dtype=np.int64)
+
+        # sort by token, a stable sort keeps the rows of each token ascending
+        order = np.argsort(token_ids, kind="stable")
+        token_ids, postings = token_ids[order], postings[order]
+        starts = np.searchsorted(token_ids, np.arange(len(vocab) + 1)).astype(np.int64)
+
+        return _save_search_index(csv_fpath, vocab, postings, starts, self.rows, stat)
+
+
+def extend_search_index(csv_fpath, index, columns, first_row):
+    """Extend search `index` of processed csv at `csv_fpath` (see `build_search_index`) with the rows appended to the csv
+    since `index` was built (and save it), where `columns` are the columns of the appended rows only, starting at row `first_row`.
+
+    Only the appended contents are tokenized. Their rows come after all indexed rows, so the postings of each token
+    are the old ones followed by the new ones, and both are moved into place without sorting. Returns the index as dict.
+    """
+
+    stat = os.stat(csv_fpath)
+
+    old_vocab = [token.decode() for token in _Vocab(index)]
+    old_postings, old_starts = index["postings"].astype(np.int64), index["starts"]
+    new_vocab, new_postings, new_starts = _postings(columns[3], first_row)
+
+    vocab = sorted(set(old_vocab).union(new_vocab))
+    ids = {token: i for i, token in enumerate(vocab)}
+    old_ids = np.array([ids[token] for token in old_vocab], dtype=np.int64)
+    new_ids = np.array([ids[token] for token in new_vocab], dtype=np.int64)
+
+    # postings per token of the merged vocab
+    old_lens = np.zeros(len(vocab), dtype=np.int64)
+    old_lens[old_ids] = np.diff(old_starts)
+    new_lens = np.zeros(len(vocab), dtype=np.int64)
+    new_lens[new_ids] = np.diff(new_starts)
+    starts = np.concatenate(([0], np.cumsum(old_lens + new_lens))).astype(np.int64)
+
+    def destinations(token_ids, token_starts, postings, skip):
+        # position of each posting in the merged postings: start of its token (after `skip` postings) + its rank in the token
+        lens = np.diff(token_starts)
+        tokens = np.repeat(token_ids, lens)
+        rank = np.arange(len(postings)) - np.repeat(token_starts[:-1], lens)
+        return starts[tokens] + skip[tokens] + rank
+
+    postings = np.empty(starts[-1], dtype=np.int64)
+    postings[destinations(old_ids, old_starts, old_postings, np.zeros_like(old_lens))] = old_postings
+    postings[destinations(new_ids, new_starts, new_postings, old_lens)] = new_postings
+
+    return _save_search_index(csv_fpath, vocab, postings, starts, first_row + len(columns[3]), stat)
+
+
+def _postings(contents, first_row=0):
+    # (sorted vocab, postings, starts) of `contents`, see `build_search_index`, with rows numbered from `first_row`
+    text = "\n".join(contents).lower()
+
+    words, word_rows = _tokens_with_rows(text, WORD_RE)
+    compounds, compound_rows = _tokens_with_rows(text, COMPOUND_RE)
+
+    tokens = np.concatenate((words, compounds))
+    rows = np.concatenate((word_rows, compound_rows)).astype(np.int64) + first_row
+
+    # number tokens in order of first appearance (hashing, not sorting all tokens), then renumber in sorted order
+    ids = {}
+    token_ids = np.fromiter((ids.setdefault(token, len(ids)) for token in tokens.tolist()), dtype=np.int64, count=len(tokens))
+    vocab = sorted(ids)
+    rank = np.empty(len(vocab), dtype=np.int64)
+    rank[[ids[token] for token in vocab]] = np.arange(len(vocab))
+    token_ids = rank[token_ids]
+
+    # postings sorted by token, then row, without duplicates (a token repeated in a row)
+    # (words and compounds never share a token, so rows of each token are already ascending and a stable sort keeps them so)
+    order = np.argsort(token_ids, kind="stable")
+    token_ids, rows = token_ids[order], rows[order]
+    keep = np.ones(len(rows), dtype=bool)
+    keep[1:] = (token_ids[1:] != token_ids[:-1]) | (rows[1:] != rows[:-1])
+    token_ids, rows = token_ids[keep], rows[keep]
+
+    return vocab, rows, np.searchsorted(token_ids, np.arange(len(vocab) + 1)).astype(np.int64)
+
+
+def _save_search_index(csv_fpath, vocab, postings, starts, n_rows, stat):
+    # index dict (see `build_search_index`) of sorted `vocab` (`List[str]`), saved next to the csv
+    encoded = [token.encode() for token in vocab]
+
+    index = {
+        "vocab": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "vocab_offsets": np.concatenate(([0], np.cumsum([len(t) for t in encoded]))).astype(np.int64),
+        "postings": postings.astype(np.int32 if n_rows < 2**31 else np.int64),
+        "starts": starts,
+        "csv_size": np.int64(stat.st_size),
+        "csv_mtime": np.int64(stat.st_mtime_ns),
+    }
+
+    # write to temp file first so a concurrent reader never sees a partial index
+    atomic_write(search_index_fpath(csv_fpath), lambda f: np.savez(f, **index))
+
+    return index
+
+
+def load_search_index(csv_fpath):
+    """Return the search index for processed csv at `csv_fpath`, rebuilding it if it is missing or stale."""
+
+    index = load_csv_npz(search_index_fpath(csv_fpath), csv_fpath)
+    if index is not None:
+        return index
+
+    return build_search_index(csv_fpath)
+
+
+class _Vocab:
+    """Sequence view of the (sorted) tokens of a search index, for binary search (tokens are only decoded when compared)."""
+
+    def __init__(self, index):
+        self.blob = index["vocab"]
+        self.offsets = index["vocab_offsets"]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i] : self.offsets[i + 1]].tobytes()
+
+
+def parse_search_query(query):
+    """Parse search `query` into a list of groups (OR-ed) of terms (AND-ed), each term as a list of (`token`, `prefix`)
+    that must all be in a row's `Content`.
+
+    Terms are separated by spaces (AND), `OR` separates groups, `AND` is optional. A quoted phrase is one term
+    matching rows with all its tokens, a term ending with `*` matches tokens starting with it (e.g. `forbid*`).
+    Returns `None` if `query` is empty. Raises `ValueError` if a term has nothing to search for or there are too many."""
+
+    if not query or not query.strip():
+        return None
+
+    groups, terms, n_terms = [], [], 0
+
+    for phrase, word in QUERY_TERM_RE.findall(query):
+        if word in ("OR", "AND"):
+            if word == "OR" and terms:
+                groups.append(terms)
+                terms = []
+            continue
+
+        text = (phrase if phrase else word).lower()
+        prefix = not phrase and text.endswith("*")
+        text = text.rstrip("*")
+
+        tokens = tokenize(text)
+        if not tokens:
+            raise ValueError(f"search term '{text}' has nothing to search for (letters or digits).")
+
+        # tokens at the end of a prefix term are prefixes (e.g. both `init` and `jk2_init` of `jk2_init*`)
+        terms.append([(token, prefix and text.endswith(token)) for token in dict.fromkeys(tokens)])
+        n_terms += 1
+
+    if terms:
+        groups.append(terms)
+
+    if not groups:
+        raise ValueError("search query has no terms.")
+    if n_terms > MAX_QUERY_TERMS:
+        raise ValueError(f"search query has more than {MAX_QUERY_TERMS} terms.")
+
+    return groups
+
+
+def _intersect(a, b):
+    # intersection of ascending unique arrays, binary searching the smaller one in the larger one
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return a
+    pos = np.searchsorted(b, a)
+    pos[pos == len(b)] = 0
+    return a[b[pos] == a]
+
+
+@span("search")
+def search_positions(csv_fpath, query, index=None):
+    """Return positions (ascending) of rows of processed csv at `csv_fpath` whose `Content` matches search `query`
+    (see `parse_search_query`), via the inverted index (see `build_search_index`, loaded if `index` is `None`).
+
+    Raises `ValueError` if the query is invalid."""
+
+    groups = parse_search_query(query)
+
+    if index is None:
+        index = load_search_index(csv_fpath)
+
+    vocab = _Vocab(index)
+    postings, starts = index["postings"], index["starts"]
+
+    def token_rows(token, prefix):
+        token = token.encode()
+        lo = bisect.bisect_left(vocab, token)
+        if not prefix:
+            if lo < len(vocab) and vocab[lo] == token:
+                return postings[starts[lo] : starts[lo + 1]]
+            return postings[:0]
+
+        # all tokens starting with `token` are next to each other in the sorted vocab
+        hi = bisect.bisect_left(vocab, token + b"\xff", lo)
+        if hi - lo <= 1:
+            return postings[starts[lo] : starts[hi]]
+        return np.unique(postings[starts[lo] : starts[hi]])
+
+    result = None
+    for terms in groups:
+        # rarest tokens first, so the intersection shrinks fast
+        rows_per_token = sorted(
+            (token_rows(token, prefix) for term in terms for token, prefix in term), key=len
+        )
+
+        group = rows_per_token[0]
+        for rows in rows_per_token[1:]:
+            if len(group) == 0:
+                break
+            group = _intersect(group, rows)
+
+        result = group if result is None else np.union1d(result, group)
+
+    return result.astype(np.int64)
@@ -0,0 +1,146 @@
+from app.utils.timestamps import seconds_from_timestamps
+from app.utils.csv import parse_csv
+from app.utils.files import atomic_write
+
+import json, os
+import numpy as np
+
+
+def summary_fpath(csv_fpath):
+    """Path of the summary of processed csv at `csv_fpath`: `{basename_wo_extension}.summary.json`"""
+    return csv_fpath.rsplit(".", 1)[0] + ".summary.json"
+
+
+def summarize_log(level_counts, event_counts, timestamp_counts, start_timestamp, end_timestamp):
+    """Build the summary of a log from counts of rows per level, per EventId and per timestamp (dicts),
+    and its earliest and latest timestamps. Returns the summary as dict of the form:
+    ```
+    {
+        "rows": <number of rows>,
+        "start_timestamp": "<earliest_timestamp>",
+        "end_timestamp": "<latest_timestamp>",
+        "start_seconds": <earliest timestamp in seconds>,  # see `seconds_from_timestamp`
+        "end_seconds": <latest timestamp in seconds>,
+        "levels": {level: count},
+        "events": {event_id: count},  # "" for rows matching no template
+        "minutes": {"start": <first minute in seconds>, "offsets": [minutes since start], "counts": [count]},
+    }
+    ```
+    """
+
+    seconds = seconds_from_timestamps(list(timestamp_counts))
+    counts = np.fromiter(timestamp_counts.values(), dtype=np.int64, count=len(timestamp_counts))
+
+    # rows per minute, only minutes with rows are kept
+    minutes, inverse = np.unique(seconds // 60, return_inverse=True)
+    minute_counts = np.bincount(inverse, weights=counts, minlength=len(minutes)).astype(np.int64)
+
+    return {
+        "rows": int(counts.sum()),
+        "start_timestamp": start_timestamp,
+        "end_timestamp": end_timestamp,
+        "start_seconds": int(seconds.min()) if len(seconds) else None,
+        "end_seconds": int(seconds.max()) if len(seconds) else None,
+        "levels": level_counts,
+        "events": event_counts,
+        "minutes": {
+            "start": int(minutes[0]) * 60 if len(minutes) else None,
+            "offsets": (minutes - minutes[0]).tolist() if len(minutes) else [],
+            "counts": minute_counts.tolist(),
+        },
+    }
+
+
+def merge_log_summaries(summary, other):
+    """Return the summary (see `summarize_log`) of a log made of the rows of both `summary` and `other`,
+    e.g. of a log and the rows appended to it."""
+
+    def add_counts(a, b):
+        counts = dict(a)
+        for key, n in b.items():
+            counts[key] = counts.get(key, 0) + n
+        return counts
+
+    # rows per minute of both, by minute (in minutes since epoch of `seconds_from_timestamp`)
+    minutes, minute_counts = [], []
+    for s in (summary, other):
+        if s["minutes"]["start"] is not None:
+            minutes.append(s["minutes"]["start"] // 60 + np.array(s["minutes"]["offsets"], dtype=np.int64))
+            minute_counts.append(np.array(s["minutes"]["counts"], dtype=np.int64))
+
+    if minutes:
+        minutes, inverse = np.unique(np.concatenate(minutes), return_inverse=True)
+        minute_counts = np.bincount(inverse, weights=np.concatenate(minute_counts), minlength=len(minutes)).astype(np.int64)
+
+    # earliest and latest of both, ignoring empty ones
+    both = [s for s in (summary, other) if s["start_seconds"] is not None]
+    first = min(both, key=lambda s: s["start_seconds"], default=summary)
+    last = max(both, key=lambda s: s["end_seconds"], default=summary)
+
+    return {
+        "rows": summary["rows"] + other["rows"],
+        "start_timestamp": first["start_timestamp"],
+        "end_timestamp": last["end_timestamp"],
+        "start_seconds": first["start_seconds"],
+        "end_seconds": last["end_seconds"],
+        "levels": add_counts(summary["levels"], other["levels"]),
+        "events": add_counts(summary["events"], other["events"]),
+        "minutes": {
+            "start": int(minutes[0]) * 60 if len(minutes) else None,
+            "offsets": (minutes - minutes[0]).tolist() if len(minutes) else [],
+            "counts": minute_counts.tolist() if len(minutes) else [],
+        },
+    }
+
+
+def write_log_summary(csv_fpath, summary):
+    """Save `summary` (see `summarize_log`) next to processed csv at `csv_fpath`, along with the csv size and mtime
+    to detect if the csv changed after the summary was written."""
+
+    stat = os.stat(csv_fpath)
+    summary = dict(summary, csv_size=stat.st_size, csv_mtime=stat.st_mtime_ns)
+
+    # write to temp file first so a concurrent reader never sees a partial summary
+    atomic_write(summary_fpath(csv_fpath), lambda f: json.dump(summary, f), mode="w")
+
+    return summary
+
+
+def build_log_summary(csv_fpath):
+    """Build (and save) the summary of processed csv at `csv_fpath` from its rows,
+    for csvs not written by the python ingest engine (which writes the summary while parsing)."""
+
+    _, columns = parse_csv(csv_fpath, as_columns=True)
+    times, levels, event_ids = columns[1], columns[2], columns[4]
+
+    def counts(column):
+        values, n = np.unique(np.array(column, dtype=object), return_counts=True)
+        return dict(zip(values.tolist(), n.tolist()))
+
+    seconds = seconds_from_timestamps(times)
+    start_timestamp = times[seconds.argmin()] if times else None
+    end_timestamp = times[seconds.argmax()] if times else None
+
+    summary = summarize_log(
+        counts(levels), counts(event_ids), counts(times), start_timestamp, end_timestamp
+    )
+
+    return write_log_summary(csv_fpath, summary)
+
+
+def load_log_summary(csv_fpath):
+    """Return the summary (see `summarize_log`) of processed csv at `csv_fpath`, rebuilding it if it is missing or stale."""
+
+    stat = os.stat(csv_fpath)
+
+    try:
+        with open(summary_fpath(csv_fpath), "r") as f:
+            summary = json.load(f)
+
+        if summary["csv_size"] == stat.st_size and summary["csv_mtime"] == stat.st_mtime_ns:
+            return summary
+    except Exception:
+        # missing or unreadable summary
+        pass
+
+    return build_log_summary(csv_fpath)
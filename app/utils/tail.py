@@ -0,0 +1,275 @@
+from flask import current_app
+from app.utils.ingest import InvalidLogLine, LogParser, load_templates
+from app.utils.timestamps import seconds_from_timestamps
+
+import codecs, io, os, time
+import csv as _csv
+from collections import deque
+from threading import Event, Lock, Thread
+
+
+class _RowSink:
+    """File-like target of the `LogParser` of a `LogTailer`: parses the written csv rows back into lists."""
+
+    def __init__(self):
+        self.rows = []
+
+    def write(self, text):
+        self.rows.extend(_csv.reader(io.StringIO(text), strict=False))
+
+
+class LogTailer:
+    """Follows the log at `path` like `tail -F`, in a background thread, keeping the latest rows and event counts in memory.
+
+    Every `poll_interval` seconds the bytes added to the log are read (at most `batch_bytes` at a time) and its complete lines
+    are validated and parsed by one `LogParser` (same checks and templates as an upload, LineIds continue across batches).
+    Invalid lines are counted and skipped instead of stopping the tail.
+
+    Rotation (the path now names another file) is followed once the old file is read to its end, the new file is read
+    from its start. Truncation (the file got smaller than the read position, e.g. `copytruncate`) restarts at its start.
+    When tailing starts, only the last `start_bytes` of the log are read.
+
+    Keeps the latest `max_rows` rows (see `rows`) and the rows per minute of the latest `window_minutes` minutes
+    (see `events`), updated with each batch, so nothing is reparsed when they are read."""
+
+    def __init__(self, path, template_re, template_str, max_rows, window_minutes, poll_interval, batch_bytes, start_bytes):
+        self.path = path
+        self.window_minutes = window_minutes
+        self.poll_interval = poll_interval
+        self.batch_bytes = batch_bytes
+        self.start_bytes = start_bytes
+
+        self._sink = _RowSink()
+        self._parser = LogParser(self._sink, template_re, template_str, header=False)
+
+        # file being followed, its (device, inode) and the incomplete last line read from it
+        self._f = None
+        self._file_id = None
+        self._decoder = None
+        self._partial = ""
+        self._skip_line = False
+
+        self._lock = Lock()
+        self._rows = deque(maxlen=max_rows)
+        self._minutes = {}  # minute (seconds since 0001-01-01) -> rows
+        self._status = {"rotations": 0, "truncations": 0, "invalid": 0, "last_error": ""}
+
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="log-tailer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        if self._f is not None:
+            self._f.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                more = self.poll()
+            except Exception as e:
+                print(f"Error while tailing {self.path}: {e}")
+                with self._lock:
+                    self._status["last_error"] = f"{e}"
+                more = False
+
+            if not more:
+                self._stop.wait(self.poll_interval)
+
+    def poll(self):
+        """Read and ingest the next batch of the log, following rotation and truncation.
+        Returns whether more bytes may be waiting (so the next batch is read without waiting)."""
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            # not created yet, or rotated away and not recreated yet: keep reading the old file
+            st = None
+
+        if self._f is None:
+            if st is None:
+                return False
+            self._open(st, self.start_bytes)
+
+        elif st is not None and (st.st_dev, st.st_ino) != self._file_id:
+            # rotated: finish the old file first
+            if self._read_batch():
+                return True
+            self._end_line()
+            self._f.close()
+            self._open(st, None)
+            self._update_status("rotations")
+
+        elif st is not None and st.st_size < self._f.tell():
+            # truncated in place: start over, the incomplete line is gone
+            self._f.seek(0)
+            self._decoder.reset()
+            self._partial = ""
+            self._skip_line = False
+            self._update_status("truncations")
+
+        return self._read_batch()
+
+    def _open(self, st, last_bytes):
+        # open the log and start reading its last `last_bytes` (all of it if `None`), from the start of a line
+        self._f = open(self.path, "rb")
+        self._file_id = (st.st_dev, st.st_ino)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._partial = ""
+        self._skip_line = False
+
+        if last_bytes is not None and st.st_size > last_bytes:
+            self._f.seek(st.st_size - last_bytes)
+            self._skip_line = True
+
+    def _read_batch(self):
+        # ingest the complete lines of the next `batch_bytes` bytes, returns whether a full batch was read
+        data = self._f.read(self.batch_bytes)
+        if not data:
+            return False
+
+        text = self._partial + self._decoder.decode(data)
+
+        # started in the middle of the log, drop the partial first line
+        if self._skip_line:
+            if "\n" not in text:
+                self._partial = ""
+                return len(data) == self.batch_bytes
+            text = text.split("\n", 1)[1]
+            self._skip_line = False
+
+        lines = text.split("\n")
+        self._partial = lines.pop()
+        self._ingest(lines)
+
+        return len(data) == self.batch_bytes
+
+    def _end_line(self):
+        # the old file ended without a newline, its last line is complete
+        if self._partial:
+            lines, self._partial = [self._partial], ""
+            self._ingest(lines)
+
+    def _ingest(self, lines):
+        parser = self._parser
+        invalid, error = 0, None
+
+        while lines:
+            before = parser.line_count
+            try:
+                parser.feed("\n".join(lines) + "\n")
+                break
+            except InvalidLogLine as e:
+                # skip the invalid line, go on with the rest of the batch
+                invalid += 1
+                error = f"{e}"
+                lines = lines[e.lineno - before :]
+
+        parser.flush()
+        rows, self._sink.rows = self._sink.rows, []
+
+        # rows per timestamp of this batch -> rows per minute
+        counts, parser.timestamp_counts = parser.timestamp_counts, {}
+        minutes = seconds_from_timestamps(list(counts)) // 60 * 60
+
+        with self._lock:
+            self._rows.extend(rows)
+
+            for minute, n in zip(minutes.tolist(), counts.values()):
+                self._minutes[minute] = self._minutes.get(minute, 0) + n
+
+            # drop minutes older than the window (relative to the latest minute seen)
+            if self._minutes:
+                cutoff = max(self._minutes) - (self.window_minutes - 1) * 60
+                for minute in [m for m in self._minutes if m < cutoff]:
+                    del self._minutes[minute]
+
+            self._status["invalid"] += invalid
+            if error is not None:
+                self._status["last_error"] = error
+            self._status.update(parser.stats())
+            self._status["levels"] = dict(parser.level_counts)
+            self._status["events"] = dict(parser.event_counts)
+            self._status["updated"] = time.time()
+
+    def _update_status(self, key):
+        with self._lock:
+            self._status[key] += 1
+
+    def status(self):
+        """Return the state of the tail as dict: `path`, `following` (whether the log was found), `rows` (rows kept),
+        counts of lines, valid and invalid lines, rotations and truncations, rows per level and per EventId, and the last error."""
+
+        with self._lock:
+            status = dict(self._status)
+            status["rows"] = len(self._rows)
+
+        status["path"] = self.path
+        status["following"] = self._file_id is not None
+
+        return status
+
+    def rows(self, since=0, limit=None):
+        """Return (`rows`, `last_id`): the latest `limit` rows kept (all if `None`) with LineId greater than `since`,
+        oldest first, and the LineId of the latest row kept (`since` if none)."""
+
+        with self._lock:
+            if not self._rows:
+                return [], since
+            last_id = int(self._rows[-1][0])
+
+            # rows are kept in LineId order, newest last
+            rows = []
+            for row in reversed(self._rows):
+                if int(row[0]) <= since or (limit is not None and len(rows) >= limit):
+                    break
+                rows.append(row)
+
+        rows.reverse()
+        return rows, last_id
+
+    def events(self):
+        """Return (`minutes`, `counts`): the minutes (seconds since 0001-01-01, ascending) of the rolling window,
+        from the earliest to the latest minute seen, and the rows in each one (0 for minutes without rows)."""
+
+        with self._lock:
+            if not self._minutes:
+                return [], []
+            minutes = list(range(min(self._minutes), max(self._minutes) + 60, 60))
+            counts = [self._minutes.get(m, 0) for m in minutes]
+
+        return minutes, counts
+
+
+# tailer of `TAIL_LOG_PATH`, created and started on first use (see `get_log_tailer`)
+_log_tailer = None
+_log_tailer_lock = Lock()
+
+
+def get_log_tailer():
+    """Return the process-wide tailer of `TAIL_LOG_PATH` (configured by `TAIL_MAX_ROWS`, `TAIL_WINDOW_MINUTES`, ...),
+    started on first use, or `None` if no log is configured."""
+
+    global _log_tailer
+    if _log_tailer is None and current_app.config["TAIL_LOG_PATH"]:
+        # a second tailer would be a second thread following the same log
+        with _log_tailer_lock:
+            if _log_tailer is None:
+                template_re, template_str = load_templates(
+                    current_app.config["TEMPLATE_RE_PATH"], current_app.config["TEMPLATE_STR_PATH"]
+                )
+                _log_tailer = LogTailer(
+                    current_app.config["TAIL_LOG_PATH"],
+                    template_re,
+                    template_str,
+                    max_rows=current_app.config["TAIL_MAX_ROWS"],
+                    window_minutes=current_app.config["TAIL_WINDOW_MINUTES"],
+                    poll_interval=current_app.config["TAIL_POLL_INTERVAL"],
+                    batch_bytes=current_app.config["TAIL_BATCH_BYTES"],
+                    start_bytes=current_app.config["TAIL_START_BYTES"],
+                )
+                _log_tailer.start()
+    return _log_tailer
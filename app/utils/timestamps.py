@@ -1,55 +1,81 @@
 # from flask import current_app
+from datetime import date
+
+import numpy as np
+
+# NOTE: all "seconds" here are seconds elapsed since 0001-01-01 00:00:00
+
+# seconds between 0001-01-01 and 1970-01-01 (epoch of `np.datetime64`)
+EPOCH_OFFSET = 62135596800
+
+# seconds up to the end of 9999-12-31, the last day `datetime.date` can represent
+MAX_SECONDS = date.max.toordinal() * 86400
+
+MONTH_MAP = {
+    "Jan": "01",
+    "Feb": "02",
+    "Mar": "03",
+    "Apr": "04",
+    "May": "05",
+    "Jun": "06",
+    "Jul": "07",
+    "Aug": "08",
+    "Sep": "09",
+    "Oct": "10",
+    "Nov": "11",
+    "Dec": "12",
+}
+
+# days in all months before month `i` (1-indexed) of a non-leap year
+DAYS_BEFORE_MONTH = [0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+
+# month names as integers of their 3 ascii bytes, sorted, and the month number for each (for `seconds_from_timestamps`)
+_month_codes = sorted(
+    (int.from_bytes(m.encode(), "big"), int(n)) for m, n in MONTH_MAP.items()
+)
+_MONTH_CODES = np.array([c for c, _ in _month_codes], dtype=np.int64)
+_MONTH_NUMS = np.array([n for _, n in _month_codes], dtype=np.int64)
+
 
 def seconds_from_timestamp(timestamp):
     """Return number of seconds elapsed between `timestamp` wrt 0001-01-01 00:00:00"""
-    timestamp = format_timestamp(timestamp)
+    return seconds_from_datetime_str(format_timestamp(timestamp))
 
-    def to_seconds(tstmp):
-        if not tstmp:
-            return 0
 
-        d, t = tstmp.split()
-        yr, mo, day = map(int, d.split("-"))
-        hr, mn, sc = map(int, t.split(":"))
+def seconds_from_datetime_str(datetime):
+    """Same as `seconds_from_timestamp`, for `datetime` in YYYY-mm-DD HH:MM:SS format"""
+    if not datetime:
+        return 0
 
-        days_in_month = [
-            31,
-            28 + (1 if (yr % 4 == 0 and (yr % 100 != 0 or yr % 400 == 0)) else 0),
-            31,
-            30,
-            31,
-            30,
-            31,
-            31,
-            30,
-            31,
-            30,
-            31,
-        ]
+    d, t = datetime.split()
+    yr, mo, day = map(int, d.split("-"))
+    hr, mn, sc = map(int, t.split(":"))
 
-        # 1) days from all years before this one (leaps = (N-1)//4 - (N-1)//100 + (N-1)//400)
-        years_prior = yr - 1
-        leaps_prior = years_prior // 4 - years_prior // 100 + years_prior // 400
-        days_prior_years = years_prior * 365 + leaps_prior
+    # 1) days from all years before this one (leaps = (N-1)//4 - (N-1)//100 + (N-1)//400)
+    years_prior = yr - 1
+    leaps_prior = years_prior // 4 - years_prior // 100 + years_prior // 400
+    days_prior_years = years_prior * 365 + leaps_prior
 
-        # 2) days from all months earlier in this year
-        days_prior_months = sum(days_in_month[: mo - 1])
+    # 2) days from all months earlier in this year
+    is_leap = yr % 4 == 0 and (yr % 100 != 0 or yr % 400 == 0)
+    days_prior_months = DAYS_BEFORE_MONTH[mo] + (1 if is_leap and mo > 2 else 0)
 
-        # 3) days before the current day
-        days_prior_days = day - 1
+    # 3) days before the current day
+    days_prior_days = day - 1
 
-        total_days = days_prior_years + days_prior_months + days_prior_days
+    total_days = days_prior_years + days_prior_months + days_prior_days
 
-        # 4) convert to seconds
-        total_seconds = total_days * 86400 + hr * 3600 + mn * 60 + sc
+    # 4) convert to seconds
+    total_seconds = total_days * 86400 + hr * 3600 + mn * 60 + sc
 
-        return total_seconds
-
-    return to_seconds(timestamp)
+    return total_seconds
 
 
 def timestamp_from_seconds(total_seconds, pos=None):
-    """Convert seconds since 0001-01-01 00:00:00 to YYYY-mm-DD HH:MM:SS (`pos` arg is for usage with `matplotlib.ticker.FuncFormatter`)"""
+    """Convert seconds since 0001-01-01 00:00:00 to YYYY-mm-DD HH:MM:SS (`pos` arg is for usage with `matplotlib.ticker.FuncFormatter`).
+    Returns "" for seconds out of that range (or not finite), e.g. ticks of an autoscaled axis."""
+    if not 0 <= total_seconds < MAX_SECONDS:
+        return ""
     total_seconds = int(total_seconds)
     days = total_seconds // 86400
     rem = total_seconds % 86400
@@ -58,61 +84,64 @@ def timestamp_from_seconds(total_seconds, pos=None):
     mn = rem // 60
     sc = rem % 60
 
-    # 2) convert total days into year / month / day
-    # start from year 1 and add year lengths until remaining days is within the year
-    year = 1
-    while True:
-        is_leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
-        days_in_year = 366 if is_leap else 365
-        if days < days_in_year:
-            break
-        days -= days_in_year
-        year += 1
-
-    days_in_month = [
-        31,
-        28 + (1 if (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)) else 0),
-        31,
-        30,
-        31,
-        30,
-        31,
-        31,
-        30,
-        31,
-        30,
-        31,
-    ]
-    month = 1
-    for dim in days_in_month:
-        if days < dim:
-            break
-        days -= dim
-        month += 1
-
-    day = days + 1
-
-    return f"{year:04d}-{month:02d}-{day:02d} {hr:02d}:{mn:02d}:{sc:02d}"
+    # day 0 is 0001-01-01, which is ordinal 1
+    d = date.fromordinal(days + 1)
+
+    return f"{d.year:04d}-{d.month:02d}-{d.day:02d} {hr:02d}:{mn:02d}:{sc:02d}"
+
+
+def seconds_from_timestamps(timestamps):
+    """Batch version of `seconds_from_timestamp`: convert a column of timestamps of the form `Sun Dec 04 04:47:44 2005`
+    (`"%a %b %d %H:%M:%S %Y"`, as `str` or `bytes`) to an `np.ndarray` of seconds (`int64`).
+
+    Fields are read at fixed positions of the ascii bytes, so timestamps must be exactly in this format."""
+
+    b = np.asarray(timestamps, dtype="S24")
+    if b.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    b = b.view(np.uint8).reshape(-1, 24).astype(np.int64)
+
+    def num(*cols):
+        out = np.zeros(len(b), dtype=np.int64)
+        for c in cols:
+            out = out * 10 + (b[:, c] - 48)
+        return out
+
+    # month name -> number
+    codes = (b[:, 4] << 16) | (b[:, 5] << 8) | b[:, 6]
+    month = _MONTH_NUMS[np.searchsorted(_MONTH_CODES, codes)]
+
+    year = num(20, 21, 22, 23)
+    day = num(8, 9)
+
+    # days since 1970-01-01 of the 1st of each month, via datetime64 arithmetic
+    months = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+    days = months.astype("datetime64[D]").astype(np.int64) + day - 1
+
+    return (
+        days * 86400
+        + num(11, 12) * 3600
+        + num(14, 15) * 60
+        + num(17, 18)
+        + EPOCH_OFFSET
+    )
+
+
+def seconds_from_datetime_strs(datetimes):
+    """Batch version of `seconds_from_datetime_str`, for a column of YYYY-mm-DD HH:MM:SS strings"""
+    return np.asarray(datetimes, dtype="datetime64[s]").astype(np.int64) + EPOCH_OFFSET
+
+
+def timestamps_from_seconds(seconds):
+    """Batch version of `timestamp_from_seconds`, returns an `np.ndarray` of YYYY-mm-DD HH:MM:SS strings"""
+    dt = (np.asarray(seconds, dtype=np.int64) - EPOCH_OFFSET).astype("datetime64[s]")
+    return np.char.replace(np.datetime_as_string(dt, unit="s"), "T", " ")
 
 
 def format_timestamp(csvTimestamp):
     _, mo, dt, t, yr = csvTimestamp.split(" ")
 
-    month_map = {
-        "Jan": "01",
-        "Feb": "02",
-        "Mar": "03",
-        "Apr": "04",
-        "May": "05",
-        "Jun": "06",
-        "Jul": "07",
-        "Aug": "08",
-        "Sep": "09",
-        "Oct": "10",
-        "Nov": "11",
-        "Dec": "12",
-    }
-    month = month_map[mo]
+    month = MONTH_MAP[mo]
 
     return f"{yr}-{month}-{dt} {t}"
 
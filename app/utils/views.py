@@ -0,0 +1,340 @@
+from flask import current_app
+from app.utils.csv import read_csv_rows, iter_csv_row_blocks, validate_csv_data, filter_csv_positions, get_csv_data, escape_csv_field
+from app.utils.index import load_timestamp_index, row_spans
+from app.utils.parse import typed_column, sort_permutation
+from app.utils.cache import LRUCache
+from app.utils.search import load_search_index, search_positions
+from app.utils.bitmaps import load_bitmap_index, facet_opts_key, facets_bitmap, select_positions
+from app.utils.metrics import observe_stage, count_rows
+from threading import Lock
+
+import os, time
+import numpy as np
+
+# rows per chunk when streaming a view as csv or reading it as columns (see `iter_view_csv`, `get_view_columns`)
+CSV_STREAM_ROWS = 5_000
+
+# shared cache of opened logs, their indexes, sort keys and view permutations, created on first use (see `get_view_cache`)
+_view_cache = None
+_view_cache_lock = Lock()
+
+
+def get_view_cache():
+    """Return the process-wide cache of opened logs, indexes, sort keys and view permutations
+    (bounded by `VIEW_CACHE_MAX_BYTES`)."""
+    global _view_cache
+    if _view_cache is None:
+        # entries put in a second cache would be lost (and not discarded when a log changes)
+        with _view_cache_lock:
+            if _view_cache is None:
+                _view_cache = LRUCache(current_app.config["VIEW_CACHE_MAX_BYTES"])
+    return _view_cache
+
+
+def load_log(csv_fpath):
+    """Return processed csv at `csv_fpath` opened for reading views (cached), as dict of the form:
+    ```
+    {
+        "csv_fpath": csv_fpath,
+        "size": <csv size>,
+        "mtime": <csv mtime (ns)>,
+        "header": List[str],
+        "n_rows": <number of rows>,
+    }
+    ```
+
+    Rows are not loaded, only the rows of a view that are asked for are read from disk, via their byte offsets
+    in the timestamp index (see `read_view_rows`), so the memory of a view does not grow with the size of the log.
+
+    If the csv changed since it was cached, every cached entry of the old version is dropped.
+
+    May raise exception."""
+
+    cache = get_view_cache()
+    stat = os.stat(csv_fpath)
+    key = ("log", csv_fpath, stat.st_size, stat.st_mtime_ns)
+
+    log = cache.get(key)
+    if log is not None:
+        return log
+
+    # drop everything cached for an older version of this csv
+    cache.discard(lambda k: k[1] == csv_fpath and k[2:4] != key[2:4])
+
+    header, _ = read_csv_rows(csv_fpath, [])
+    validate_csv_data(header, [])
+
+    log = {
+        "csv_fpath": csv_fpath,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "header": header,
+        "n_rows": len(load_index(csv_fpath)["offsets"]) - 1,
+    }
+    cache.put(key, log, sum(len(field) for field in header))
+
+    return log
+
+
+def load_search(csv_fpath):
+    """Return the search index of processed csv at `csv_fpath` (see `build_search_index`), cached in the view cache
+    so that queries do not load it again. May raise exception."""
+
+    cache = get_view_cache()
+    stat = os.stat(csv_fpath)
+    key = ("search", csv_fpath, stat.st_size, stat.st_mtime_ns)
+
+    index = cache.get(key)
+    if index is None:
+        index = load_search_index(csv_fpath)
+        cache.put(key, index, sum(v.nbytes for v in index.values()))
+
+    return index
+
+
+def load_index(csv_fpath):
+    """Return the timestamp index of processed csv at `csv_fpath` (see `build_timestamp_index`), cached in the view cache
+    like `load_search`, so that pages of merged timelines only slice it. May raise exception."""
+
+    cache = get_view_cache()
+    stat = os.stat(csv_fpath)
+    key = ("index", csv_fpath, stat.st_size, stat.st_mtime_ns)
+
+    index = cache.get(key)
+    if index is None:
+        index = load_timestamp_index(csv_fpath)
+        cache.put(key, index, sum(v.nbytes for v in index.values()))
+
+    return index
+
+
+def load_bitmaps(csv_fpath):
+    """Return the bitmap index of processed csv at `csv_fpath` (see `build_bitmap_index`), cached in the view cache
+    like `load_search`. May raise exception."""
+
+    cache = get_view_cache()
+    stat = os.stat(csv_fpath)
+    key = ("bitmap", csv_fpath, stat.st_size, stat.st_mtime_ns)
+
+    index = cache.get(key)
+    if index is None:
+        index = load_bitmap_index(csv_fpath)
+        cache.put(key, index, sum(v.nbytes for v in index.values()))
+
+    return index
+
+
+def load_facet_positions(csv_fpath, facets):
+    """Return the positions (ascending) in the time order of the timestamp index (see `load_index`) of the rows of
+    processed csv at `csv_fpath` with the levels and events in `facets` (see `parse_facet_opts`), cached in the view
+    cache per csv version and `facets`. May raise exception."""
+
+    cache = get_view_cache()
+    stat = os.stat(csv_fpath)
+    key = ("facets", csv_fpath, stat.st_size, stat.st_mtime_ns, facet_opts_key(facets))
+
+    positions = cache.get(key)
+    if positions is None:
+        index = load_index(csv_fpath)
+        bits = facets_bitmap(load_bitmaps(csv_fpath), facets)
+        keep = np.unpackbits(bits, count=len(index["offsets"]) - 1).astype(bool)
+        positions = np.flatnonzero(keep[index["rows"]])
+        cache.put(key, positions, positions.nbytes)
+
+    return positions
+
+
+def typed_key(log, field):
+    """Return sort keys of column `field` of opened `log` (see `load_log`) for all rows, cached in the view cache
+    per csv version and field (apart from the log, so that sorting never needs the rows in memory). May raise exception."""
+
+    cache = get_view_cache()
+    key = ("typed", log["csv_fpath"], log["size"], log["mtime"], field)
+
+    keys = cache.get(key)
+    if keys is not None:
+        return keys
+
+    # timestamps are already converted in the timestamp index, only undo its ordering
+    if field == 1:
+        index = load_index(log["csv_fpath"])
+        keys = np.empty_like(index["seconds"])
+        keys[index["rows"]] = index["seconds"]
+
+    # other columns are read one block of rows at a time, keeping only the values of `field`
+    else:
+        values = [row[field] for _, rows in iter_csv_row_blocks(log["csv_fpath"]) for row in rows]
+        keys = typed_column(values, field)
+
+    cache.put(key, keys, keys.nbytes)
+
+    return keys
+
+
+def get_view(csv_fpath, sort_opts, filter_opts, search=None, facets=None):
+    """Return (`log`, `perm`) for the filtered and sorted view of processed csv at `csv_fpath`,
+    where `log` is the opened csv (see `load_log`) and `perm` holds positions of the rows of the view in order (`None` if the view is all rows in file order).
+
+    If `search` is given, only rows matching the search query are in the view (see `search_positions`),
+    if `facets` is given, only rows with the chosen levels and events (see `select_positions`).
+
+    Permutations are cached per csv version, `sort_opts`, `filter_opts`, `search` and `facets`, so they are only computed once.
+
+    May raise exception."""
+
+    log = load_log(csv_fpath)
+
+    if not sort_opts and not filter_opts and not search and not facets:
+        return log, None
+
+    cache = get_view_cache()
+    key = (
+        "view",
+        csv_fpath,
+        log["size"],
+        log["mtime"],
+        tuple(sort_opts or ()),
+        tuple(filter_opts or ()),
+        search,
+        facet_opts_key(facets),
+    )
+
+    perm = cache.get(key)
+    if perm is not None:
+        return log, perm
+
+    # select rows in date range via timestamp index (and with chosen levels and events via bitmap index)
+    selection = None
+    if filter_opts or facets:
+        try:
+            if facets:
+                selection = select_positions(csv_fpath, filter_opts, facets, load_bitmaps(csv_fpath), load_index(csv_fpath))
+            else:
+                selection, _ = filter_csv_positions(csv_fpath, filter_opts, load_index(csv_fpath))
+        except Exception as e:
+            raise Exception(f"Error filtering CSV {csv_fpath}: {e}")
+
+    # select rows matching search query via inverted index
+    if search:
+        matches = search_positions(csv_fpath, search, load_search(csv_fpath))
+        selection = matches if selection is None else np.intersect1d(selection, matches, assume_unique=True)
+
+    if sort_opts:
+        perm = sort_permutation(lambda field: typed_key(log, field), sort_opts, selection)
+    else:
+        perm = selection
+
+    cache.put(key, perm, perm.nbytes)
+
+    return log, perm
+
+
+def get_view_rows(csv_fpath, sort_opts, filter_opts, search=None, facets=None):
+    """Return (`log`, `perm`) of the filtered (and searched) and sorted view of processed csv at `csv_fpath`,
+    like `get_view`, for either filter engine: with the awk filter (`FILTER_ENGINE`), `log` holds the rows of the
+    filtered and sorted csv in memory (`"rows"`) and `perm` is `None`. Rows of the view are read with `read_view_rows`.
+
+    Views are selections over the csv (see `get_view`), so nothing is written to disk
+    and concurrent requests never share state other than the (read-only) cached permutations.
+
+    May raise exception."""
+
+    # the awk filter works on files only, no views (search, level and event filters always go through the indexes)
+    if filter_opts and not search and not facets and current_app.config["FILTER_ENGINE"] != "index":
+        view = get_csv_data(csv_fpath, sort_opts, filter_opts)
+        return {"header": view["header"], "rows": view["data"], "n_rows": len(view["data"])}, None
+
+    return get_view(csv_fpath, sort_opts, filter_opts, search, facets)
+
+
+def read_view_rows(log, perm, start, end):
+    """Return rows `start` to `end` (excluded) of the view (`log`, `perm`) from `get_view_rows` (`List[List[str]]`), in view order.
+
+    Unless `log` holds its rows, only those rows are read from the csv: in file order, one read per run of consecutive
+    rows (see `row_spans`), via the byte offsets of the timestamp index (see `load_index`). May raise exception."""
+
+    end = min(end, log["n_rows"])
+    positions = np.arange(start, max(start, end)) if perm is None else perm[start:end]
+
+    if "rows" in log:
+        return [log["rows"][i] for i in positions.tolist()]
+
+    order = np.argsort(positions, kind="stable")
+    offsets = load_index(log["csv_fpath"])["offsets"]
+    _, data = read_csv_rows(log["csv_fpath"], row_spans(positions[order], offsets))
+    validate_csv_data(log["header"], data)
+
+    rows = [None] * len(data)
+    for i, row in zip(order.tolist(), data):
+        rows[i] = row
+
+    return rows
+
+
+def get_csv_page(csv_fpath, sort_opts, filter_opts, offset=0, limit=None, search=None, facets=None):
+    """Return a page of CSV data (as dict), `limit` rows (all if `None`) starting at row `offset`
+    of the filtered (and searched, see `get_view`) and sorted view, along with the total number of rows in the view.
+
+    The view is computed once and cached (see `get_view`), so that fetching a page deep into a view
+    does not filter and sort the whole dataset again, and only the rows of the page are read (see `read_view_rows`).
+    """
+
+    log, perm = get_view_rows(csv_fpath, sort_opts, filter_opts, search, facets)
+
+    total = log["n_rows"] if perm is None else len(perm)
+    end = total if limit is None else min(total, offset + limit)
+
+    return {
+        "header": log["header"],
+        "data": read_view_rows(log, perm, offset, end),
+        "filtered": bool(filter_opts or facets),
+        "search": search,
+        "facets": facets,
+        "total": total,
+        "offset": offset,
+    }
+
+
+def get_view_columns(csv_fpath, sort_opts, filter_opts, facets=None):
+    """Return the filtered and sorted view (see `get_view_rows`) as dict with `"columns"` (one list per header field),
+    like `get_csv_data(..., as_columns=True)`. Rows are read `CSV_STREAM_ROWS` at a time.
+
+    May raise exception."""
+
+    log, perm = get_view_rows(csv_fpath, sort_opts, filter_opts, facets=facets)
+
+    total = log["n_rows"] if perm is None else len(perm)
+    columns = [[] for _ in log["header"]]
+
+    for start in range(0, total, CSV_STREAM_ROWS):
+        rows = read_view_rows(log, perm, start, start + CSV_STREAM_ROWS)
+        for field, column in enumerate(columns):
+            column.extend(row[field] for row in rows)
+
+    return {"header": log["header"], "columns": columns, "filtered": bool(filter_opts or facets)}
+
+
+def iter_view_csv(log, perm, chunk_rows=CSV_STREAM_ROWS):
+    """Yield the view (`log`, `perm`) from `get_view_rows` as CSV text, `chunk_rows` rows per chunk.
+
+    Used to stream downloads without writing them to a file first, reading only one chunk of rows at a time."""
+
+    yield ",".join(escape_csv_field(col) for col in log["header"]) + "\n"
+
+    total = log["n_rows"] if perm is None else len(perm)
+
+    # time spent building chunks only, not waiting for the client (recorded after the response headers are sent,
+    # so it is not in the `Server-Timing` header)
+    elapsed = 0.0
+
+    for start in range(0, total, chunk_rows):
+        chunk_start = time.perf_counter()
+        chunk = "".join(
+            ",".join(escape_csv_field(cell) for cell in row) + "\n"
+            for row in read_view_rows(log, perm, start, start + chunk_rows)
+        )
+        elapsed += time.perf_counter() - chunk_start
+        yield chunk
+
+    observe_stage("csv_serialize", elapsed)
+    count_rows("csv_serialize", total)
@@ -0,0 +1 @@
+# benchmark scripts, run from project root as `python -m benchmarks.<name>`
@@ -0,0 +1,126 @@
+"""Benchmark of the buffered CSV reader (`app.utils.csv.parse_csv`) against the old char-by-char reader.
+
+Run from project root:
+
+```bash
+python -m benchmarks.bench_csv --sizes 10000,100000,1000000,5000000
+```
+
+The old reader is timed at every size by default, which takes minutes at 5M rows; pass `--legacy-max` to only time it
+up to that many rows.
+"""
+
+import argparse, os, random, tempfile, time
+
+from app.utils.csv import parse_csv
+
+
+def parse_csv_legacy(filepath):
+    """Old char-by-char CSV reader, kept here only as the baseline for this benchmark."""
+
+    data = []
+
+    with open(filepath, "r") as f:
+        row = []
+        field = ""
+        in_quotes = False
+        while True:
+            char = f.read(1)
+            if not char:
+                if field or row:
+                    row.append(field)
+                    data.append(row)
+                break
+
+            if char == '"':
+                if in_quotes:
+                    next_char = f.read(1)
+                    if next_char == '"':
+                        field += '"'
+                    else:
+                        in_quotes = False
+                        if next_char:
+                            if next_char == ",":
+                                row.append(field)
+                                field = ""
+                            elif next_char == "\n":
+                                row.append(field)
+                                data.append(row)
+                                row = []
+                                field = ""
+                            else:
+                                field += next_char
+                else:
+                    in_quotes = True
+
+            elif char == "," and not in_quotes:
+                row.append(field)
+                field = ""
+
+            elif char == "\n" and not in_quotes:
+                row.append(field)
+                data.append(row)
+                row = []
+                field = ""
+
+            else:
+                field += char
+
+    if not data:
+        return [], []
+    return data[0], data[1:]
+
+
+def write_sample_csv(fpath, n_rows, quoted_ratio=0.05, seed=0):
+    """Write a processed CSV with `n_rows` rows, a fraction of which have quoted `Content` fields."""
+    rng = random.Random(seed)
+    with open(fpath, "w") as f:
+        f.write("LineId,Time,Level,Content,EventId,EventTemplate\n")
+        for i in range(1, n_rows + 1):
+            content = f"jk2_init() Found child {rng.randint(1000, 9999)} in scoreboard slot {rng.randint(1, 9)}"
+            if rng.random() < quoted_ratio:
+                content = f'"{content}, said ""worker"""'
+            f.write(
+                f"{i},Sun Dec 04 04:{i // 60 % 60:02d}:{i % 60:02d} 2005,notice,{content},"
+                "E1,jk2_init() Found child <*> in scoreboard slot <*>\n"
+            )
+
+
+def time_call(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000,5000000")
+    parser.add_argument("--legacy-max", type=int, help="time the old reader only up to this many rows (default: all sizes)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    print(f"{'rows':>10} {'legacy (s)':>12} {'rows (s)':>10} {'columns (s)':>12} {'speedup':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            fpath = os.path.join(tmp, f"{n}.csv")
+            write_sample_csv(fpath, n)
+
+            t_rows, (header, rows) = time_call(parse_csv, fpath)
+            t_cols, _ = time_call(parse_csv, fpath, as_columns=True)
+
+            if args.legacy_max is None or n <= args.legacy_max:
+                t_legacy, (l_header, l_rows) = time_call(parse_csv_legacy, fpath)
+                assert (l_header, l_rows) == (header, rows), "readers disagree"
+                legacy, speedup = f"{t_legacy:12.3f}", f"{t_legacy / t_rows:8.1f}x"
+            else:
+                legacy, speedup = f"{'skipped':>12}", f"{'-':>9}"
+
+            print(f"{n:>10} {legacy} {t_rows:10.3f} {t_cols:12.3f} {speedup}")
+
+            os.remove(fpath)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""Benchmark of the whole pipeline on synthetic logs (see `benchmarks.loggen`): upload (validate, parse and index),
+`parse_csv`, `filter_csv`, `sort_data`, each plot type of `/generate_plots/` and `/get_csv`.
+
+Uploads, plots and `/get_csv` go end-to-end through the Flask test client, on an app whose runtime folders are in a
+temporary directory. Plots and `/get_csv` are timed cold (plot and view caches cleared first), `/get_csv` also warm, and also with a view
+cache budget (`VIEW_CACHE_MAX_BYTES`) below the size of the csv, as for logs too large to be cached whole.
+Each stage is run `--runs` times, the median, min and all times are reported.
+
+Run from project root:
+
+```bash
+python -m benchmarks.bench_pipeline --sizes 10000,100000,1000000 --runs 3 --json bench.json
+```
+
+Use `--matched` and `--span` to change the generated logs, `--skip` to leave out slow stages (e.g. `--skip plots,filter_csv`).
+Compare the json of two runs to see if a change made a stage faster.
+"""
+
+import argparse, contextlib, io, json, os, statistics, sys, tempfile, time
+
+from benchmarks.loggen import generate_log
+
+# stage groups that can be skipped with `--skip`
+STAGE_GROUPS = ["upload", "parse_csv", "filter_csv", "sort_data", "plots", "get_csv"]
+
+PLOT_TYPES = ["events_over_time", "level_distribution", "event_code_distribution", "custom"]
+
+# code of the `custom` plot
+CUSTOM_CODE = 'counts = data_df["Level"].value_counts()\nplt.bar(counts.index, counts.values)'
+
+# seconds to wait for a plot job
+PLOT_TIMEOUT = 600
+
+
+def make_app(tmp):
+    """Create the app with its runtime folders (and metadata store) in `tmp`."""
+
+    from app import create_app
+    from app.utils.metadata import init_metadata_store
+
+    app = create_app()
+    for key, name in (
+        ("UPLOAD_FOLDER", "uploads"),
+        ("PROCESSED_FOLDER", "processed"),
+        ("PLOT_FOLDER", "plots"),
+        ("INSTANCE_FOLDER", "instance"),
+    ):
+        app.config[key] = os.path.join(tmp, name)
+        os.makedirs(app.config[key], exist_ok=True)
+
+    app.config["METADATA_DB_FILE"] = os.path.join(tmp, "instance", "metadata.db")
+    init_metadata_store(app.config["METADATA_DB_FILE"], os.path.join(tmp, "instance", "metadata.json"))
+
+    return app
+
+
+def timed(func, runs):
+    """Run `func()` `runs` times (with its prints silenced), return (times in seconds, result of the last run)."""
+
+    times, result = [], None
+    for _ in range(runs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+    return times, result
+
+
+def run_stage(stages, name, func, runs):
+    """Time stage `name` (see `timed`) into `stages`, or its error if it failed (so one broken stage does not end the run)."""
+
+    try:
+        stages[name] = timed(func, runs)[0]
+    except Exception as e:
+        stages[name] = f"{type(e).__name__}: {e}"
+
+
+def time_range(span, start="2005-12-04 04:47:44"):
+    """Filter options (start, end) for the middle half of a generated log spanning `span` seconds from `start`."""
+
+    from datetime import datetime, timedelta
+
+    start_dt = datetime.strptime(start, "%Y-%m-%d %H:%M:%S")
+    fmt = "%Y-%m-%d %H:%M:%S"
+    return (
+        (start_dt + timedelta(seconds=span // 4)).strftime(fmt),
+        (start_dt + timedelta(seconds=3 * span // 4)).strftime(fmt),
+    )
+
+
+def bench_size(app, tmp, n_lines, args):
+    """Run all stages on a generated log of `n_lines` lines, return {stage: times (seconds) or error} and info on the log."""
+
+    from app.utils import (
+        parse_csv,
+        filter_csv,
+        filter_csv_positions,
+        sort_data,
+        get_plot_cache,
+        get_view_cache,
+    )
+
+    client = app.test_client()
+    stages = {}
+
+    def clear_plots():
+        with app.app_context():
+            get_plot_cache().discard(lambda fname: True)
+
+    def clear_views():
+        with app.app_context():
+            get_view_cache().discard(lambda key: True)
+
+    log_fpath = os.path.join(tmp, f"bench_{n_lines}.log")
+    log_bytes = generate_log(log_fpath, n_lines, args.matched, args.span, seed=args.seed)
+
+    def upload():
+        with open(log_fpath, "rb") as f:
+            response = client.post("/upload", data={"log_file": (f, "bench.log")})
+        result = response.get_json()
+        if not result.get("success"):
+            raise Exception(f"upload failed: {result.get('message')}")
+        return result["log_id"]
+
+    times, log_id = timed(upload, args.runs if "upload" not in args.skip else 1)
+    if "upload" not in args.skip:
+        stages["upload"] = times
+
+    csv_fpath = os.path.join(app.config["PROCESSED_FOLDER"], f"{log_id}.csv")
+    filter_opts = time_range(args.span)
+    filter_arg = ",".join(filter_opts)
+
+    with app.app_context():
+        if "parse_csv" not in args.skip:
+            run_stage(stages, "parse_csv", lambda: parse_csv(csv_fpath), args.runs)
+            run_stage(stages, "parse_csv (columns)", lambda: parse_csv(csv_fpath, as_columns=True), args.runs)
+
+        if "filter_csv" not in args.skip:
+            run_stage(stages, "filter_csv (awk)", lambda: filter_csv(csv_fpath, filter_opts), args.runs)
+            run_stage(
+                stages, "filter_csv_positions (index)", lambda: filter_csv_positions(csv_fpath, filter_opts), args.runs
+            )
+
+        if "sort_data" not in args.skip:
+            _, data = parse_csv(csv_fpath)
+            for name, opts in (("time desc", ["-1"]), ("level, event", ["+2", "+4"]), ("content", ["+3"])):
+                run_stage(stages, f"sort_data ({name})", lambda: sort_data(data, opts), args.runs)
+            del data
+
+    if "plots" not in args.skip:
+        for plot_type in PLOT_TYPES:
+            for label, filter_options in (("", ""), (" filtered", filter_arg)):
+                payload = {
+                    "log_id": log_id,
+                    "plot_options": [plot_type],
+                    "filter_options": filter_options,
+                    "custom_code": CUSTOM_CODE if plot_type == "custom" else None,
+                }
+
+                def plot():
+                    clear_plots()
+                    result = client.post("/generate_plots/", json=payload).get_json()
+                    deadline = time.time() + PLOT_TIMEOUT
+                    while result.get("status") not in ("done", "error", "cancelled"):
+                        if time.time() > deadline:
+                            raise Exception(f"plot {plot_type} timed out")
+                        time.sleep(0.01)
+                        result = client.get(f"/status/{result['job_id']}").get_json()
+                    if result["status"] != "done":
+                        raise Exception(f"plot {plot_type} failed: {result.get('error')}")
+
+                run_stage(stages, f"plot {plot_type}{label}", plot, args.runs)
+
+    if "get_csv" not in args.skip:
+        page = f"offset={n_lines // 2}&limit=1000"
+        for name, query in (
+            ("all", ""),
+            ("page", page),
+            ("page sorted", f"{page}&sort=-3"),
+            ("page filtered", f"{page}&filter={filter_arg}"),
+            ("page search", f"{page}&search=scoreboard"),
+        ):
+
+            def get_csv(cold=True):
+                if cold:
+                    clear_views()
+                response = client.get(f"/get_csv/{log_id}?{query}")
+                if response.status_code != 200:
+                    raise Exception(f"/get_csv failed: {response.get_data(as_text=True)[:200]}")
+                # consume streamed responses
+                return len(response.get_data())
+
+            run_stage(stages, f"get_csv {name}", get_csv, args.runs)
+            run_stage(stages, f"get_csv {name} (warm)", lambda: get_csv(cold=False), args.runs)
+
+            # warm again, but with a cache budget below the csv size (the csv itself never has to fit in the cache)
+            with app.app_context():
+                cache = get_view_cache()
+            max_bytes, cache.max_bytes = cache.max_bytes, os.path.getsize(csv_fpath) // 2
+            clear_views()
+            try:
+                get_csv(cold=False)
+                run_stage(stages, f"get_csv {name} (over budget)", lambda: get_csv(cold=False), args.runs)
+            finally:
+                cache.max_bytes = max_bytes
+
+    os.remove(log_fpath)
+
+    return stages, {"lines": n_lines, "log_bytes": log_bytes, "csv_bytes": os.path.getsize(csv_fpath)}
+
+
+def stage_result(times):
+    """Json result of a stage: median, min and all times (seconds), or its error."""
+
+    if isinstance(times, str):
+        return {"error": times}
+
+    return {
+        "median_s": round(statistics.median(times), 6),
+        "min_s": round(min(times), 6),
+        "runs_s": [round(t, 6) for t in times],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="10000,100000", help="','-separated log sizes (lines), e.g. 10000,1000000,10000000")
+    parser.add_argument("--matched", type=float, default=0.9, help="fraction of lines matching an event template")
+    parser.add_argument("--span", type=int, default=86400, help="seconds from the first to the last line of each log")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--skip", default="", help=f"','-separated stages to skip, of: {','.join(STAGE_GROUPS)}")
+    parser.add_argument("--json", help="path to save results as json")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    args.skip = {s for s in args.skip.split(",") if s}
+    if not args.skip <= set(STAGE_GROUPS):
+        parser.error(f"--skip must be some of {','.join(STAGE_GROUPS)}")
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(tmp)
+
+        for n in sizes:
+            stages, info = bench_size(app, tmp, n, args)
+            results.append({**info, "stages": {name: stage_result(times) for name, times in stages.items()}})
+
+            print(f"\n{n} lines ({info['log_bytes'] / 2**20:.1f} MiB log, {info['csv_bytes'] / 2**20:.1f} MiB csv)")
+            print(f"{'stage':<40} {'median (s)':>11} {'min (s)':>9}")
+            for name, times in stages.items():
+                if isinstance(times, str):
+                    print(f"{name:<40} failed: {times}")
+                else:
+                    print(f"{name:<40} {statistics.median(times):11.4f} {min(times):9.4f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "cpus": os.cpu_count(),
+                    "runs": args.runs,
+                    "matched": args.matched,
+                    "span": args.span,
+                    "seed": args.seed,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark of server startup: time to import the app and run `create_app()`, the slowest imports on the way and peak memory.
+
+Each run is a fresh interpreter (`python -X importtime`), like booting `run.py` or starting a server worker.
+
+Run from project root:
+
+```bash
+python -m benchmarks.bench_startup --runs 5 --top 15
+```
+
+Use `--json <path>` to also save the results, to track them over time.
+"""
+
+import argparse, json, os, statistics, subprocess, sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# modules the server should only load when they are needed (e.g. on first plot request)
+HEAVY_MODULES = ["matplotlib", "matplotlib.pyplot", "pandas"]
+
+# code run in each fresh interpreter, prints its measurements as json
+CHILD_CODE = f"""
+import json, resource, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app()
+print(json.dumps({{
+    "create_app_s": time.perf_counter() - start,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy_loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Parse `-X importtime` output into {module: (self_us, cumulative_us, depth)}."""
+
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return imports
+
+
+def run_once():
+    """Start a fresh interpreter running `create_app()`, return its measurements and imports (see `parse_importtime`)."""
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_CODE],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result, parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to show")
+    parser.add_argument("--json", help="path to save results as json")
+    args = parser.parse_args()
+
+    results, imports = [], []
+    for _ in range(args.runs):
+        result, run_imports = run_once()
+        results.append(result)
+        imports.append(run_imports)
+
+    create_app_s = statistics.median(r["create_app_s"] for r in results)
+    max_rss_mb = statistics.median(r["max_rss_kb"] for r in results) / 1024
+    heavy_loaded = results[-1]["heavy_loaded"]
+
+    # median cumulative import time per module, over the runs it was imported in
+    modules = {name for run_imports in imports for name in run_imports}
+    cumulative = {
+        name: statistics.median(run_imports[name][1] for run_imports in imports if name in run_imports)
+        for name in modules
+    }
+    top_level = {name for name in modules if imports[-1].get(name, (0, 0, 1))[2] == 0}
+    slowest = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[: args.top]
+
+    print(f"runs:                 {args.runs}")
+    print(f"import + create_app:  {create_app_s * 1000:.1f} ms (median)")
+    print(f"peak memory (RSS):    {max_rss_mb:.1f} MiB (median)")
+    print(f"modules imported:     {len(imports[-1])}")
+    print(f"heavy modules loaded: {', '.join(heavy_loaded) if heavy_loaded else 'none'}")
+    print()
+    print(f"{'cumulative (ms)':>16}  module")
+    for name, us in slowest:
+        marker = "" if name in top_level else "  "
+        print(f"{us / 1000:16.1f}  {marker}{name}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "runs": args.runs,
+                    "python": sys.version.split()[0],
+                    "create_app_ms": round(create_app_s * 1000, 1),
+                    "max_rss_mb": round(max_rss_mb, 1),
+                    "modules_imported": len(imports[-1]),
+                    "heavy_loaded": heavy_loaded,
+                    "slowest_imports_ms": {name: round(us / 1000, 1) for name, us in slowest},
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Deterministic generator of synthetic Apache error logs, for benchmarks.
+
+Lines are in the format checked by `bash/validate_parse.awk`. A `--matched` fraction of them have contents matching
+the event templates of `bash/template-data/apache_re` (E1 to E6), the rest match none. Timestamps increase evenly over
+`--span` seconds from `--start`. The same arguments (and `--seed`) always give the same log.
+
+Run from project root:
+
+```bash
+python -m benchmarks.loggen --lines 1000000 --matched 0.9 --span 86400 -o /tmp/apache_1M.log
+```
+"""
+
+import argparse, random
+from datetime import datetime, timedelta
+
+# content generators of lines matching each event template (in order of `apache_re`), with the level they are logged at
+MATCHED_CONTENTS = [
+    ("notice", lambda rng: f"jk2_init() Found child {rng.randint(1000, 32000)} in scoreboard slot {rng.randint(1, 12)}"),
+    ("notice", lambda rng: "workerEnv.init() ok /etc/httpd/conf/workers2.properties"),
+    ("error", lambda rng: f"mod_jk child workerEnv in error state {rng.randint(1, 10)}"),
+    ("error", lambda rng: f"[client {_ip(rng)}] Directory index forbidden by rule: /var/www/html/{rng.choice(_DIRS)}"),
+    ("error", lambda rng: f"jk2_init() Can't find child {rng.randint(1000, 32000)} in scoreboard"),
+    ("notice", lambda rng: f"mod_jk child init {rng.randint(1, 2)} -{rng.randint(1, 2)}"),
+]
+
+# content generators of lines matching no template (some with commas and quotes, which get quoted in the csv)
+UNMATCHED_CONTENTS = [
+    ("error", lambda rng: f"[client {_ip(rng)}] File does not exist: /var/www/html/{rng.choice(_DIRS)}robots.txt"),
+    ("warn", lambda rng: f'something, "odd" happened {rng.randint(1000, 9999)}'),
+    ("error", lambda rng: f"[client {_ip(rng)}] script not found or unable to stat: /var/www/cgi-bin/{rng.choice(_DIRS)}"),
+    ("notice", lambda rng: "Digest: generating secret for digest authentication ..."),
+]
+
+_DIRS = ["", "icons/", "manual/", "usage/", "awstats/", "phpmyadmin/"]
+
+# lines written at a time
+WRITE_LINES = 10_000
+
+
+def _ip(rng):
+    return f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+
+
+def iter_log_lines(lines, matched=0.9, span=86400, start="2005-12-04 04:47:44", seed=0):
+    """Yield `lines` synthetic log lines (without newline): a `matched` fraction match an event template,
+    timestamps go from `start` (YYYY-mm-DD HH:MM:SS) to `start + span` seconds. Deterministic for a given `seed`."""
+
+    rng = random.Random(seed)
+    start_dt = datetime.strptime(start, "%Y-%m-%d %H:%M:%S")
+
+    for i in range(lines):
+        contents = MATCHED_CONTENTS if rng.random() < matched else UNMATCHED_CONTENTS
+        level, content = rng.choice(contents)
+        timestamp = start_dt + timedelta(seconds=i * span // max(lines, 1))
+
+        yield f"[{timestamp.strftime('%a %b %d %H:%M:%S %Y')}] [{level}] {content(rng)}"
+
+
+def generate_log(fpath, lines, matched=0.9, span=86400, start="2005-12-04 04:47:44", seed=0):
+    """Write a synthetic log (see `iter_log_lines`) to `fpath`. Returns its size in bytes."""
+
+    size = 0
+    chunk = []
+
+    with open(fpath, "w") as f:
+        for line in iter_log_lines(lines, matched, span, start, seed):
+            chunk.append(line)
+            if len(chunk) == WRITE_LINES:
+                size += f.write("\n".join(chunk) + "\n")
+                chunk = []
+        if chunk:
+            size += f.write("\n".join(chunk) + "\n")
+
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--lines", type=int, default=100_000)
+    parser.add_argument("--matched", type=float, default=0.9, help="fraction of lines matching an event template")
+    parser.add_argument("--span", type=int, default=86400, help="seconds from the first to the last line")
+    parser.add_argument("--start", default="2005-12-04 04:47:44", help="timestamp of the first line")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--out", required=True, help="path of the log to write")
+    args = parser.parse_args()
+
+    size = generate_log(args.out, args.lines, args.matched, args.span, args.start, args.seed)
+    print(f"wrote {args.lines} lines ({size / 2**20:.1f} MiB) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
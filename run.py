@@ -1,6 +1,8 @@
 from app import create_app
 
-app = create_app()
+# workers of the custom plot pool import this module again (as `__mp_main__`) and must not create the app
+if __name__ != "__mp_main__":
+    app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
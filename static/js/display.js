@@ -6,6 +6,7 @@ import {
 	setSortOpts,
 	getSortOpts,
 	resetSortOpts,
+	setSearchOpts,
 	resetFilterOpts,
 	setFilterRange,
 	getDatetimeBoundsFromData,
@@ -13,6 +14,9 @@ import {
 	getMetadataRequestURL,
 	fmtTimestamp,
 	resetFilterValues,
+	parseFacetInputs,
+	setFacetOpts,
+	resetFacetOpts,
 } from "./utils.js";
 
 // define elements
@@ -28,6 +32,9 @@ const sortResetBtn = document.getElementById('sort-reset-btn');
 const filterApplyBtn = document.getElementById('filter-apply-btn');
 const filterResetBtn = document.getElementById('filter-reset-btn');
 
+const searchInput = document.getElementById('search-input');
+const searchBtn = document.getElementById('search-btn');
+
 let oldSelectedId = selectEl.value;
 
 // ====================== event listeners =======================
@@ -41,6 +48,7 @@ selectEl.addEventListener('click', () => {
 	if (selectEl.value && selectEl.value !== oldSelectedId) {
 		oldSelectedId = selectEl.value;
 		resetFilterValues();
+		resetFacetOpts();
 		updateFilterOptsValues();
 	}
 	updateTable();
@@ -56,11 +64,18 @@ sortResetBtn.addEventListener('click', () => {
 
 // filter reset
 filterResetBtn.addEventListener('click', () => {
+	resetFacetOpts();
 	updateTable();
 	updateFilterOptsValues();
 	updateFilterValues(true);
 });
 
+// search (button or enter in the search box)
+searchBtn.addEventListener('click', searchBtnCallback);
+searchInput.addEventListener('keydown', (event) => {
+	if (event.key === 'Enter') searchBtnCallback();
+});
+
 // ====================== callback functions =======================
 
 // get datetime, validate and set values and update table
@@ -72,6 +87,14 @@ function filterBtnCallback() {
 	}
 
 	setFilterOpts(startDatetime, endDatetime);
+
+	const { level, event } = parseFacetInputs();
+	setFacetOpts(level, event);
+	updateTable();
+}
+
+function searchBtnCallback() {
+	setSearchOpts(searchInput.value);
 	updateTable();
 }
 
@@ -83,6 +106,52 @@ function sortBtnCallback(type, field) {
 
 // ====================== table handling =======================
 
+// rows are fetched in pages and only the rows around the visible part of the table are rendered
+const PAGE_SIZE = 200;
+// extra rows rendered above and below the visible part
+const BUFFER_ROWS = 40;
+// browsers cap element heights, so very long tables are scrolled proportionally
+const MAX_SCROLL_HEIGHT = 10_000_000;
+// used until a real row has been rendered
+const DEFAULT_ROW_HEIGHT = 35;
+
+// state of the currently displayed view
+let view = {
+	logId: null,
+	numCols: 0,
+	total: 0,
+	rowHeight: 0,
+	pages: new Map(),    // page number -> rows
+	pending: new Map(),  // page number -> promise of in-flight request
+	generation: 0,       // bumped on every new view, to drop stale responses
+};
+
+// fetch page `pageNo` of current view (once)
+function fetchPage(pageNo) {
+	if (view.pending.has(pageNo)) return view.pending.get(pageNo);
+
+	const generation = view.generation;
+	const reqURL = getCSVRequestURL(view.logId, false, pageNo * PAGE_SIZE, PAGE_SIZE);
+	console.log(`Making HTTP request: ${reqURL}`);
+
+	const promise = fetch(reqURL)
+		.then(response => {
+			if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+			return response.json();
+		})
+		.then(result => {
+			if (result.error) throw new Error(result.error);
+			if (generation === view.generation) view.pages.set(pageNo, result.data);
+			return result;
+		})
+		.finally(() => {
+			if (generation === view.generation) view.pending.delete(pageNo);
+		});
+
+	view.pending.set(pageNo, promise);
+	return promise;
+}
+
 async function updateTable() {
 	const selectedLogId = selectEl.value;
 
@@ -91,6 +160,18 @@ async function updateTable() {
 	logTable.querySelector('tbody').innerHTML = '';
 	errorMessage.style.display = 'none';
 	controlsDiv.style.display = 'none';
+	displayArea.scrollTop = 0;
+
+	// reset view
+	view = {
+		logId: selectedLogId,
+		numCols: 0,
+		total: 0,
+		rowHeight: 0,
+		pages: new Map(),
+		pending: new Map(),
+		generation: view.generation + 1,
+	};
 
 	const parsedSortOpts = getSortOpts();
 
@@ -98,16 +179,13 @@ async function updateTable() {
 
 	loadingMessage.style.display = 'block';
 
-	const reqURL = getCSVRequestURL(selectedLogId, false);
-	console.log(`Making HTTP request: ${reqURL}`);
-
-	// make new request for csv data
+	// make new request for first page of csv data
 	try {
-		const response = await fetch(reqURL);
-		if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-		const result = await response.json();
+		const generation = view.generation;
+		const result = await fetchPage(0);
 
-		if (result.error) return showError(`Error loading data: ${result.error}`);
+		// a newer view was requested meanwhile
+		if (generation !== view.generation) return;
 
 		// populate header
 		const thead = logTable.querySelector('thead');
@@ -137,17 +215,11 @@ async function updateTable() {
 		});
 		thead.appendChild(headerRow);
 
+		view.numCols = result.header.length;
+		view.total = result.total;
+
 		// populate body
-		const tbody = logTable.querySelector('tbody');
-		result.data.forEach(rowData => {
-			const tr = document.createElement('tr');
-			rowData.forEach(cellData => {
-				const td = document.createElement('td');
-				td.textContent = cellData;
-				tr.appendChild(td);
-			});
-			tbody.appendChild(tr);
-		});
+		renderRows();
 
 		// display controls
 		controlsDiv.style.display = 'flex';
@@ -160,6 +232,92 @@ async function updateTable() {
 	loadingMessage.style.display = 'none';
 }
 
+// render the rows around the visible part of the table, with spacer rows standing in for the rest
+function renderRows() {
+	const tbody = logTable.querySelector('tbody');
+	if (!view.total) {
+		tbody.innerHTML = '';
+		return;
+	}
+
+	const rowHeight = view.rowHeight || DEFAULT_ROW_HEIGHT;
+	const totalHeight = Math.min(view.total * rowHeight, MAX_SCROLL_HEIGHT);
+	const visibleRows = Math.ceil(displayArea.clientHeight / rowHeight);
+
+	// position of the first visible row (fractional), scaled if table is capped in height
+	const maxScroll = Math.max(1, totalHeight - displayArea.clientHeight);
+	const scrollTop = displayArea.scrollTop;
+	const pos = Math.min(1, scrollTop / maxScroll) * Math.max(0, view.total - visibleRows);
+	const firstVisible = Math.floor(pos);
+
+	// keep `first` even so that row striping does not flicker
+	let first = Math.max(0, firstVisible - BUFFER_ROWS);
+	first -= first % 2;
+	const last = Math.min(view.total, firstVisible + visibleRows + BUFFER_ROWS);
+
+	// fetch missing pages first, then render again
+	const missing = [];
+	for (let p = Math.floor(first / PAGE_SIZE); p <= Math.floor((last - 1) / PAGE_SIZE); p++) {
+		if (!view.pages.has(p)) missing.push(p);
+	}
+	if (missing.length) {
+		const generation = view.generation;
+		Promise.all(missing.map(fetchPage))
+			.then(() => { if (generation === view.generation) renderRows(); })
+			.catch(err => showError(`Error fetching CSV data: ${err.message}`));
+		return;
+	}
+
+	tbody.innerHTML = '';
+
+	const topHeight = Math.max(0, scrollTop - (pos - first) * rowHeight);
+	tbody.appendChild(makeSpacerRow(topHeight));
+
+	for (let i = first; i < last; i++) {
+		const rowData = view.pages.get(Math.floor(i / PAGE_SIZE))[i % PAGE_SIZE];
+		const tr = document.createElement('tr');
+		rowData.forEach(cellData => {
+			const td = document.createElement('td');
+			td.textContent = cellData;
+			tr.appendChild(td);
+		});
+		tbody.appendChild(tr);
+	}
+
+	const bottomHeight = Math.max(0, totalHeight - topHeight - (last - first) * rowHeight);
+	tbody.appendChild(makeSpacerRow(bottomHeight));
+
+	// measure real row height once, and render again with it
+	if (!view.rowHeight && last > first) {
+		const measured = tbody.children[1].getBoundingClientRect().height;
+		if (measured > 0) {
+			view.rowHeight = measured;
+			renderRows();
+		}
+	}
+}
+
+function makeSpacerRow(height) {
+	const tr = document.createElement('tr');
+	tr.classList.add('spacer-row');
+	const td = document.createElement('td');
+	td.colSpan = view.numCols;
+	td.style.height = `${height}px`;
+	tr.appendChild(td);
+	return tr;
+}
+
+// re-render on scroll (at most once per frame)
+let renderScheduled = false;
+displayArea.addEventListener('scroll', () => {
+	if (renderScheduled) return;
+	renderScheduled = true;
+	requestAnimationFrame(() => {
+		renderScheduled = false;
+		renderRows();
+	});
+});
+
 // ===================== helper ========================
 
 // update filter options with provided values
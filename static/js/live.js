@@ -0,0 +1,134 @@
+import {
+	getTailRowsRequestURL,
+	getTailEventsRequestURL,
+} from "./utils.js";
+
+// live tail panel (display page: latest rows, plots page: rolling events over time chart),
+// polled from the incremental state of the server side tail, so nothing is reparsed on refresh
+
+// define elements
+const liveStatus = document.getElementById('live-tail-status');
+const livePause = document.getElementById('live-tail-pause');
+const liveTable = document.getElementById('live-tail-table');
+const liveChart = document.getElementById('live-tail-chart');
+
+// milliseconds between polls, rows shown in the table
+const POLL_MS = 2000;
+const MAX_ROWS = 200;
+
+// LineId of the latest row received
+let lastId = 0;
+
+function setStatus(text, isError = false) {
+	liveStatus.textContent = text;
+	liveStatus.style.color = isError ? 'red' : '';
+}
+
+async function fetchJSON(url) {
+	const response = await fetch(url, { cache: 'no-store' });
+	const result = await response.json();
+	if (!response.ok) throw new Error(result.error || `HTTP ${response.status}`);
+	return result;
+}
+
+// ============================ latest rows (display page) ============================
+async function pollRows() {
+	const result = await fetchJSON(getTailRowsRequestURL(lastId, MAX_ROWS));
+
+	const thead = liveTable.querySelector('thead');
+	const tbody = liveTable.querySelector('tbody');
+
+	if (!thead.rows.length) {
+		const tr = thead.insertRow();
+		result.header.forEach(name => {
+			const th = document.createElement('th');
+			th.textContent = name;
+			tr.appendChild(th);
+		});
+	}
+
+	// LineIds started over (the server restarted)
+	if (result.last_id < lastId) {
+		tbody.replaceChildren();
+		lastId = 0;
+		return pollRows();
+	}
+
+	// newest rows on top
+	result.data.forEach(row => {
+		const tr = tbody.insertRow(0);
+		row.forEach(field => {
+			tr.insertCell().textContent = field;
+		});
+	});
+	while (tbody.rows.length > MAX_ROWS) tbody.deleteRow(-1);
+
+	lastId = result.last_id;
+	setStatus(`Latest ${tbody.rows.length} rows (last LineId ${lastId}), updated ${new Date().toLocaleTimeString()}`);
+}
+
+// ====================== rolling events over time (plots page) ======================
+async function pollEvents() {
+	const result = await fetchJSON(getTailEventsRequestURL());
+	drawChart(result.times, result.counts);
+	const total = result.counts.reduce((a, b) => a + b, 0);
+	setStatus(`${total} events in the last ${result.window_minutes} minutes of the log, updated ${new Date().toLocaleTimeString()}`);
+}
+
+// line chart of `counts` per minute, drawn on the canvas directly
+function drawChart(times, counts) {
+	const ctx = liveChart.getContext('2d');
+	const { width, height } = liveChart;
+	const pad = { left: 50, right: 15, top: 15, bottom: 35 };
+
+	ctx.clearRect(0, 0, width, height);
+	ctx.font = '11px sans-serif';
+	ctx.fillStyle = '#333';
+	ctx.strokeStyle = '#bbb';
+
+	if (!counts.length) {
+		ctx.fillText('No events yet.', pad.left, height / 2);
+		return;
+	}
+
+	const maxCount = Math.max(...counts);
+	const x = i => pad.left + (counts.length > 1 ? i / (counts.length - 1) : 0.5) * (width - pad.left - pad.right);
+	const y = v => height - pad.bottom - (v / maxCount) * (height - pad.top - pad.bottom);
+
+	// axes, with max. count and first/last minute as labels
+	ctx.beginPath();
+	ctx.moveTo(pad.left, pad.top);
+	ctx.lineTo(pad.left, height - pad.bottom);
+	ctx.lineTo(width - pad.right, height - pad.bottom);
+	ctx.stroke();
+
+	ctx.textAlign = 'right';
+	ctx.fillText(`${maxCount}`, pad.left - 5, pad.top + 5);
+	ctx.fillText('0', pad.left - 5, height - pad.bottom);
+	ctx.fillText(times[times.length - 1].slice(0, 16), width - pad.right, height - pad.bottom + 20);
+	ctx.textAlign = 'left';
+	ctx.fillText(times[0].slice(0, 16), pad.left, height - pad.bottom + 20);
+
+	ctx.beginPath();
+	ctx.strokeStyle = '#008cff';
+	ctx.lineWidth = 2;
+	counts.forEach((v, i) => (i ? ctx.lineTo(x(i), y(v)) : ctx.moveTo(x(i), y(v))));
+	ctx.stroke();
+	ctx.lineWidth = 1;
+}
+
+// ============================ polling ============================
+const poll = liveTable ? pollRows : pollEvents;
+
+async function loop() {
+	if (!livePause.checked) {
+		try {
+			await poll();
+		} catch (err) {
+			setStatus(`Error fetching live tail: ${err.message}`, true);
+		}
+	}
+	setTimeout(loop, POLL_MS);
+}
+
+if (liveTable || liveChart) loop();
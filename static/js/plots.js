@@ -4,12 +4,16 @@ import {
 	setFilterOpts,
 	getPlotRequest,
 	getPlotStatusRequestURL,
+	getPlotCancelRequestURL,
 	getPlotURL,
 	getMetadataRequestURL,
 	setFilterRange,
 	fmtTimestamp,
 	updateFilterValues,
 	resetFilterValues,
+	parseFacetInputs,
+	setFacetOpts,
+	resetFacetOpts,
 } from "./utils.js";
 
 // define elements
@@ -24,6 +28,8 @@ const plotDisplayArea = document.getElementById('plot-display-area');
 const genPlotsBtn = document.getElementById('generate-plots-btn');
 const plotTypeCheckboxes = document.querySelectorAll('input[name="plot_type"]');
 
+const binSizeSelect = document.getElementById('bin-size-select');
+
 const customCheckbox = document.getElementById('plot-custom');
 const codeEditorFieldset = document.getElementById('code-editor-controls');
 
@@ -32,6 +38,9 @@ const filterResetBtn = document.getElementById('filter-reset-btn');
 
 let oldSelectedId = selectEl.value;
 
+// plot job currently being polled (and its polling interval)
+let currentJob = { id: null, interval: null };
+
 // ====================== event listeners =======================
 
 document.addEventListener('DOMContentLoaded', () => {
@@ -54,6 +63,7 @@ selectEl.addEventListener('click', () => {
 	if (selectEl.value && selectEl.value !== oldSelectedId) {
 		oldSelectedId = selectEl.value;
 		resetFilterValues();
+		resetFacetOpts();
 		updateFilterOptsValues();
 	}
 	updateOptionsDiv();
@@ -65,6 +75,7 @@ customCheckbox.addEventListener('change', toggleEditor);
 filterApplyBtn.addEventListener('click', filterBtnCallback);
 
 filterResetBtn.addEventListener('click', () => {
+	resetFacetOpts();
 	updateFilterOptsValues();
 	updateFilterValues(true);
 });
@@ -90,6 +101,9 @@ function filterBtnCallback() {
 	}
 
 	setFilterOpts(startDatetime, endDatetime);
+
+	const { level, event } = parseFacetInputs();
+	setFacetOpts(level, event);
 }
 
 function updateOptionsDiv() {
@@ -121,12 +135,15 @@ function generatePlots() {
 		: null;
 
 	// generate the plot request and reset display containers
-	const { endpoint, payload } = getPlotRequest(selectedLogId, plotOpts, customCode);
+	const { endpoint, payload } = getPlotRequest(selectedLogId, plotOpts, customCode, binSizeSelect.value);
 	plotDisplayArea.innerHTML = '';
 	plotDisplayArea.style.display = 'none';
 	loadingMessage.style.display = 'none';
 	errorMessage.style.display = 'none';
 
+	// stop waiting for the previous job, if any
+	cancelCurrentJob();
+
 	// send plot request
 	sendPlotRequest(endpoint, payload);
 }
@@ -138,36 +155,59 @@ async function sendPlotRequest(endpoint, payload) {
 		// ! NOTE: here we try to display whatever the server returns to the user
 		// if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
 		const result = await response.json();
+		if (response.status === 429) return showError(`Server busy: ${result.error}`);
 		if (result.error) return showError(`Error loading data: ${result.error}`);
 
+		// all plots were cached, nothing to wait for
+		if (result.status === 'done') return renderPlots(result.plot_files);
+
 		// poll status
 		loadingMessage.style.display = 'block';
-		pollPlotStatus();
+		pollPlotStatus(result.job_id);
 	} catch (err) {
 		showError(`Error generating plots: ${err.message}`);
 	}
 }
 
-function pollPlotStatus() {
+function pollPlotStatus(jobId) {
 	let attempts = 0;
-	// total = 60 * 500ms = 30s
+	// total = 60 * 500ms = 30s (not counting time spent queued)
 	const maxAttempts = 60;
 
 	const interval = setInterval(async () => {
-		attempts++;
-		// timeout
-		if (attempts >= maxAttempts) {
-			clearInterval(interval);
-			showError("Error requesting job status file! Request timed out.");
-			return;
-		}
-
 		try {
 			// fetch status
-			const response = await fetch(getPlotStatusRequestURL());
+			const response = await fetch(getPlotStatusRequestURL(jobId));
 			if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
 			const result = await response.json();
 
+			// job replaced by a newer one
+			if (currentJob.id !== jobId) {
+				clearInterval(interval);
+				return;
+			}
+
+			if (result.status === 'queued') {
+				loadingMessage.textContent = `Waiting in queue (position ${result.queue_position + 1})...`;
+				return;
+			}
+
+			loadingMessage.textContent = 'Generating plots...';
+
+			// timeout
+			attempts++;
+			if (attempts >= maxAttempts) {
+				cancelCurrentJob();
+				showError("Error requesting job status! Request timed out.");
+				return;
+			}
+
+			if (result.status === 'cancelled') {
+				clearInterval(interval);
+				showError(`Plot job cancelled: ${result.error}`);
+				return;
+			}
+
 			if (result.status == 'error') {
 				// NOTE: in this case, we terminate on error
 				clearInterval(interval);
@@ -183,6 +223,7 @@ function pollPlotStatus() {
 			// if done, render plots
 			if (result.status === 'done') {
 				clearInterval(interval);
+				currentJob = { id: null, interval: null };
 				renderPlots(result.plot_files);
 			}
 		} catch (err) {
@@ -190,6 +231,17 @@ function pollPlotStatus() {
 			showError(`Error fetching plot status: ${err.message}`);
 		}
 	}, 500);
+
+	currentJob = { id: jobId, interval };
+}
+
+// stop polling the current job and ask the server to cancel it
+function cancelCurrentJob() {
+	if (!currentJob.id) return;
+
+	clearInterval(currentJob.interval);
+	fetch(getPlotCancelRequestURL(currentJob.id), { method: 'POST' }).catch(() => { });
+	currentJob = { id: null, interval: null };
 }
 
 function renderPlots(plotFiles) {
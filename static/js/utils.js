@@ -8,6 +8,9 @@ const startTimeEl = document.getElementById('start-time');
 const endDateEl = document.getElementById('end-date');
 const endTimeEl = document.getElementById('end-time');
 
+const levelEl = document.getElementById('level-input');
+const eventEl = document.getElementById('event-input');
+
 // NOTE: endpoint paths are only defined / hardcoded here (?)
 
 // global variables for setting parameters for fetch request
@@ -15,22 +18,45 @@ let sortOpts = "";
 let startDatetimeOpt = ""
 let endDatetimeOpt = ""
 
+// full-text search query over log content (empty for no search)
+let searchOpt = "";
+
+// ','-separated levels and EventIds to keep (empty for all)
+let levelOpt = "";
+let eventOpt = "";
+
 // these are set from unfiltered csv and used for validating filter options
 let minDatetimeOpt = startDatetimeOpt;
 let maxDatetimeOpt = endDatetimeOpt;
 
 // ======================= functions for getting requst endpoints ======================
-function getCSVRequestURL(logId, forDownload = false) {
+function getCSVRequestURL(logId, forDownload = false, offset = null, limit = null) {
 	const endpoint = (forDownload ? '/download_csv/' : '/get_csv/')
 
-	return endpoint + `${logId}?sort=${sortOpts}&filter=${startDatetimeOpt},${endDatetimeOpt}`;
+	let url = endpoint + `${logId}?sort=${sortOpts}&filter=${startDatetimeOpt},${endDatetimeOpt}`;
+
+	if (searchOpt) {
+		url += `&search=${encodeURIComponent(searchOpt)}`;
+	}
+	if (levelOpt) {
+		url += `&level=${encodeURIComponent(levelOpt)}`;
+	}
+	if (eventOpt) {
+		url += `&event=${encodeURIComponent(eventOpt)}`;
+	}
+
+	// request only a page of rows
+	if (offset !== null && limit !== null) {
+		url += `&offset=${offset}&limit=${limit}`;
+	}
+	return url;
 }
 
 function getMetadataRequestURL(logId) {
 	return `/get_metadata/${logId}`;
 }
 
-function getPlotRequest(logId, plotOpts, customCode) {
+function getPlotRequest(logId, plotOpts, customCode, binSize = 'auto') {
 	const endpoint = "/generate_plots/";
 
 	const payload = {
@@ -42,14 +68,30 @@ function getPlotRequest(logId, plotOpts, customCode) {
 			// sending filter options as formatted string
 			// for uniformity in backend code
 			filter_options: `${startDatetimeOpt},${endDatetimeOpt}`,
+			level: levelOpt,
+			event: eventOpt,
 			custom_code: customCode,
+			bin_size: binSize,
 		})
 	};
 	return { endpoint, payload };
 }
 
-function getPlotStatusRequestURL() {
-	return '/status'
+function getPlotStatusRequestURL(jobId) {
+	return `/status/${encodeURIComponent(jobId)}`;
+}
+
+function getPlotCancelRequestURL(jobId) {
+	return `/cancel/${encodeURIComponent(jobId)}`;
+}
+
+// latest rows of the live tail after LineId `since` (at most `limit`)
+function getTailRowsRequestURL(since, limit) {
+	return `/tail/rows?since=${since}&limit=${limit}`;
+}
+
+function getTailEventsRequestURL() {
+	return '/tail/events';
 }
 
 function getPlotURL(plotFile, forDownload = false) {
@@ -150,6 +192,10 @@ function resetSortOpts() {
 	sortOpts = "";
 }
 
+function setSearchOpts(query) {
+	searchOpt = query.trim();
+}
+
 function setFilterRange(start, end) {
 	minDatetimeOpt = start;
 	maxDatetimeOpt = end;
@@ -181,6 +227,26 @@ function resetFilterOpts() {
 	endDatetimeOpt = "";
 }
 
+function parseFacetInputs() {
+	// drop spaces and empty entries, e.g. "error, notice," -> "error,notice"
+	const clean = (value) => value.split(',').map(v => v.trim()).filter(v => v).join(',');
+
+	return { level: clean(levelEl.value), event: clean(eventEl.value) };
+}
+
+function setFacetOpts(level, event) {
+	levelOpt = level;
+	eventOpt = event;
+}
+
+function resetFacetOpts() {
+	levelOpt = "";
+	eventOpt = "";
+
+	levelEl.value = "";
+	eventEl.value = "";
+}
+
 function resetFilterValues() {
 	startDateEl.value = "";
 	startTimeEl.value = "";
@@ -194,13 +260,17 @@ export {
 	getMetadataRequestURL,
 	getPlotRequest,
 	getPlotStatusRequestURL,
+	getPlotCancelRequestURL,
 	getPlotURL,
+	getTailRowsRequestURL,
+	getTailEventsRequestURL,
 	parseDatetimeInputs,
 	validateFilterDates,
 	setFilterOpts,
 	getFilterOpts,
 	setSortOpts,
 	getSortOpts,
+	setSearchOpts,
 	resetSortOpts,
 	resetFilterOpts,
 	fmtTimestamp,
@@ -208,4 +278,7 @@ export {
 	updateFilterValues,
 	resetFilterValues,
 	getDatetimeBoundsFromData,
+	parseFacetInputs,
+	setFacetOpts,
+	resetFacetOpts,
 };